@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+admin_import.py - Import tornei da upload (pannello admin)
+===========================================================
+
+L'upload si divide in due tempi:
+
+1. prepare_upload() - nella richiesta, tutto locale e veloce: salva il
+   file, riconosce il formato (.csv One Piece / .tdf Pokémon), legge data e
+   colonne e costruisce il piano d'import. Un file sbagliato viene
+   rifiutato subito, senza toccare il foglio.
+2. run_import() - nel worker della coda job (jobs.py, un solo thread): le
+   scritture sul foglio di due import non si sovrappongono mai. Le print
+   degli importer finiscono nel log del job e arrivano alla pagina via SSE.
+
+Gli importer girano in modalità non interattiva (overwrite deciso dal form)
+sullo spreadsheet di config.py (SHEET_ID / CREDENTIALS_FILE), lo stesso che
+la cache rilegge dopo l'import; anche il registro import usa quell'ID.
+Un file identico a quello già importato per lo stesso torneo (registro
+import_ledger.py) non viene accodato: plan['unchanged'] è True. Con
+sovrascrittura richiesta il piano va comunque in coda e l'importer
+ricontrolla la colonna ID di Tournaments (torneo cancellato a mano).
+"""
+
+import shutil
+import sys
+import traceback
+import uuid
+from pathlib import Path
+
+from import_ledger import content_hash, noop_message, unchanged
+from jobs import capture_output
+
+UPLOAD_DIR = Path(__file__).resolve().parent / "uploads"  # creata al primo upload
+FORMATS = {'.csv': 'csv', '.tdf': 'tdf'}
+CSV_COLUMNS = ('Ranking', 'User Name', 'Membership Number', 'Win Points', 'OMW %')
+
+
+def _save(filename, data):
+    from werkzeug.utils import secure_filename
+
+    name = secure_filename(filename or '')
+    if not name:
+        raise ValueError("Nome file non valido")
+    folder = UPLOAD_DIR / uuid.uuid4().hex
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / name
+    path.write_bytes(data)
+    return path
+
+
+def _prepare_csv(path, season_id):
+    import pandas as pd
+    from import_tournament import parse_csv_date_universal
+
+    date = parse_csv_date_universal(path.name, strict=True)
+    try:
+        df = pd.read_csv(path)
+    except Exception as e:
+        raise ValueError(f"CSV non leggibile: {e}") from None
+    df.columns = df.columns.str.strip()
+    missing = [c for c in CSV_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Colonne mancanti nel CSV: {', '.join(missing)}")
+    if df.empty:
+        raise ValueError("Il CSV non contiene giocatori")
+    return {
+        'tid': f"{season_id}_{date}",
+        'summary': {'date': date, 'participants': len(df), 'winner': str(df.iloc[0]['User Name'])},
+    }
+
+
+def _prepare_tdf(path, season_id):
+    from parse_pokemon_tdf import parse_tdf
+
+    try:
+        data = parse_tdf(str(path), season_id)
+    except Exception as e:
+        raise ValueError(f"TDF non valido: {e}") from None
+    if not data['results']:
+        raise ValueError("Il TDF non contiene classifiche")
+    tournament = data['tournament']
+    return {
+        'tid': tournament[0],
+        'data': data,
+        'summary': {'date': tournament[2], 'participants': tournament[3], 'winner': tournament[7]},
+    }
+
+
+def prepare_upload(filename, data, season_id, overwrite=False):
+    """
+    Valida e prepara un upload. Solleva ValueError (messaggio per l'utente)
+    se il file non è importabile.
+
+    overwrite: sovrascrittura richiesta -> il registro non basta a scartare
+        un file identico (decide l'importer guardando il foglio)
+
+    Returns:
+        piano d'import: kind, path, season, tid, hash, unchanged, summary
+        (+ data per TDF)
+    """
+    kind = FORMATS.get(Path(filename or '').suffix.lower())
+    if kind is None:
+        raise ValueError("Formato non supportato: carica un .csv (One Piece) o un .tdf (Pokémon)")
+    season_id = str(season_id or '').strip().upper()
+    if not season_id:
+        raise ValueError("Stagione mancante")
+    if not data:
+        raise ValueError("File vuoto")
+
+    path = _save(filename, data)
+    try:
+        plan = _prepare_csv(path, season_id) if kind == 'csv' else _prepare_tdf(path, season_id)
+    except Exception:
+        shutil.rmtree(path.parent, ignore_errors=True)
+        raise
+    digest = content_hash(data)
+    sheet_id = _sheet_id()
+    plan.update(kind=kind, path=str(path), season=season_id, hash=digest,
+                unchanged=not overwrite and unchanged(sheet_id, plan['tid'], digest))
+    if plan['unchanged']:
+        plan['message'] = noop_message(sheet_id, plan['tid'])
+        discard(plan)
+    return plan
+
+
+def discard(plan):
+    """Elimina il file salvato di un piano che non verrà eseguito."""
+    shutil.rmtree(Path(plan['path']).parent, ignore_errors=True)
+
+
+def _sheet_id():
+    from config import SHEET_ID
+    return SHEET_ID
+
+
+def connect():
+    """Lo spreadsheet della webapp (config.py)."""
+    from config import CREDENTIALS_FILE, SHEET_ID
+    from sheets_client import open_spreadsheet
+    return open_spreadsheet(SHEET_ID, CREDENTIALS_FILE)
+
+
+def run_import(job, plan, overwrite=False):
+    """Esegue il piano (nel worker job); le print degli importer vanno in job.log."""
+    try:
+        with capture_output(job):
+            try:
+                sheet = connect()
+                if plan['kind'] == 'csv':
+                    from import_tournament import import_tournament_to_sheet
+                    done = import_tournament_to_sheet(sheet, plan['path'], plan['season'],
+                                                      overwrite=overwrite) is not None
+                else:
+                    from parse_pokemon_tdf import import_to_sheet
+                    done = import_to_sheet(plan['data'], overwrite=overwrite, sheet=sheet)
+            except Exception:
+                traceback.print_exc(file=sys.stdout)
+                raise
+    finally:
+        discard(plan)
+    if not done:
+        raise RuntimeError(f"Import di {plan['tid']} non eseguito (torneo già importato?)")
+    return {'tid': plan['tid'], 'kind': plan['kind'], **plan['summary']}
+
+
+def refresh_caches(job):
+    """Cache classifica + rebuild delle sole stats invalidate dal diff Tournaments."""
+    from cache import cache
+    from stats_rebuild import WORKERS, rebuild
+
+    success, error = cache.fetch_data()
+    if not success:
+        raise RuntimeError(error)
+    scopes = list(cache.invalidated_scopes)
+    report = rebuild(scopes, WORKERS, progress=job.set_progress) if scopes else None
+    return {'message': 'Cache refreshed', 'invalidated': scopes, 'rebuild': report}
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+aggregates.py - Aggregati per torneo, fondibili, per le statistiche
+====================================================================
+
+Le pagine stats di una stagione (e ancor più ALL-<TCG>) venivano ricalcolate
+rileggendo tutte le righe Results dello scope. Qui ogni torneo diventa un
+Aggregate: un riassunto con le sole statistiche sufficienti per il payload
+(somme, somme dei quadrati, conteggi, code ordinate, coppie di giocatori...),
+e due Aggregate si fondono con merge() senza tornare alle righe.
+
+- all'import il torneo salva il suo aggregato (store_event)
+- per ogni scope resta su disco l'aggregato fuso con l'elenco dei tornei;
+  la chiave di un torneo è l'hash delle sue righe nel foglio, già tenuto
+  dallo snapshot (snapshots.read_rows_keyed): capire cosa è cambiato non
+  richiede di decodificare né rihashare lo storico
+- un torneo nuovo costa UN merge; si decodificano solo le sue righe
+- se un torneo già fuso cambia o sparisce (re-import) lo scope si rifonde
+  dagli aggregati per torneo su disco: si decodificano solo i tornei cambiati
+
+Metriche non fondibili direttamente:
+    deviazione std      n, somma, somma dei quadrati
+    trend / rimonta     prima e ultime 3 partecipazioni per data (code ordinate)
+    big stage           punti per dimensione del torneo (istogramma)
+    climber mese        somma ranking per mese
+    climber evento      ranking degli ultimi 2 eventi
+
+Le date sono stringhe ISO (ordinabili come testo, come nel JSON).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from instrumentation import inc_counter
+from records import ResultRecord
+from schema import HEADER_ROWS, decode_rows
+
+AGG_DIR = Path(__file__).resolve().parent / "aggregates"  # creata alla prima scrittura
+AGG_VERSION = 3   # 2: chiavi = hash delle righe nel foglio (snapshots); 3: top8_mixture in ordine di riga
+TAIL = 3
+
+
+def _stdev(vals):
+    n=len(vals)
+    if n<2:
+        return 0.0
+    m=sum(vals)/n
+    return (sum((v-m)**2 for v in vals)/n)**0.5
+
+
+def _pairs(L):
+    out=[]; L=list(L)
+    for i in range(len(L)):
+        for j in range(i+1,len(L)):
+            a,b=L[i],L[j]
+            if a==b: continue
+            if a<b: out.append((a,b))
+            else: out.append((b,a))
+    return out
+
+
+def results_from_grid(grid, header_rows=HEADER_ROWS):
+    """
+    Righe Results (layout foglio) -> (record, eventi).
+
+    Partecipanti di un torneo = max(Points_Ranking + Ranking - 1) sulle sue
+    righe; data = quella del Tournament_ID.
+    """
+    # record compatti (__slots__ + stringhe internate), accesso r["campo"] invariato
+    results=[ResultRecord(
+        r["tid"], r["season_id"], r["membership"], r["name"] or r["membership"],
+        r["rank"], r["win_points"], r["omw"], r["oomw"], r["h2h"],
+        r["pv"], r["pr"], r["pt"], r["date"]
+    ) for r in decode_rows("Results", grid, header_rows)]
+    return results, events_of(results)
+
+
+def events_of(results):
+    """{tid: {date, participants}} dai record Results."""
+    max_field=defaultdict(int); by_date={}
+    for r in results:
+        tid=r["tid"]
+        field=int(max(0, r["pr"]+r["rank"]-1))
+        if field>max_field[tid]:
+            max_field[tid]=field
+        if tid not in by_date:
+            by_date[tid]=r["date"]
+    return {tid:{"date":by_date.get(tid),"participants":p} for tid,p in max_field.items()}
+
+
+def event_key(records):
+    """Hash del contenuto delle righe di un torneo."""
+    payload=json.dumps([r.values() for r in records], default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def event_parts(results, events):
+    """{tid: (record, evento, chiave)} nell'ordine di prima comparsa nel foglio."""
+    by_tid={}
+    for r in results:
+        by_tid.setdefault(r["tid"], []).append(r)
+    return {tid: (recs, events[tid], event_key(recs)) for tid, recs in by_tid.items()}
+
+
+# ============================================
+# AGGREGATE
+# ============================================
+
+def _new_player(name):
+    return {"name": name, "names": {}, "n": 0, "sum": 0.0, "sumsq": 0.0,
+            "top8": 0, "top8_pt": 0.0, "wins": 0, "ninth": 0, "underdog": 0,
+            "first": None, "head": None, "tail": [], "by_size": {}, "months": {}}
+
+
+def _entry_key(entry):
+    return (entry[0], entry[1])   # (data ISO o "", tid)
+
+
+class Aggregate:
+    """Statistiche sufficienti di uno o più tornei (vedi docstring del modulo)."""
+
+    def __init__(self):
+        self.rows=0; self.top8=0
+        self.omw=[0.0, 0]; self.oomw=[0.0, 0]
+        self.events={}      # tid -> date, participants, n, sum, stdev, gap, balanced
+        self.players={}     # membership -> statistiche (ordine di prima comparsa)
+        self.recent=[]      # [data, tid, {membership: rank}] ultimi 2 eventi
+        self.highest=None
+        self.co=Counter(); self.rp=Counter(); self.mix={}
+
+    @classmethod
+    def from_event(cls, records, event):
+        """Aggregato di un singolo torneo (record nell'ordine del foglio)."""
+        agg=cls()
+        if not records:
+            return agg
+        tid=records[0]["tid"]
+        date=event.get("date")
+        date_iso=date.isoformat() if date else None
+        participants=event.get("participants", 0)
+
+        pts=[r["pt"] for r in records]
+        n=len(pts)
+        top8_recs=[r for r in records if r["rank"]<=8]
+        balanced=None
+        if top8_recs:
+            avg_wp=sum(r["win_points"] for r in top8_recs)/len(top8_recs)
+            balanced=sum(1 for r in top8_recs if r["win_points"]>=avg_wp)
+        stdev=gap=None
+        if n>=8:
+            stdev=_stdev(pts)
+            s=sorted(pts, reverse=True); gap=s[0]-s[7]
+        agg.events[tid]={"date": date_iso, "participants": participants, "n": n, "sum": sum(pts),
+                         "stdev": stdev, "gap": gap, "balanced": balanced}
+        agg.recent=[[date_iso or "", tid, {r["membership"]: r.get("rank") or 999 for r in records}]]
+
+        for r in records:
+            agg._add_row(r, tid, date_iso, participants)
+
+        agg.co.update(_pairs(r["membership"] for r in records))
+        agg.rp.update(_pairs(r["membership"] for r in records if r["rank"]<=3))
+        # ordine delle righe, non di un set: a parità di avversari la classifica
+        # top8_mixture segue l'inserimento e deve essere uguale in ogni processo
+        top8=list(dict.fromkeys(r["membership"] for r in top8_recs))
+        for p in top8:
+            agg.mix.setdefault(p, set()).update(m for m in top8 if m!=p)
+        return agg
+
+    def _add_row(self, r, tid, date_iso, participants):
+        m=r["membership"]; pt=r["pt"]; rank=r["rank"]
+        p=self.players.get(m)
+        if p is None:
+            p=self.players[m]=_new_player(r["name"])
+        p["name"]=r["name"]
+        p["names"][r["name"]]=p["names"].get(r["name"], 0)+1
+        p["n"]+=1; p["sum"]+=pt; p["sumsq"]+=pt*pt
+        if rank<=8:
+            p["top8"]+=1; p["top8_pt"]+=pt
+        if rank==1:
+            p["wins"]+=1
+            if participants>=10:
+                p["underdog"]+=1
+        if rank==9:
+            p["ninth"]+=1
+        if date_iso and (p["first"] is None or date_iso<p["first"]):
+            p["first"]=date_iso
+        entry=[date_iso or "", tid, pt, rank]
+        if p["head"] is None or _entry_key(entry)<_entry_key(p["head"]):
+            p["head"]=entry
+        p["tail"]=sorted(p["tail"]+[entry], key=_entry_key)[-TAIL:]
+        size=p["by_size"].setdefault(participants, [0.0, 0])
+        size[0]+=pt; size[1]+=1
+        if date_iso:
+            month=p["months"].setdefault(date_iso[:7], [0, 0])
+            month[0]+=r.get("rank") or 999; month[1]+=1
+
+        self.rows+=1
+        if rank<=8:
+            self.top8+=1
+        if r["omw"] is not None:
+            self.omw[0]+=r["omw"]; self.omw[1]+=1
+        if r["oomw"] is not None:
+            self.oomw[0]+=r["oomw"]; self.oomw[1]+=1
+        if self.highest is None or pt>self.highest["pt"]:
+            self.highest={"membership":m,"name":r["name"],"pt":pt,"tid":tid}
+
+    def merge(self, other):
+        """Fonde `other` (tornei successivi nel foglio) in questo aggregato."""
+        self.rows+=other.rows; self.top8+=other.top8
+        self.omw[0]+=other.omw[0]; self.omw[1]+=other.omw[1]
+        self.oomw[0]+=other.oomw[0]; self.oomw[1]+=other.oomw[1]
+        self.events.update((tid, dict(e)) for tid, e in other.events.items())
+
+        for m, q in other.players.items():
+            p=self.players.get(m)
+            if p is None:
+                p=self.players[m]=_new_player(q["name"])
+            p["name"]=q["name"]
+            for name, c in q["names"].items():
+                p["names"][name]=p["names"].get(name, 0)+c
+            for f in ("n", "sum", "sumsq", "top8", "top8_pt", "wins", "ninth", "underdog"):
+                p[f]+=q[f]
+            if q["first"] and (p["first"] is None or q["first"]<p["first"]):
+                p["first"]=q["first"]
+            if q["head"] and (p["head"] is None or _entry_key(q["head"])<_entry_key(p["head"])):
+                p["head"]=list(q["head"])
+            p["tail"]=sorted(p["tail"]+[list(e) for e in q["tail"]], key=_entry_key)[-TAIL:]
+            for key, (s, c) in q["by_size"].items():
+                size=p["by_size"].setdefault(key, [0.0, 0])
+                size[0]+=s; size[1]+=c
+            for key, (s, c) in q["months"].items():
+                month=p["months"].setdefault(key, [0, 0])
+                month[0]+=s; month[1]+=c
+
+        self.recent=sorted(self.recent+[[d, tid, dict(ranks)] for d, tid, ranks in other.recent],
+                           key=_entry_key)[-2:]
+        if other.highest and (self.highest is None or other.highest["pt"]>self.highest["pt"]):
+            self.highest=dict(other.highest)
+        self.co.update(other.co); self.rp.update(other.rp)
+        for p, s in other.mix.items():
+            self.mix.setdefault(p, set()).update(s)
+        return self
+
+    # ---- serializzazione ----
+
+    def to_json(self):
+        return {
+            "rows": self.rows, "top8": self.top8, "omw": self.omw, "oomw": self.oomw,
+            "events": self.events,
+            "players": {m: dict(p, by_size=[[k, s, c] for k, (s, c) in p["by_size"].items()])
+                        for m, p in self.players.items()},
+            "recent": self.recent, "highest": self.highest,
+            "co": [[a, b, c] for (a, b), c in self.co.items()],
+            "rp": [[a, b, c] for (a, b), c in self.rp.items()],
+            "mix": {p: sorted(s) for p, s in self.mix.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        agg=cls()
+        agg.rows=data["rows"]; agg.top8=data["top8"]
+        agg.omw=data["omw"]; agg.oomw=data["oomw"]
+        agg.events=data["events"]
+        agg.players={m: dict(p, by_size={k: [s, c] for k, s, c in p["by_size"]})
+                     for m, p in data["players"].items()}
+        agg.recent=data["recent"]; agg.highest=data["highest"]
+        agg.co=Counter({(a, b): c for a, b, c in data["co"]})
+        agg.rp=Counter({(a, b): c for a, b, c in data["rp"]})
+        agg.mix={p: set(s) for p, s in data["mix"].items()}
+        return agg
+
+
+def merge_events(parts):
+    """Aggregato di più tornei: parts = iterabile di (record, evento)."""
+    agg=Aggregate()
+    for records, event in parts:
+        agg.merge(Aggregate.from_event(records, event))
+    return agg
+
+
+# ============================================
+# PERSISTENZA
+# ============================================
+
+def _path(kind, name):
+    safe="".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in str(name))
+    return AGG_DIR / kind / f"{safe}.json"
+
+
+def _load(path):
+    try:
+        data=json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    return data if data.get("version")==AGG_VERSION else None
+
+
+def _save(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # tmp univoco: thread web e worker dei job possono salvare lo stesso scope
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dict(data, version=AGG_VERSION), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def store_event(rows, header_rows=0):
+    """
+    Salva l'aggregato dei tornei appena importati (righe Results nel layout
+    del foglio, come scritte dall'importer). Ritorna i tid salvati.
+    """
+    results, events=results_from_grid(rows, header_rows)
+    parts=event_parts(results, events)
+    for tid, (records, event, key) in parts.items():
+        _save(_path("events", tid), {"key": key,
+                                     "aggregate": Aggregate.from_event(records, event).to_json()})
+    return list(parts)
+
+
+def event_aggregate(tid, records, event, raw=None):
+    """
+    Aggregato di un torneo dalle sue righe; riusa quello salvato all'import
+    se il contenuto coincide. Con raw (hash delle righe nel foglio) lo salva
+    per le build successive, che non decodificheranno più il torneo.
+    """
+    key=event_key(records)
+    path=_path("events", tid)
+    stored=_load(path)
+    if stored and stored.get("key")==key:
+        agg=Aggregate.from_json(stored["aggregate"])
+        if raw is None or stored.get("raw")==raw:
+            return agg
+    else:
+        agg=Aggregate.from_event(records, event)
+    if raw is not None:
+        _save(path, {"key": key, "raw": raw, "aggregate": agg.to_json()})
+    return agg
+
+
+def _stored_event(tid, key):
+    """Aggregato salvato del torneo se calcolato dalle righe con questa chiave."""
+    stored=_load(_path("events", tid))
+    return stored if stored and stored.get("raw")==key else None
+
+
+def stale_events(keys):
+    """Tornei (in ordine) senza aggregato salvato per la loro chiave: da decodificare."""
+    return [tid for tid, key in keys.items() if _stored_event(tid, key) is None]
+
+
+def _event_aggregates(tids, keys, load):
+    """
+    Aggregati dei tornei nell'ordine dato: da disco se salvati con la stessa
+    chiave, altrimenti dalle righe (decodificate in blocco, solo quelle).
+    """
+    stored={tid: _stored_event(tid, keys[tid]) for tid in tids}
+    missing=[tid for tid in tids if stored[tid] is None]
+    loaded=load(missing) if missing else {}
+    inc_counter("stats_agg_decoded", len(missing))
+    for tid in tids:
+        if tid in loaded:
+            records, event=loaded[tid]
+            yield event_aggregate(tid, records, event, keys[tid])
+        else:
+            yield Aggregate.from_json(stored[tid]["aggregate"])
+
+
+def scope_aggregate(scope, keys, load):
+    """
+    Aggregato di uno scope.
+
+    Args:
+        keys: {tid: hash delle righe nel foglio} dei tornei dello scope, in
+            ordine di foglio (snapshots.read_rows_keyed)
+        load: load(tids) -> {tid: (record, evento)}, decodifica SOLO le righe
+            dei tornei chiesti
+
+    Riusa l'aggregato salvato: se contiene un sottoinsieme dei tornei con le
+    stesse chiavi fonde solo i nuovi, altrimenti rifonde lo scope dagli
+    aggregati per torneo (decodificando solo i tornei cambiati).
+    """
+    keys=dict(keys)
+    path=_path("scopes", scope)
+    stored=_load(path)
+
+    if stored and all(keys.get(tid)==key for tid, key in stored["keys"].items()):
+        agg=Aggregate.from_json(stored["aggregate"])
+        new=[tid for tid in keys if tid not in stored["keys"]]
+        if not new:
+            return agg
+        for event_agg in _event_aggregates(new, keys, load):
+            agg.merge(event_agg)
+        inc_counter("stats_agg_merge", len(new))
+    else:
+        agg=Aggregate()
+        for event_agg in _event_aggregates(list(keys), keys, load):
+            agg.merge(event_agg)
+        inc_counter("stats_agg_rebuild")
+
+    _save(path, {"keys": keys, "aggregate": agg.to_json()})
+    return agg
+
+
+def event_loader(grid, header_rows=HEADER_ROWS):
+    """
+    load(tids) per scope_aggregate su una griglia Results (layout foglio):
+    decodifica solo le righe dei tornei chiesti.
+    """
+    data=grid[header_rows:]
+
+    def load(tids):
+        wanted=set(tids)
+        results, events=results_from_grid([r for r in data if len(r)>1 and r[1] in wanted], 0)
+        by_tid={}
+        for r in results:
+            by_tid.setdefault(r["tid"], []).append(r)
+        return {tid: (recs, events[tid]) for tid, recs in by_tid.items()}
+    return load
+
+
+def parse_date(value):
+    """Data ISO dell'aggregato -> datetime (None se assente)."""
+    return datetime.fromisoformat(value) if value else None
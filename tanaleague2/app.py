@@ -7,18 +7,32 @@ Patch: support BOTH /classifica/<season_id> and /classifica?season=OP12
 This avoids BuildError when templates call url_for('classifica', season=s.id).
 """
 
-from flask import Flask, render_template, redirect, url_for, jsonify, request
+import hmac
+import json
+import time
+from functools import wraps
+
+from flask import Flask, Response, render_template, redirect, url_for, jsonify, request
 from cache import cache
+import config
 from config import SECRET_KEY, DEBUG
+from schema import decode_rows
 from stats_builder import build_stats  # required for stats routes
+import instrumentation
+from sheets_client import fail_fast_wsgi
 
 
 app = Flask(__name__)
+instrumentation.init_app(app)  # Server-Timing + /metrics
+# richieste web: chiamate a Google fail-fast (cache stale subito), i retry
+# lunghi restano a import e job in background (altri thread)
+app.wsgi_app = fail_fast_wsgi(app.wsgi_app)
 @app.context_processor
 def inject_defaults():
     # evita crash in base.html se il template chiede default_stats_scope
     return {"default_stats_scope": "OP12"}
 app.config['SECRET_KEY'] = SECRET_KEY
+app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # upload tornei (admin)
 
 # ---- Safety net + endpoint di test -----------------------------------------
 @app.context_processor
@@ -32,106 +46,18 @@ def ping():
 # ---------------------------------------------------------------------------
 
 
-# ---------------------- REFRESH ROBUSTO CACHE/STATS ------------------------
-def _normalize_builder_result(res, scope):
+# ---------- Helpers (used only inside /stats for the dropdown) ----------
+def _resolve_scope(scope):
     """
-    Normalizza l'output del build_stats:
-    - se res è un dict con dentro {scope: {...}} ritorna res[scope]
-    - se è già "flat" lo lascia così
-    - riempie i pezzi mancanti con default sicuri (così Jinja non esplode)
+    Scope canonico se è nel registro stagioni (stagioni + ALL-<TCG>), altrimenti None.
+    Controllo solo sulla cache locale: uno scope inventato non costa chiamate a Google.
     """
-    # estrazione del payload della stagione
-    if isinstance(res, dict) and scope in res:
-        payload = res[scope]
-    else:
-        payload = res
-
-    if not isinstance(payload, dict):
-        payload = {}
-
-    def ensure(path_keys, default_value):
-        d = payload
-        for k in path_keys[:-1]:
-            if k not in d or not isinstance(d.get(k), dict):
-                d[k] = {}
-            d = d[k]
-        d.setdefault(path_keys[-1], default_value)
-
-    # default per spotlights
-    ensure(["spotlights"], {})
-    for k in ["mvp", "sharpshooter", "metronome", "phoenix", "big_stage", "closer"]:
-        payload["spotlights"].setdefault(k, [])
-
-    # narrative cards
-    ensure(["spot_narrative"], [])
-
-    # pulse.kpi
-    ensure(["pulse"], {})
-    ensure(["pulse", "kpi"], {})
-    kpi = payload["pulse"]["kpi"]
-    kpi.setdefault("events_total", 0)
-    kpi.setdefault("unique_players", 0)         # o "participants_unique" se preferisci
-    kpi.setdefault("entries_total", 0)
-    kpi.setdefault("avg_participants", 0.0)
-    kpi.setdefault("top8_rate", 0.0)
-    kpi.setdefault("avg_omw", 0.0)
-
-    # pulse.series
-    ensure(["pulse", "series"], {})
-    payload["pulse"]["series"].setdefault("entries_per_event", [])
-    payload["pulse"]["series"].setdefault("avg_points_per_event", [])
-
-    # tales
-    ensure(["tales"], {})
-    for k in ["companions", "podium_rivals", "top8_mixture"]:
-        payload["tales"].setdefault(k, [])
-
-    # hall of fame
-    ensure(["hof"], {})
-    for k in ["highest_single_score", "biggest_crowd", "most_balanced", "most_dominated", "fastest_riser"]:
-        payload["hof"].setdefault(k, None)
-
-    return payload
-
-
-def _do_refresh(scope):
-    try:
-        # il tuo import in alto: from stats_builder import build_stats
-        # Provo prima con lista (alcune versioni vogliono ['OP12']), poi con stringa.
-        try:
-            raw = build_stats([scope])
-        except Exception:
-            raw = build_stats(scope)
-
-        payload = _normalize_builder_result(raw, scope)
-
-        # Se la V2 è presente, salvo in cache; se non c'è, pazienza.
-        try:
-            from tanaleague_v2.services.stats_service import write_stats
-            write_stats(scope, payload)
-        except Exception:
-            pass
-
-        return jsonify({"status": "ok", "scope": scope, "keys": list(payload.keys())})
-    except Exception as e:
-        # NON facciamo più saltare la WSGI: rispondiamo con JSON d'errore
-        return jsonify({"status": "error", "message": str(e)}), 500
-
-
-@app.get("/api/refresh")
-def api_refresh_default():
-    # refresh di cortesia sulla stagione standard
-    return _do_refresh("OP12")
-
-
-@app.get("/api/stats/refresh/<scope>")
-def api_refresh_scope(scope):
-    return _do_refresh(scope.strip().upper())
-# ---------------------------------------------------------------------------
-
-
+    from stats_cache import known_scopes
+    data, err, meta = cache.get_data()
+    seasons = data.get('seasons', []) if data else []
+    scope = str(scope).strip().upper()
+    return scope if scope in known_scopes(seasons) else None
 
-# ---------- Helpers (used only inside /stats for the dropdown) ----------
 def _tcg_code(sid: str) -> str:
     prefix = ''.join(ch for ch in str(sid) if ch.isalpha())
     return prefix.upper()
@@ -210,8 +136,8 @@ def index():
     standings = standings_by_season.get(podio_season_id, [])[:3]
     
     # Stats highlights (from stats season)
-    from stats_cache import get_cached
-    stats_obj = get_cached(stats_season_id, 900)
+    from stats_cache import MAX_AGE, get_cached
+    stats_obj = get_cached(stats_season_id, MAX_AGE)
     if not stats_obj:
         try:
             stats_map = build_stats([stats_season_id])
@@ -292,21 +218,20 @@ def classifica(season_id=None):
             return render_template('error.html', error='Nessuna stagione disponibile'), 500
         return redirect(url_for('classifica', season_id=season_id))
 
-    standings = standings_by_season.get(season_id, []) or []
-
-    # Self-healing: if standings empty, try one fetch_data() and retry once
-    if len(standings) == 0:
-        success, error = cache.fetch_data()
-        if success:
-            data, err, meta = cache.get_data()
-            standings_by_season = data.get('standings_by_season', {})
-            tournaments_by_season = data.get('tournaments_by_season', {})
-            standings = standings_by_season.get(season_id, []) or []
-
     season_meta = next((s for s in seasons if s.get('id') == season_id), None)
     if not season_meta:
         return render_template('error.html', error='Stagione non trovata'), 404
 
+    standings = standings_by_season.get(season_id, []) or []
+
+    # Self-healing: classifica vuota -> al massimo un refresh per versione cache
+    # (stagione nuova senza risultati o crawler su stagioni vecchie: niente reload a ogni visita)
+    if len(standings) == 0 and cache.heal_empty_season(season_id):
+        data, err, meta = cache.get_data()
+        standings_by_season = data.get('standings_by_season', {})
+        tournaments_by_season = data.get('tournaments_by_season', {})
+        standings = standings_by_season.get(season_id, []) or []
+
     # Provide alias 'all_seasons' for template backward-compatibility
     all_seasons = seasons
 
@@ -329,11 +254,16 @@ def stats(scope):
     Stats per stagione (es. OP12) o all-time per TCG (es. ALL-OP).
     Usa cache file-based per rapidità.
     """
-    from stats_cache import get_cached, set_cached
+    from stats_cache import MAX_AGE, get_cached, set_cached
 
     data, err, meta = cache.get_data()
     if not data:
         return render_template('error.html', error=err or 'Cache non disponibile'), 500
+    known = _resolve_scope(scope)
+    if known is None:
+        return render_template('error.html', error='Scope non valido o nessun dato'), 404
+    if known != scope:
+        return redirect(url_for('stats', scope=known))
 
     seasons = data.get('seasons', [])
 
@@ -358,15 +288,22 @@ def stats(scope):
     else:
         available_scopes = others_sorted + all_time
 
-    # File-based cache (15 min TTL)
-    MAX_AGE = 900
+    # File-based cache: invalidata dai diff degli snapshot (solo stagioni toccate),
+    # MAX_AGE solo come rete di sicurezza
     stats_obj = get_cached(scope, MAX_AGE)
     if stats_obj is None:
-        stats_map = build_stats([scope])
-        stats_obj = stats_map.get(scope)
-        if not stats_obj:
-            return render_template('error.html', error='Scope non valido o nessun dato'), 404
-        set_cached(scope, stats_obj)
+        try:
+            stats_map = build_stats([scope])
+        except Exception as e:
+            # Sheets irraggiungibile: meglio l'ultima versione buona, anche se scaduta
+            stats_obj = get_cached(scope, float('inf'))
+            if stats_obj is None:
+                return render_template('error.html', error=str(e)), 503
+        else:
+            stats_obj = stats_map.get(scope)
+            if not stats_obj:
+                return render_template('error.html', error='Scope non valido o nessun dato'), 404
+            set_cached(scope, stats_obj)
 
     return render_template(
         'stats.html',
@@ -377,29 +314,167 @@ def stats(scope):
     )
 
 # ---------- APIs ----------
+# I refresh girano nella coda di job (jobs.py): la richiesta risponde subito
+# 202 con l'id del job, lo stato si segue su /api/jobs/<id>.
+
+def _accepted(job):
+    status_url = url_for('api_job', job_id=job.id)
+    return jsonify({'status': job.status, 'job_id': job.id, 'status_url': status_url}), 202, {'Location': status_url}
+
+def _job_refresh(job):
+    """Cache classifica + rebuild delle sole stats invalidate (vedi admin_import.refresh_caches)."""
+    from admin_import import refresh_caches
+    return refresh_caches(job)
+
+def _job_stats_refresh(job, scope):
+    from stats_cache import clear
+    from stats_rebuild import rebuild
+    cleared = clear(scope)
+    report = rebuild([scope], 1, progress=job.set_progress)
+    if report['errors']:
+        raise RuntimeError(report['errors'][scope])
+    return {'cleared': cleared, 'scope': scope, **report}
+
+def _job_stats_rebuild(job, scopes, workers):
+    from stats_rebuild import rebuild
+    return rebuild(scopes, workers, progress=job.set_progress)
+
 @app.route('/api/refresh')
 def api_refresh():
-    """Refresh della cache classifica (quella originale)."""
-    success, error = cache.fetch_data()
-    if success:
-        return jsonify({'status': 'ok', 'message': 'Cache refreshed'})
-    else:
-        return jsonify({'status': 'error', 'message': error}), 500
+    """Refresh della cache classifica (e delle stats delle stagioni cambiate)."""
+    from jobs import jobs
+    return _accepted(jobs.submit('refresh', None, _job_refresh))
 
 @app.route('/api/stats/refresh/<scope>')
 def api_stats_refresh(scope):
     """Invalidates and rebuilds stats cache for a scope."""
-    from stats_cache import clear, set_cached
+    from jobs import jobs
+    scope = _resolve_scope(scope)
+    if scope is None:
+        return jsonify({'status':'error','message':'Scope sconosciuto'}), 404
+    return _accepted(jobs.submit('stats', scope, _job_stats_refresh, scope))
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    """Stato, avanzamento e tempi di un job di refresh."""
+    from jobs import jobs
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'status':'error','message':'Job sconosciuto'}), 404
+    return jsonify(job.to_dict())
+
+# ---------- Admin: upload tornei ----------
+# Basic auth con ADMIN_USER / ADMIN_PASS di config.py. Il file viene validato
+# nella richiesta (admin_import.prepare_upload), le scritture sul foglio
+# vanno nella coda job: due import non si sovrappongono mai.
+
+_ADMIN_PLACEHOLDER = "cambia_questa_password_con_una_sicura"
+
+def _admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user = getattr(config, 'ADMIN_USER', '') or ''
+        password = getattr(config, 'ADMIN_PASS', '') or ''
+        if not user or not password or password == _ADMIN_PLACEHOLDER:
+            return render_template('error.html', error='Area admin non configurata (ADMIN_USER/ADMIN_PASS)'), 403
+        auth = request.authorization
+        if (auth is None
+                or not hmac.compare_digest((auth.username or '').encode(), user.encode())
+                or not hmac.compare_digest((auth.password or '').encode(), password.encode())):
+            return Response('Autenticazione richiesta', 401,
+                            {'WWW-Authenticate': 'Basic realm="TanaLeague admin"'})
+        return view(*args, **kwargs)
+    return wrapper
+
+def _job_import(job, plan, overwrite):
+    """Import in coda + refresh della cache (e delle stats della stagione)."""
+    from admin_import import run_import
+    job.set_progress(0, 2, 'import')
+    result = run_import(job, plan, overwrite)
+    job.set_progress(1, 2, 'refresh')
+    result['refresh'] = _job_refresh(job)
+    job.set_progress(2, 2, 'done')
+    return result
+
+@app.route('/admin/import', methods=['GET', 'POST'])
+@_admin_required
+def admin_import():
+    """Upload CSV (One Piece) / TDF (Pokémon): validazione subito, scrittura in background."""
+    if request.method == 'GET':
+        data, err, meta = cache.get_data()
+        seasons = [s for s in (data.get('seasons', []) if data else []) if s.get('id')]
+        seasons.sort(key=lambda s: (s.get('status', '').upper() != 'ACTIVE', _season_key_desc(s.get('id'))))
+        return render_template('admin_import.html', seasons=seasons)
+
+    from admin_import import prepare_upload
+    from jobs import jobs
+    upload = request.files.get('file')
+    season = _resolve_scope(request.form.get('season', ''))
+    if season is None or season.startswith('ALL-'):
+        return jsonify({'status':'error','message':'Stagione sconosciuta'}), 400
+    if upload is None:
+        return jsonify({'status':'error','message':'Nessun file caricato'}), 400
+    overwrite = request.form.get('overwrite') == '1'
     try:
-        cleared = clear(scope)
-        stats_map = build_stats([scope])
-        stats_obj = stats_map.get(scope)
-        if not stats_obj:
-            return jsonify({'status':'error','message':'Scope non valido o nessun dato'}), 404
-        set_cached(scope, stats_obj)
-        return jsonify({'status':'ok','cleared': cleared, 'scope': scope})
-    except Exception as e:
-        return jsonify({'status':'error','message': str(e)}), 500
+        plan = prepare_upload(upload.filename, upload.read(), season, overwrite)
+    except ValueError as e:
+        return jsonify({'status':'error','message': str(e)}), 400
+    if plan['unchanged']:
+        # stesso file già importato per questo torneo: niente da accodare
+        return jsonify({'status':'unchanged', 'tid': plan['tid'], 'summary': plan['summary'],
+                        'message': plan['message']}), 200
+    job = jobs.submit('import', f"{plan['tid']}:{plan['hash'][:12]}", _job_import, plan, overwrite)
+    status_url = url_for('api_job', job_id=job.id)
+    return jsonify({'status': job.status, 'job_id': job.id, 'tid': plan['tid'], 'summary': plan['summary'],
+                    'status_url': status_url,
+                    'events_url': url_for('admin_job_events', job_id=job.id)}), 202, {'Location': status_url}
+
+@app.route('/api/stats/rebuild', methods=['POST'])
+@_admin_required
+def api_stats_rebuild():
+    """Rebuild parallelo (stats_rebuild.py) di più scope: scopes=OP12,ALL-OP (default tutti)."""
+    from jobs import jobs
+    from stats_rebuild import MAX_WORKERS, WORKERS
+    scopes = None
+    if request.values.get('scopes'):
+        scopes = [_resolve_scope(s) for s in request.values['scopes'].split(',') if s.strip()]
+        if None in scopes:
+            return jsonify({'status':'error','message':'Scope sconosciuto'}), 404
+        scopes = sorted(set(scopes))
+    # processi lanciati dal web: mai più di STATS_REBUILD_MAX_WORKERS
+    workers = request.values.get('workers', WORKERS, type=int) or MAX_WORKERS
+    workers = max(1, min(workers, MAX_WORKERS))
+    key = ','.join(scopes) if scopes else '*'
+    return _accepted(jobs.submit('rebuild', key, _job_stats_rebuild, scopes, workers))
+
+@app.route('/admin/jobs/<job_id>/events')
+@_admin_required
+def admin_job_events(job_id):
+    """Server-Sent Events: righe di log e stato del job fino alla fine."""
+    from jobs import DONE, ERROR, jobs
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'status':'error','message':'Job sconosciuto'}), 404
+
+    def stream():
+        sent = 0
+        last = None
+        while True:
+            lines = job.log[sent:]
+            sent += len(lines)
+            for line in lines:
+                yield f"event: log\ndata: {json.dumps(line, ensure_ascii=False)}\n\n"
+            state = job.to_dict()
+            snapshot = (state['status'], json.dumps(state['progress']))
+            if snapshot != last:
+                last = snapshot
+                yield f"event: status\ndata: {json.dumps(state, ensure_ascii=False, default=str)}\n\n"
+            if state['status'] in (DONE, ERROR) and sent >= len(job.log):
+                break
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # ---------- Player Profile ----------
 @app.route('/players')
@@ -409,18 +484,10 @@ def players_list():
     try:
         sheet = cache.connect_sheet()
         ws_players = sheet.worksheet("Players")
-        all_players = ws_players.get_all_values()[3:]
-        
-        players = []
-        for row in all_players:
-            if row and row[0]:
-                players.append({
-                    'membership': row[0],
-                    'name': row[1],
-                    'tournaments': int(row[4]) if len(row) > 4 and row[4] else 0,
-                    'wins': int(row[5]) if len(row) > 5 and row[5] else 0,
-                    'points': float(row[7]) if len(row) > 7 and row[7] else 0
-                })
+        players = [
+            {k: p[k] for k in ('membership', 'name', 'tournaments', 'wins', 'points')}
+            for p in decode_rows("Players", ws_players.get_all_values())
+        ]
         
         # Ordina per punti totali DESC
         players.sort(key=lambda x: x['points'], reverse=True)
@@ -441,28 +508,29 @@ def player(membership):
     try:
         sheet = cache.connect_sheet()
         ws_results = sheet.worksheet("Results")
-        all_results = ws_results.get_all_values()[3:]
+        all_results = decode_rows("Results", ws_results.get_all_values())
         
         # Filtra per membership
-        player_results = [r for r in all_results if r and len(r) >= 10 and r[2] == membership]
+        membership = membership.strip().zfill(10)
+        player_results = [r for r in all_results if r['membership'] == membership]
         
         if not player_results:
             return render_template('error.html', error='Giocatore non trovato'), 404
         
         # Dati base
-        player_name = player_results[0][9] if player_results[0][9] else membership
+        player_name = player_results[0]['name'] or membership
         
         # Calcoli
         tournaments_played = len(player_results)
-        tournament_wins = sum(1 for r in player_results if r[3] and int(r[3]) == 1)
-        top8_count = sum(1 for r in player_results if r[3] and int(r[3]) <= 8)
+        tournament_wins = sum(1 for r in player_results if r['rank'] == 1)
+        top8_count = sum(1 for r in player_results if r['rank'] <= 8)
         
-        points = [float(r[8]) for r in player_results if r[8]]
+        points = [r['pt'] for r in player_results]
         avg_points = sum(points) / len(points) if points else 0
-        best_rank = min([int(r[3]) for r in player_results if r[3]], default=999)
+        best_rank = min([r['rank'] for r in player_results], default=999)
         
         # Win Rate (assumendo 4 round medi)
-        total_wins = sum([float(r[4])/3 for r in player_results if r[4]])
+        total_wins = sum([r['win_points'] / 3 for r in player_results])
         win_rate = (total_wins / (tournaments_played * 4) * 100) if tournaments_played > 0 else 0
         
         # Top8 Rate
@@ -477,18 +545,18 @@ def player(membership):
             trend = 0
         
         # First seen
-        dates = [r[1].split('_')[1] if '_' in r[1] else '' for r in player_results if r[1]]
+        dates = [r['tid'].split('_')[1] if '_' in r['tid'] else '' for r in player_results]
         first_seen = min(dates) if dates else 'N/A'
         
         # Storico tornei (ultimi 10)
         history = []
         for r in player_results[-10:]:
             history.append({
-                'date': r[1].split('_')[1] if '_' in r[1] else '',
-                'season': r[1].split('_')[0] if '_' in r[1] else '',
-                'rank': int(r[3]) if r[3] else 999,
-                'points': float(r[8]) if r[8] else 0,
-                'record': f"{int(float(r[4])/3) if r[4] else 0}-{int(float(r[3] or 0))}" if r[3] and r[4] else 'N/A'
+                'date': r['tid'].split('_')[1] if '_' in r['tid'] else '',
+                'season': r['season_id'] if '_' in r['tid'] else '',
+                'rank': r['rank'],
+                'points': r['pt'],
+                'record': f"{int(r['win_points'] / 3)}-{r['rank']}" if r['rank'] != 999 else 'N/A'
             })
         history.reverse()
         
@@ -2,64 +2,207 @@
 """
 TanaLeague - Cache Manager
 ===========================
-Legge Google Sheet ogni N minuti e mantiene cache locale
+Legge Google Sheet ogni N minuti e mantiene cache locale.
+
+Allo scadere dei N minuti prima si chiede a Drive la data di ultima modifica
+del file (1 chiamata leggera): se il foglio non è cambiato si allunga la
+validità della cache senza rileggere nessun worksheet.
 """
 
-import gspread
-from google.oauth2.service_account import Credentials
 import json
 import os
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
 from config import SHEET_ID, CREDENTIALS_FILE, CACHE_REFRESH_MINUTES, CACHE_FILE
+from instrumentation import timed
+from records import STANDING_FIELDS, StandingRecord
+from schema import decode_rows
+from sheets_client import modified_time, open_spreadsheet, sheets_available
+from snapshots import read_rows_diff
+from stats_cache import invalidate_tids
+
+# stagione senza classifica: al massimo un refresh forzato ogni N secondi
+SELF_HEAL_MIN_INTERVAL = 300
+
+# ============================================
+# FORMATO FILE (schema v3)
+# ============================================
+# Su disco ogni dataset è una tabella {columns, rows}: niente chiavi ripetute
+# per riga, niente alias duplicati, JSON compatto. In memoria l'app continua
+# a vedere liste di dict; 'standings' e 'tournaments' sono alias (stessi
+# oggetti) di standings_by_season / tournaments_by_season.
+# I file v2 (dict per riga + alias) vengono convertiti al primo caricamento.
+
+SCHEMA_VERSION = 3
+SEASON_COLUMNS = ['id', 'tcg', 'name', 'status', 'next_tournament']
+STANDING_COLUMNS = list(STANDING_FIELDS)
+TOURNAMENT_COLUMNS = ['id', 'date', 'participants', 'winner']
+
+
+def _to_table(items, columns):
+    return {'columns': columns, 'rows': [[it.get(c) for c in columns] for it in items]}
+
+
+def _from_table(table):
+    columns = table['columns']
+    return [dict(zip(columns, row)) for row in table['rows']]
+
+
+def _grouped_to_table(groups, columns):
+    return {'columns': columns,
+            'rows': {key: [[it.get(c) for c in columns] for it in items] for key, items in groups.items()}}
+
+
+def _grouped_from_table(table, record=None):
+    columns = table['columns']
+    if record is not None:
+        return {key: [record.from_values(columns, row) for row in rows] for key, rows in table['rows'].items()}
+    return {key: [dict(zip(columns, row)) for row in rows] for key, rows in table['rows'].items()}
+
+
+def _with_aliases(seasons, standings_by_season, tournaments_by_season):
+    """cache_data in memoria, con gli alias legacy come viste (stessi oggetti)."""
+    return {
+        'schema_version': SCHEMA_VERSION,
+        'seasons': seasons,
+        'standings_by_season': standings_by_season,
+        'tournaments_by_season': tournaments_by_season,
+        # legacy aliases (back-compat)
+        'standings': standings_by_season,
+        'tournaments': tournaments_by_season,
+    }
+
+
+def encode_cache_data(cache_data):
+    """cache_data in memoria -> dict v3 da salvare."""
+    return {
+        'seasons': _to_table(cache_data.get('seasons', []), SEASON_COLUMNS),
+        'standings_by_season': _grouped_to_table(cache_data.get('standings_by_season', {}), STANDING_COLUMNS),
+        'tournaments_by_season': _grouped_to_table(cache_data.get('tournaments_by_season', {}), TOURNAMENT_COLUMNS),
+    }
+
+
+def decode_cache_data(payload, schema_version):
+    """Dati del file (v2 o v3) -> cache_data in memoria."""
+    if schema_version >= 3:
+        return _with_aliases(_from_table(payload['seasons']),
+                             _grouped_from_table(payload['standings_by_season'], StandingRecord),
+                             _grouped_from_table(payload['tournaments_by_season']))
+    # v2: dict per riga, alias salvati come copie separate
+    standings = payload.get('standings_by_season') or payload.get('standings', {})
+    return _with_aliases(payload.get('seasons', []),
+                         {sid: [StandingRecord.from_values(p.keys(), p.values()) for p in rows]
+                          for sid, rows in standings.items()},
+                         payload.get('tournaments_by_season') or payload.get('tournaments', {}))
 
-SCOPES = [
-    'https://www.googleapis.com/auth/spreadsheets',
-    'https://www.googleapis.com/auth/drive'
-]
 
 class SheetCache:
     def __init__(self):
         self.cache_data = None
         self.last_update = None
-        self.load_from_file()
+        self.modified_time = None   # modifiedTime Drive del foglio alla lettura
+        self.version = 0            # +1 a ogni lettura completa riuscita
+        self.invalidated_scopes = []  # scope stats scartati dall'ultima lettura (diff Tournaments)
+        self._file_mtime = None       # mtime di CACHE_FILE all'ultima lettura/scrittura nostra
+        # stagioni già viste vuote in questa versione (negative cache)
+        self._empty_seen = set()
+        self._empty_version = 0
+        self._last_heal = 0.0
+        self._heal_lock = threading.Lock()
+        # il file viene letto alla prima richiesta, non all'import (avvio worker)
+        self._loaded = False
+    
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load_from_file()
+        elif self._file_changed():
+            # riscritto da un altro processo (watch_imports.py, altro worker web)
+            self.load_from_file()
+            self.version += 1
+
+    def _file_changed(self):
+        try:
+            return os.stat(CACHE_FILE).st_mtime_ns != self._file_mtime
+        except OSError:
+            return False
     
+    @timed("cache.load_file")
     def load_from_file(self):
         """Carica cache da file se esiste"""
+        self._loaded = True
         if os.path.exists(CACHE_FILE):
             try:
+                self._file_mtime = os.stat(CACHE_FILE).st_mtime_ns
                 with open(CACHE_FILE, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    self.cache_data = data.get('data')
-                    self.last_update = datetime.fromisoformat(data.get('timestamp'))
+                version = data.get('schema_version') or (data.get('data') or {}).get('schema_version', 2)
+                self.cache_data = decode_cache_data(data.get('data') or {}, version)
+                self.last_update = datetime.fromisoformat(data.get('timestamp'))
+                self.modified_time = data.get('modified_time')
+                if version < SCHEMA_VERSION:
+                    self.save_to_file()  # migrazione automatica v2 -> v3
             except:
                 pass
     
     def save_to_file(self):
-        """Salva cache su file"""
+        """Salva cache su file (schema v3, scrittura atomica)"""
         data = {
+            'schema_version': SCHEMA_VERSION,
             'timestamp': self.last_update.isoformat(),
-            'data': self.cache_data
+            'modified_time': self.modified_time,
+            'data': encode_cache_data(self.cache_data)
         }
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # tmp univoco nella stessa cartella: web e watch_imports.py possono
+        # salvare insieme, ognuno rimpiazza il file con un JSON completo
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(CACHE_FILE)),
+                                   prefix=".cache_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp, CACHE_FILE)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._file_mtime = os.stat(CACHE_FILE).st_mtime_ns
+    
+    def seasons(self):
+        """Registro stagioni della cache locale (nessuna lettura dal foglio)."""
+        self._ensure_loaded()
+        return (self.cache_data or {}).get('seasons', [])
     
     def needs_refresh(self):
         """Controlla se cache deve essere refreshata"""
+        self._ensure_loaded()
         if not self.cache_data or not self.last_update:
             return True
         age = datetime.now() - self.last_update
         return age > timedelta(minutes=CACHE_REFRESH_MINUTES)
     
     def connect_sheet(self):
-        """Connette a Google Sheet"""
-        creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
-        client = gspread.authorize(creds)
-        return client.open_by_key(SHEET_ID)
+        """Connette a Google Sheet (client e handle condivisi, vedi sheets_client)"""
+        return open_spreadsheet(SHEET_ID, CREDENTIALS_FILE)
     
+    def unchanged_since_fetch(self):
+        """True se il foglio non è stato modificato dall'ultima lettura (probe Drive)."""
+        if not self.cache_data or not self.modified_time:
+            return False
+        try:
+            return modified_time(self.connect_sheet()) == self.modified_time
+        except Exception:
+            return False
+    
+    @timed("sheets.fetch_data")
     def fetch_data(self):
         """Legge dati da Google Sheet"""
         try:
             sheet = self.connect_sheet()
+            # letto PRIMA dei dati: una modifica durante la lettura forza il prossimo refresh
+            sheet_modified = modified_time(sheet)
             
             # Leggi Config per lista stagioni
             ws_config = sheet.worksheet("Config")
@@ -75,36 +218,27 @@ class SheetCache:
                         'next_tournament': row[11] if len(row) > 11 and row[11] else None
                     })
             
-            # Leggi Seasonal_Standings per ogni stagione
-            
-            # Leggi Standings PROV e FINAL (se esistono)
-            standings_by_season = { }
+            # Leggi Standings PROV e FINAL (se esistono), già tipizzate (schema.py)
             prov_rows = []
             final_rows = []
             try:
                 ws_prov = sheet.worksheet("Seasonal_Standings_PROV")
-                prov_rows = ws_prov.get_all_values()[3:]  # Skip header
+                prov_rows = decode_rows("Seasonal_Standings_PROV", ws_prov.get_all_values())
             except Exception:
                 prov_rows = []
             try:
                 ws_final = sheet.worksheet("Seasonal_Standings_FINAL")
-                final_rows = ws_final.get_all_values()[3:]
+                final_rows = decode_rows("Seasonal_Standings_FINAL", ws_final.get_all_values())
             except Exception:
                 final_rows = []
 
             # Crea mappe per season_id
             prov_map = {}
-            for row in prov_rows:
-                if not row or not row[0]:
-                    continue
-                sid = row[0]
-                prov_map.setdefault(sid, []).append(row)
+            for rec in prov_rows:
+                prov_map.setdefault(rec['season_id'], []).append(rec)
             final_map = {}
-            for row in final_rows:
-                if not row or not row[0]:
-                    continue
-                sid = row[0]
-                final_map.setdefault(sid, []).append(row)
+            for rec in final_rows:
+                final_map.setdefault(rec['season_id'], []).append(rec)
 
             # Scegli sheet giusto in base allo status stagione
             standings_by_season = {}
@@ -117,50 +251,27 @@ class SheetCache:
                     rows = final_map.get(sid, []) or prov_map.get(sid, [])
                 if status != 'CLOSED' and not rows:
                     rows = prov_map.get(sid, []) or final_map.get(sid, [])
-                standings_by_season[sid] = []
-                for row in rows:
-                    standings_by_season[sid].append({
-                        'position': row[10] if len(row) > 10 else '',
-                        'membership': row[1],
-                        'name': row[2],
-                        'points': float(row[3]) if row[3] else 0,
-                        'tournaments_played': int(row[4]) if row[4] else 0,
-                        'tournaments_counted': int(row[5]) if row[5] else 0,
-                        'total_wins': int(row[6]) if row[6] else 0,
-                        'match_wins': int(row[7]) if row[7] else 0,
-                        'best_rank': int(row[8]) if row[8] else 999,
-                        'top8_count': int(row[9]) if row[9] else 0
-                    })
-            # Leggi Tournaments 
+                standings_by_season[sid] = [StandingRecord(*(rec[c] for c in STANDING_FIELDS)) for rec in rows]
+                # gli import incrementali appendono i nuovi giocatori in fondo:
+                # l'ordine giusto è quello della colonna Posizione
+                standings_by_season[sid].sort(key=lambda p: p['position'] if p['position'] is not None else 10**6)
             # Leggi Tournaments per metadata
-            ws_tournaments = sheet.worksheet("Tournaments")
-            tournaments_data = ws_tournaments.get_all_values()[3:]
+            # (append-only: si leggono solo le righe nuove, vedi snapshots.py)
+            grid, diff = read_rows_diff(sheet, "Tournaments", "H", key_col=0)
+            tournaments_data = decode_rows("Tournaments", grid)
+            # tornei aggiunti/modificati/rimossi: si scartano solo le stats delle stagioni toccate
+            self.invalidated_scopes = invalidate_tids(diff)
             
             tournaments_by_season = {}
-            for row in tournaments_data:
-                if not row or not row[0]:
-                    continue
-                season_id = row[1]
-                if season_id not in tournaments_by_season:
-                    tournaments_by_season[season_id] = []
-                
-                tournaments_by_season[season_id].append({
-                    'id': row[0],
-                    'date': row[2],
-                    'participants': int(row[3]) if row[3] else 0,
-                    'winner': row[7] if len(row) > 7 else ''
-                })
+            for rec in tournaments_data:
+                tournaments_by_season.setdefault(rec['season_id'], []).append(
+                    {c: rec[c] for c in TOURNAMENT_COLUMNS})
             
-            self.cache_data = {
-            'schema_version': 2,
-            'seasons': seasons,
-            'standings_by_season': standings_by_season,
-            'tournaments_by_season': tournaments_by_season,
-            # legacy aliases (back-compat)
-            'standings': standings_by_season,
-            'tournaments': tournaments_by_season
-        }
+            self.cache_data = _with_aliases(seasons, standings_by_season, tournaments_by_season)
             self.last_update = datetime.now()
+            self.modified_time = sheet_modified
+            self.version += 1
+            self._loaded = True
             self.save_to_file()
             
             return True, None
@@ -168,13 +279,46 @@ class SheetCache:
         except Exception as e:
             return False, str(e)
     
+    def heal_empty_season(self, season_id):
+        """
+        Classifica vuota per una stagione nota: rilegge il foglio al massimo
+        UNA volta per versione della cache e comunque non più spesso di
+        SELF_HEAL_MIN_INTERVAL. Le richieste successive costano O(1).
+
+        Returns:
+            True se ha riletto il foglio con successo
+        """
+        with self._heal_lock:
+            if self._empty_version != self.version:
+                self._empty_seen = set()
+                self._empty_version = self.version
+            if season_id in self._empty_seen:
+                return False
+            self._empty_seen.add(season_id)
+            now = time.monotonic()
+            if now - self._last_heal < SELF_HEAL_MIN_INTERVAL or not sheets_available():
+                return False
+            self._last_heal = now
+        success, _ = self.fetch_data()
+        return success
+    
     def get_data(self):
         """Ottieni dati (con refresh automatico se necessario)"""
         if self.needs_refresh():
-            success, error = self.fetch_data()
-            if not success and not self.cache_data:
-                # Primo caricamento fallito e no cache
-                return None, error, None
+            if not sheets_available():
+                # circuit breaker aperto: si serve subito l'ultima cache buona (stale)
+                if not self.cache_data:
+                    return None, "Google Sheets non raggiungibile", None
+            elif self.unchanged_since_fetch():
+                # foglio identico: la cache resta valida per altri N minuti.
+                # Solo in memoria: il file si riscrive quando cambiano i dati
+                # (ogni worker fa al più un probe per intervallo)
+                self.last_update = datetime.now()
+            else:
+                success, error = self.fetch_data()
+                if not success and not self.cache_data:
+                    # Primo caricamento fallito e no cache
+                    return None, error, None
         
         age_minutes = int((datetime.now() - self.last_update).total_seconds() / 60) if self.last_update else 999
         is_stale = age_minutes > CACHE_REFRESH_MINUTES
@@ -27,7 +27,8 @@ CREDENTIALS_FILE = os.getenv("PULCI_SA_CREDENTIALS") or (
 # ==================
 # ADMIN LOGIN
 # ==================
-# Credenziali per accesso admin (se implementato)
+# Credenziali per /admin/import (upload tornei); con la password
+# di esempio il pannello resta disabilitato
 # IMPORTANTE: Usa una password FORTE e UNICA!
 ADMIN_USER = "tuo_username"
 ADMIN_PASS = "cambia_questa_password_con_una_sicura"
@@ -51,3 +52,63 @@ SECRET_KEY = "genera-una-chiave-casuale-qui"
 
 # Debug mode (metti False in produzione su PythonAnywhere!)
 DEBUG = False
+
+# ==================
+# METRICHE
+# ==================
+# True = header Server-Timing + istogrammi latenza esposti su /metrics
+METRICS_ENABLED = False
+
+# ==================
+# GOOGLE SHEETS API
+# ==================
+# Quota per minuto (Google: 60 letture + 60 scritture per utente).
+# Oltre il limite le chiamate ASPETTANO invece di fallire con 429.
+SHEETS_READS_PER_MINUTE = 60
+SHEETS_WRITES_PER_MINUTE = 60
+
+# Tentativi su 429 / 5xx / errori di rete (backoff esponenziale)
+SHEETS_MAX_RETRIES = 6
+
+# Timeout HTTP verso Google (secondi)
+SHEETS_TIMEOUT = 20
+
+# Richieste web: niente retry, timeout breve e al massimo WAIT secondi di
+# attesa quota; se Google non risponde la pagina usa subito la cache stale.
+# Retry/backoff/timeout sopra valgono per import e job in background.
+SHEETS_WEB_TIMEOUT = 5
+SHEETS_WEB_MAX_WAIT = 0
+
+# Circuit breaker: dopo N errori di rete/5xx di fila si smette di chiamare
+# Google per COOLDOWN secondi (raddoppia a ogni prova fallita, fino a MAX)
+# e il sito serve l'ultima cache buona.
+SHEETS_BREAKER_FAILURES = 5
+SHEETS_BREAKER_COOLDOWN = 30
+SHEETS_BREAKER_MAX_COOLDOWN = 600
+
+# ==================
+# STATS CACHE
+# ==================
+# Limite file/dimensione della cartella stats_cache (si eliminano i meno usati)
+STATS_CACHE_MAX_FILES = 64
+STATS_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Età massima di una pagina stats in cache (secondi). Le stats vengono già
+# invalidate quando un torneo della stagione cambia: questo è solo un limite
+STATS_CACHE_MAX_AGE = 6 * 3600
+# Processi per il rebuild parallelo (stats_rebuild.py, /api/stats/rebuild).
+# None = uno per CPU; 1 = tutto nel processo corrente (consigliato su PythonAnywhere)
+STATS_REBUILD_WORKERS = None
+# Tetto ai processi di un rebuild chiesto via POST /api/stats/rebuild (parametro workers)
+STATS_REBUILD_MAX_WORKERS = 4
+
+# ==================
+# WATCH FOLDER (watch_imports.py)
+# ==================
+# Cartella dove lo staff salva CSV Bandai / .tdf TOM a fine evento
+WATCH_DIR = "tornei_da_importare"
+# Stagione per estensione quando il nome file non contiene l'id stagione
+WATCH_SEASONS = {".csv": "OP12", ".tdf": "PKM-FS25"}
+# Secondi senza modifiche prima di importare un file (copie in corso)
+WATCH_DEBOUNCE_SECONDS = 5
+# Intervallo di controllo senza inotify (pip install inotify_simple, solo Linux)
+WATCH_POLL_SECONDS = 10
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+fake_sheet.py - Workbook in memoria per dry-run e benchmark degli import
+=========================================================================
+
+Implementa il sottoinsieme di gspread usato dagli import (worksheet,
+get_all_values, get, batch_get, append_row(s), update_cell, batch_update,
+batch_clear, delete_rows): la pipeline gira identica a quella reale ma
+senza rete, e alla fine diff() elenca ogni cella che sarebbe cambiata.
+
+Il workbook si carica da:
+- uno snapshot JSON ({"title": ..., "worksheets": {nome: griglia}}),
+  creato dal foglio vero con `python fake_sheet.py dump snapshot.json`
+- una cartella di CSV esportati da Google Sheets ("<file> - <Foglio>.csv",
+  come i pulci_league_template - *.csv)
+- niente: blank_workbook() crea i fogli vuoti (solo header) con la riga
+  Config della stagione
+
+Le celle scritte diventano stringhe come le mostrerebbe Sheets
+(5.0 -> "5", True -> "TRUE"), così il diff confronta valori omogenei.
+
+    sheet = load_workbook("snapshot.json")
+    import_tournament_to_sheet(sheet, "OP12_2025_11_12.csv", "OP12", test_mode=True)
+    print(format_diff(sheet.diff()))
+"""
+
+import csv
+import json
+import re
+from collections import Counter
+from copy import deepcopy
+from pathlib import Path
+
+from schema import HEADER_ROWS
+
+# header dei fogli per blank_workbook() (riga 3; Config ha gli header in riga 4)
+HEADERS = {
+    'Config': ['Season_ID', 'TCG', 'Season_Name', 'Start_Date', 'Status', 'Total_Tournaments',
+               'Entry_Fee', 'Pack_Cost', 'X0_Ratio', 'X1_Ratio', 'Rounding', 'Next_Tournament_Date'],
+    'Players': ['Membership_Number', 'Display_Name', 'First_Seen', 'Last_Seen', 'Total_Tournaments',
+                'Tournament_Wins', 'Match_Wins', 'Total_Points_Lifetime'],
+    'Tournaments': ['Tournament_ID', 'Season_ID', 'Date', 'Participants', 'Rounds', 'CSV_Filename',
+                    'Imported_At', 'Winner'],
+    'Results': ['Result_ID', 'Tournament_ID', 'Membership_Number', 'Ranking', 'Win_Points', 'OMW_Percent',
+                'Points_Victory', 'Points_Ranking', 'Points_Total', 'Display_Name', 'Match_W', 'Match_T',
+                'Match_L', 'OOMW_Percent', 'H2H', 'OMW_Official_Percent'],
+    'Seasonal_Standings_PROV': ['Season_ID', 'Membership_Number', 'Display_Name', 'Total_Points',
+                                'Tournaments_Played', 'Tournaments_Counted', 'Tournament_Wins', 'Match_Wins',
+                                'Best_Rank', 'Top8_Count', 'Ranking_Position'],
+    'Vouchers': ['Voucher_ID', 'Tournament_ID', 'Membership_Number', 'Display_Name', 'Ranking', 'Record',
+                 'Category', 'Amount_Calculated', 'Amount_Final', 'Status', 'Notes'],
+    'Backups': ['Backup_ID', 'Timestamp', 'Action', 'Tournament_ID', 'Description', 'Backup_Data_JSON'],
+    'Pokemon_Matches': ['Match_ID', 'Tournament_ID', 'Round', 'Winner_UserID', 'Loser_UserID', 'Timestamp'],
+}
+HEADERS['Seasonal_Standings_FINAL'] = HEADERS['Seasonal_Standings_PROV']
+
+# valori Config di default per la stagione di blank_workbook() (come calculate_vouchers)
+DEFAULT_SEASON = {'Status': 'ACTIVE', 'Total_Tournaments': '0', 'Entry_Fee': '5', 'Pack_Cost': '6',
+                  'X0_Ratio': '1.9', 'X1_Ratio': '1', 'Rounding': '0.5'}
+
+
+class WorksheetNotFound(Exception):
+    pass
+
+
+try:  # stessa eccezione di gspread, se installato
+    from gspread.exceptions import WorksheetNotFound
+except ImportError:
+    pass
+
+
+# ============================================
+# CELLE / RANGE A1
+# ============================================
+
+def _cell(value):
+    """Valore scritto -> stringa come la restituirebbe get_all_values()."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) or type(value).__name__.startswith('float'):
+        value = float(value)
+        if value != value:
+            return ''
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+def _col_index(letters):
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def col_letter(n):
+    letters = ''
+    while n:
+        n, r = divmod(n - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+
+def a1(row, col):
+    return f"{col_letter(col)}{row}"
+
+
+_A1 = re.compile(r"^([A-Za-z]*)(\d*)$")
+
+
+def _parse_range(ref):
+    """'D5:H5', 'A4:O', 'A1' -> (r1, c1, r2, c2), None = fino in fondo (1-based)."""
+    ref = ref.split('!')[-1]
+    start, _, end = ref.partition(':')
+    c1, r1 = _A1.match(start).groups()
+    c2, r2 = _A1.match(end or start).groups()
+    return (int(r1) if r1 else 1, _col_index(c1) if c1 else 1,
+            int(r2) if r2 else None, _col_index(c2) if c2 else None)
+
+
+# ============================================
+# WORKBOOK
+# ============================================
+
+class FakeWorksheet:
+    def __init__(self, book, title, rows):
+        self.book = book
+        self.spreadsheet = book   # come gspread.Worksheet
+        self.title = title
+        self.rows = [[_cell(v) for v in row] for row in rows]
+
+    def _count(self, kind):
+        self.book.calls[kind] += 1
+
+    # --- letture ---
+
+    def get_all_values(self):
+        self._count('read')
+        width = max((len(r) for r in self.rows), default=0)
+        last = len(self.rows)
+        while last and not any(self.rows[last - 1]):
+            last -= 1
+        return [r + [''] * (width - len(r)) for r in self.rows[:last]]
+
+    def _get(self, ref):
+        r1, c1, r2, c2 = _parse_range(ref)
+        rows = self.rows[r1 - 1:r2]
+        out = [row[c1 - 1:c2] for row in rows]
+        while out and not any(out[-1]):
+            out.pop()
+        return [[v for v in row] for row in out]
+
+    def get(self, ref):
+        self._count('read')
+        return self._get(ref)
+
+    def batch_get(self, refs):
+        self._count('read')
+        return [self._get(ref) for ref in refs]
+
+    # --- scritture ---
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        line = self.rows[row - 1]
+        if len(line) < col:
+            line.extend([''] * (col - len(line)))
+        line[col - 1] = _cell(value)
+
+    def _last_row(self):
+        last = len(self.rows)
+        while last and not any(self.rows[last - 1]):
+            last -= 1
+        return last
+
+    def append_row(self, values, value_input_option='RAW', **kwargs):
+        self.append_rows([values], value_input_option)
+
+    def append_rows(self, values, value_input_option='RAW', **kwargs):
+        self._count('write')
+        start = max(self._last_row(), HEADER_ROWS) + 1
+        for i, row in enumerate(values):
+            for j, v in enumerate(row):
+                self._set(start + i, j + 1, v)
+
+    def update_cell(self, row, col, value):
+        self._count('write')
+        self._set(row, col, value)
+
+    def update(self, ref, values, **kwargs):
+        self._count('write')
+        self._write_range(ref, values)
+
+    def _write_range(self, ref, values):
+        r1, c1, _, _ = _parse_range(ref)
+        for i, row in enumerate(values):
+            for j, v in enumerate(row):
+                self._set(r1 + i, c1 + j, v)
+
+    def batch_update(self, data, value_input_option='RAW', **kwargs):
+        self._count('write')
+        for item in data:
+            self._write_range(item['range'], item['values'])
+
+    def batch_clear(self, refs):
+        self._count('write')
+        for ref in refs:
+            r1, c1, r2, c2 = _parse_range(ref)
+            for row in self.rows[r1 - 1:r2]:
+                for c in range(c1 - 1, min(len(row), c2 or len(row))):
+                    row[c] = ''
+
+    def delete_rows(self, start, end=None):
+        self._count('write')
+        del self.rows[start - 1:(end or start)]
+
+
+class FakeSpreadsheet:
+    """Spreadsheet finto: stessi metodi usati dagli import, nessuna rete."""
+
+    def __init__(self, worksheets, title="fake", sheet_id="fake"):
+        self.title = title
+        self.id = sheet_id
+        self.calls = Counter()   # letture/scritture API che il foglio vero avrebbe ricevuto
+        self._sheets = {name: FakeWorksheet(self, name, rows) for name, rows in worksheets.items()}
+        self._baseline = {name: deepcopy(ws.rows) for name, ws in self._sheets.items()}
+
+    def worksheet(self, name):
+        try:
+            return self._sheets[name]
+        except KeyError:
+            raise WorksheetNotFound(name) from None
+
+    def worksheets(self):
+        return list(self._sheets.values())
+
+    def to_json(self):
+        return {'title': self.title, 'worksheets': {n: ws.rows for n, ws in self._sheets.items()}}
+
+    def diff(self):
+        """Celle cambiate rispetto al caricamento: [(foglio, 'B12', vecchio, nuovo)]."""
+        changes = []
+        for name, ws in self._sheets.items():
+            old_rows = self._baseline.get(name, [])
+            for r in range(max(len(old_rows), len(ws.rows))):
+                old = old_rows[r] if r < len(old_rows) else []
+                new = ws.rows[r] if r < len(ws.rows) else []
+                for c in range(max(len(old), len(new))):
+                    before = old[c] if c < len(old) else ''
+                    after = new[c] if c < len(new) else ''
+                    if before != after:
+                        changes.append((name, a1(r + 1, c + 1), before, after))
+        return changes
+
+
+# ============================================
+# CARICAMENTO
+# ============================================
+
+def blank_workbook(season_id, **config):
+    """Workbook vuoto (solo header) con la riga Config della stagione."""
+    season_id = season_id.upper()
+    tcg = re.match(r'[A-Z]*', season_id).group(0)
+    values = {**DEFAULT_SEASON, 'Season_ID': season_id, 'TCG': tcg, 'Season_Name': season_id,
+              **{k: str(v) for k, v in config.items()}}
+    sheets = {name: [[name.upper()], [], header] for name, header in HEADERS.items()}
+    sheets['Config'] = [['CONFIGURAZIONE'], [], ['STAGIONI'], HEADERS['Config'],
+                        [values.get(h, '') for h in HEADERS['Config']]]
+    return FakeSpreadsheet(sheets, title=f"blank {season_id}")
+
+
+def load_workbook(path):
+    """Workbook da snapshot JSON o da cartella di CSV esportati da Google Sheets."""
+    path = Path(path)
+    if path.is_dir():
+        sheets = {}
+        for f in sorted(path.glob("*.csv")):
+            name = f.stem.rsplit(' - ', 1)[-1]
+            with open(f, newline='', encoding='utf-8') as fh:
+                sheets[name] = list(csv.reader(fh))
+        if not sheets:
+            raise ValueError(f"Nessun CSV in {path}")
+        return FakeSpreadsheet(sheets, title=path.name)
+    data = json.loads(path.read_text(encoding='utf-8'))
+    return FakeSpreadsheet(data['worksheets'], title=data.get('title', path.stem))
+
+
+def dump_workbook(sheet, path):
+    """Snapshot JSON di un foglio (vero o finto): una lettura per worksheet."""
+    data = {'title': sheet.title,
+            'worksheets': {ws.title: ws.get_all_values() for ws in sheet.worksheets()}}
+    Path(path).write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+def format_diff(changes, limit=None):
+    """Diff leggibile, raggruppato per foglio."""
+    if not changes:
+        return "Nessuna cella cambiata"
+    by_sheet = Counter(name for name, *_ in changes)
+    lines = [f"{len(changes)} celle cambiate: "
+             + ", ".join(f"{name} {n}" for name, n in by_sheet.items())]
+    current = None
+    for i, (name, ref, before, after) in enumerate(changes):
+        if limit is not None and i >= limit:
+            lines.append(f"   ... altre {len(changes) - limit} celle")
+            break
+        if name != current:
+            lines.append(f"\n[{name}]")
+            current = name
+        lines.append(f"   {ref:<7} {before!r} → {after!r}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Snapshot del foglio per i dry-run degli import")
+    parser.add_argument("command", choices=["dump"])
+    parser.add_argument("path", help="File JSON di destinazione")
+    args = parser.parse_args()
+
+    from import_tournament import connect_to_sheet
+    dump_workbook(connect_to_sheet(), args.path)
+    print(f"✅ Snapshot salvato: {args.path}")
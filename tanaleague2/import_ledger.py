@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+import_ledger.py - Registro degli import e sostituzione riga per riga
+=====================================================================
+
+Registro locale (un JSON per foglio) dei tornei importati:
+Tournament_ID -> hash del file sorgente, nome file, data import, righe
+scritte. Serve a due cose:
+
+- re-import dello STESSO file (stesso tid, stesso hash): no-op deciso con
+  una lookup nel registro, senza leggere il foglio (nemmeno connettersi)
+- re-import di un file CAMBIATO: invece di svuotare un range min..max
+  (che poteva cancellare righe di altri tornei in mezzo e lasciava buchi)
+  si calcola un piano riga per riga: le righe del torneo vengono
+  riscritte al loro posto, quelle in più appese, quelle in meno eliminate
+
+Il registro si aggiorna solo a import riuscito; un torneo importato prima
+del registro viene riconosciuto dal foglio (colonna ID di Tournaments).
+Web (coda job) e watch_imports.py sono processi diversi: record() prende un
+flock sul file .lock accanto al registro per tutto il leggi-modifica-scrivi.
+
+Il registro non vede le modifiche fatte a mano al foglio: un torneo
+cancellato dal foglio e reimportato con lo stesso file resta un no-op, a
+meno di --force (script) o sovrascrittura (admin/cartella), che ricontrolla
+la colonna ID di Tournaments.
+
+    if unchanged(SHEET_ID, tid, digest): return
+    plan = plan_replace(ws.get("A4:O"), tid, key_col=1, new_rows=rows, last_col="O")
+    apply_replace(ws, plan)
+    record(SHEET_ID, tid, digest, source="OP12_2025_11_12.csv", rows={'Results': 18})
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from instrumentation import inc_counter
+from schema import HEADER_ROWS
+from snapshots import invalidate
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo il lock tra thread dello stesso processo
+    fcntl = None
+
+LEDGER_DIR = Path(__file__).resolve().parent / "import_ledger"  # creata al primo import
+
+_lock = threading.Lock()
+
+
+# ============================================
+# REGISTRO
+# ============================================
+
+def content_hash(data):
+    """Hash del contenuto di un file (bytes)."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return content_hash(f.read())
+
+
+def _path(sheet_id):
+    safe = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in str(sheet_id))
+    return LEDGER_DIR / f"{safe}.json"
+
+
+def _load(sheet_id):
+    try:
+        return json.loads(_path(sheet_id).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def lookup(sheet_id, tid):
+    """Voce del registro per il torneo (None se mai importato da qui)."""
+    return _load(sheet_id).get(tid)
+
+
+@contextmanager
+def _locked(sheet_id):
+    """Lock del registro tra thread (threading) e tra processi (flock)."""
+    with _lock:
+        LEDGER_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_path(sheet_id).with_suffix('.lock'), 'a') as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def unchanged(sheet_id, tid, digest):
+    """True se questo torneo è già stato importato da un file identico."""
+    entry = lookup(sheet_id, tid)
+    if entry is not None and entry.get('hash') == digest:
+        inc_counter("import_ledger_noop")
+        return True
+    return False
+
+
+def noop_message(sheet_id, tid):
+    """Messaggio per il re-import di un file identico (con la via d'uscita)."""
+    entry = lookup(sheet_id, tid) or {}
+    return (f"{tid} già importato da un file identico ({entry.get('imported_at', 'N/A')}): "
+            f"nulla da fare. Se il torneo è stato cancellato a mano dal foglio, "
+            f"reimporta con --force (o con sovrascrittura)")
+
+
+def record(sheet_id, tid, digest, source, rows=None):
+    """Registra un import riuscito (sovrascrive la voce precedente del torneo)."""
+    with _locked(sheet_id):
+        entries = _load(sheet_id)
+        entries[tid] = {
+            'hash': digest,
+            'source': source,
+            'imported_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'rows': rows or {},
+        }
+        path = _path(sheet_id)
+        fd, tmp = tempfile.mkstemp(dir=LEDGER_DIR, prefix=f".{path.stem}_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+# ============================================
+# PIANO DI SOSTITUZIONE
+# ============================================
+
+def _runs(positions):
+    """[4, 5, 6, 9] -> [(4, 6), (9, 9)]"""
+    runs = []
+    for pos in positions:
+        if runs and pos == runs[-1][1] + 1:
+            runs[-1][1] = pos
+        else:
+            runs.append([pos, pos])
+    return [tuple(r) for r in runs]
+
+
+def _same(old, new):
+    old = list(old) + [''] * (len(new) - len(old))
+    return all(str(o) == str(n) or _num_equal(o, n) for o, n in zip(old, new))
+
+
+def _num_equal(old, new):
+    if not isinstance(new, (int, float)):
+        return False
+    try:
+        return abs(float(str(old).replace(',', '.').rstrip('%')) - new) < 1e-9
+    except ValueError:
+        return False
+
+
+def plan_replace(existing_rows, tid, key_col, new_rows, last_col, header_rows=HEADER_ROWS):
+    """
+    Piano per sostituire le righe di un torneo con quelle nuove.
+
+    Le righe si abbinano per ID (colonna A: Result_ID, Voucher_ID, ...): una
+    riga con lo stesso ID resta al suo posto e si riscrive solo se cambiata;
+    le righe nuove occupano i posti liberi, poi si appendono; i posti
+    avanzati si eliminano.
+
+    Args:
+        existing_rows: righe del foglio DALLA riga header_rows + 1
+            (es. ws.get("A4:O"))
+        tid: Tournament_ID
+        key_col: colonna (0-based) con il Tournament_ID
+        new_rows: righe nuove del torneo (layout foglio)
+        last_col: ultima colonna scritta ('O')
+
+    Returns:
+        {'updates': [...] per batch_update (solo righe cambiate),
+         'appends': righe da appendere, 'deletes': [(da, a)] blocchi di righe,
+         'old_rows': righe attuali del torneo, 'unchanged': righe identiche}
+    """
+    by_id, old_rows = {}, []
+    for i, row in enumerate(existing_rows, start=header_rows + 1):
+        if len(row) > key_col and row[key_col] == tid:
+            by_id.setdefault(row[0], []).append((i, row))
+            old_rows.append(row)
+
+    pairs, pending = [], []
+    for new in new_rows:
+        same_id = by_id.get(str(new[0]))
+        if same_id:
+            pairs.append((*same_id.pop(0), new))
+        else:
+            pending.append(new)
+    free = sorted(slot for slots in by_id.values() for slot in slots)
+    pairs += [(pos, old, new) for (pos, old), new in zip(free, pending)]
+    n = min(len(free), len(pending))
+
+    updates, unchanged_rows = [], 0
+    for pos, old, new in sorted(pairs, key=lambda p: p[0]):
+        if _same(old, new):
+            unchanged_rows += 1
+        else:
+            updates.append({'range': f"A{pos}:{last_col}{pos}", 'values': [list(new)]})
+    return {
+        'updates': updates,
+        'appends': [list(r) for r in pending[n:]],
+        'deletes': _runs([pos for pos, _ in free[n:]]),
+        'old_rows': old_rows,
+        'unchanged': unchanged_rows,
+    }
+
+
+def apply_replace(ws, plan, value_input_option='RAW'):
+    """
+    Esegue il piano: 1 batch_update, righe eliminate dal basso (gli indici
+    sopra restano validi), 1 append_rows. Se ha toccato righe già presenti,
+    lo snapshot del foglio (snapshots.py) va riletto per intero.
+    """
+    if plan['updates']:
+        ws.batch_update(plan['updates'], value_input_option=value_input_option)
+    for start, end in sorted(plan['deletes'], reverse=True):
+        ws.delete_rows(start, end)
+    if plan['appends']:
+        ws.append_rows(plan['appends'], value_input_option=value_input_option)
+    if plan['updates'] or plan['deletes']:
+        invalidate(ws.spreadsheet.id, ws.title)
+
+
+def format_plan(title, plan):
+    deleted = sum(end - start + 1 for start, end in plan['deletes'])
+    return (f"{title}: {len(plan['updates'])} righe riscritte, {plan['unchanged']} invariate, "
+            f"{len(plan['appends'])} aggiunte, {deleted} eliminate")
+
+
+def write_event_rows(ws, tid, key_col, rows, last_col, replace, value_input_option='RAW'):
+    """
+    Scrive le righe di un torneo: append se nuovo, piano riga per riga se
+    già presente (1 lettura del foglio, solo in quel caso).
+
+    Returns:
+        piano applicato (None per un torneo nuovo)
+    """
+    if not replace:
+        if rows:
+            ws.append_rows([list(r) for r in rows], value_input_option=value_input_option)
+        return None
+    plan = plan_replace(ws.get(f"A{HEADER_ROWS + 1}:{last_col}"), tid, key_col, rows, last_col)
+    apply_replace(ws, plan, value_input_option)
+    return plan
@@ -16,20 +16,31 @@ COSA FA:
 UTILIZZO:
     python import_tournament.py --csv path/to/tournament.csv --season OP12
 
+    # Dry-run: tutta la pipeline su un workbook finto (fake_sheet.py), nessuna
+    # scrittura e nessuna rete; stampa le celle che cambierebbero
+    python import_tournament.py --csv torneo.csv --season OP12 --test
+    python import_tournament.py --csv torneo.csv --season OP12 --test --snapshot snapshot.json
+
 REQUIREMENTS:
     pip install gspread google-auth pandas
 """
 
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
+import numpy as np
 import json
-import math
 from datetime import datetime
 import re
 from typing import Dict, List, Tuple
 import argparse
 
+from aggregates import store_event
+from import_ledger import file_hash, format_plan, lookup, noop_message, record, unchanged, write_event_rows
+from players import rebuild_players, upsert_players
+from schema import HEADER_ROWS
+from scoring import info_row, match_records, rounds_for, score_results, tournament_points, voucher_amounts
+from sheets_client import format_call_stats, open_spreadsheet
+from standings import drop_rule, update_standings
+
 
 # ============================================
 # CONFIGURAZIONE
@@ -41,13 +52,21 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive'
 ]
 
+# Foglio e credenziali vengono da config.py, gli stessi della webapp (la
+# cache rilegge il foglio in cui l'import ha scritto); i valori qui sotto
+# valgono solo se lo script gira senza config.py.
+try:
+    import config as _config
+except Exception:
+    _config = None
+
 # ID del tuo Google Sheet (lo troverai nell'URL)
 # Esempio URL: https://docs.google.com/spreadsheets/d/ABC123XYZ/edit
 # ABC123XYZ è il SHEET_ID
-SHEET_ID = "19ZF35DTmgZG8v1GfzKE5JmMUTXLo300vuw_AdrgQPFE"  # <-- MODIFICA QUESTO!
+SHEET_ID = getattr(_config, "SHEET_ID", "19ZF35DTmgZG8v1GfzKE5JmMUTXLo300vuw_AdrgQPFE")  # <-- MODIFICA QUESTO!
 
 # Path al file JSON delle credenziali del Service Account
-CREDENTIALS_FILE = "service_account_credentials.json"  # <-- MODIFICA QUESTO!
+CREDENTIALS_FILE = getattr(_config, "CREDENTIALS_FILE", "service_account_credentials.json")  # <-- MODIFICA QUESTO!
 
 
 # ============================================
@@ -56,13 +75,14 @@ CREDENTIALS_FILE = "service_account_credentials.json"  # <-- MODIFICA QUESTO!
 
 def calculate_rounds_from_participants(n_participants: int) -> int:
     """
-    Calcola il numero di round in base ai partecipanti.
+    Calcola il numero di round in base ai partecipanti (scoring.rounds_for).
 
     Regola standard TCG:
-    - 4-8 partecipanti: 3 round
+    - fino a 8 partecipanti: 3 round
     - 9-16 partecipanti: 4 round
     - 17-32 partecipanti: 5 round
     - 33-64 partecipanti: 6 round
+    - 65-128 partecipanti: 7 round, oltre 8
 
     Args:
         n_participants: Numero di partecipanti
@@ -70,25 +90,13 @@ def calculate_rounds_from_participants(n_participants: int) -> int:
     Returns:
         Numero di round
     """
-    if 4 <= n_participants <= 8:
-        return 3
-    elif 9 <= n_participants <= 16:
-        return 4
-    elif 17 <= n_participants <= 32:
-        return 5
-    elif 33 <= n_participants <= 64:
-        return 6
-    elif 65 <= n_participants <= 128:
-        return 7
-    else:
-        # Fallback: calcola da max win points
-        return None
+    return rounds_for(n_participants)
 
 
 import re
 from datetime import datetime
 
-def parse_csv_date_universal(filename: str) -> str:
+def parse_csv_date_universal(filename: str, strict: bool = False) -> str:
     """
     Parsing date UNIVERSALE - accetta TUTTI i formati comuni.
 
@@ -100,6 +108,10 @@ def parse_csv_date_universal(filename: str) -> str:
     5. YYYY-MM-DD_OP11.csv        → 2025-06-12_OP11.csv
     6. DD-MM-YYYY_OP11.csv        → 12-06-2025_OP11.csv
 
+    Args:
+        strict: se True un nome senza data valida solleva ValueError invece
+            di usare la data odierna (upload admin, watch folder)
+
     Returns:
         str: Data formato YYYY-MM-DD
     """
@@ -141,6 +153,9 @@ def parse_csv_date_universal(filename: str) -> str:
         if int(day) <= 31:
             return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
 
+    if strict:
+        raise ValueError(f"❌ Formato data non riconosciuto in '{filename}'")
+
     # FALLBACK: Usa data di oggi
     print(f"⚠️  WARNING: Formato data non riconosciuto in '{filename}'")
     print(f"   Uso data odierna: {datetime.now().strftime('%Y-%m-%d')}")
@@ -166,7 +181,7 @@ if __name__ == "__main__":
 
 def calculate_tournament_points(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Calcola i punti per ogni giocatore in un torneo.
+    Calcola i punti per ogni giocatore in un torneo (scoring.tournament_points).
 
     Formula:
     - Punti Vittoria = Win Points / 3
@@ -180,53 +195,30 @@ def calculate_tournament_points(df: pd.DataFrame) -> pd.DataFrame:
         DataFrame arricchito con i punti calcolati
     """
     df = df.copy()
-    n_participants = len(df)
-
-    # Calcolo punti vittoria
-    df['Points_Victory'] = df['Win Points'] / 3
-
-    # Calcolo punti ranking
-    df['Points_Ranking'] = n_participants - (df['Ranking'] - 1)
-
-    # Totale
-    df['Points_Total'] = df['Points_Victory'] + df['Points_Ranking']
-
+    df['Points_Victory'], df['Points_Ranking'], df['Points_Total'] = \
+        tournament_points(df['Ranking'], df['Win Points'])
     return df
 
 
 def identify_record_categories(df: pd.DataFrame, n_rounds: int) -> pd.DataFrame:
     """
-    Identifica le categorie X-0, X-1, Altri per ogni giocatore.
+    Identifica le categorie X-0, X-1, Altri per ogni giocatore (scoring.match_records).
 
     Args:
         df: DataFrame con i risultati
         n_rounds: Numero di round del torneo
 
     Returns:
-        DataFrame con colonna 'Category' aggiunta
+        DataFrame con colonne 'Losses', 'Category' e 'Record' (es. "4-0") aggiunte
     """
     df = df.copy()
-
-    # Calcolo losses
-    df['Losses'] = n_rounds - (df['Win Points'] / 3)
-
-    # Categoria
-    df['Category'] = df['Losses'].apply(lambda x:
-        'X-0' if x == 0 else ('X-1' if x == 1 else 'OTHER')
-    )
-
-    # Record (es. "4-0", "3-1")
-    df['Record'] = df.apply(
-        lambda row: f"{int(row['Win Points']/3)}-{int(row['Losses'])}",
-        axis=1
-    )
-
+    _, df['Losses'], df['Record'], df['Category'] = match_records(df['Win Points'], n_rounds)
     return df
 
 
 def calculate_vouchers(df: pd.DataFrame, config: Dict) -> pd.DataFrame:
     """
-    Calcola i buoni negozio per un torneo.
+    Calcola i buoni negozio per un torneo (scoring.voucher_amounts).
 
     Logica:
     1. Fondo = partecipanti × entry_fee
@@ -244,79 +236,40 @@ def calculate_vouchers(df: pd.DataFrame, config: Dict) -> pd.DataFrame:
         DataFrame con colonna 'Voucher_Amount' aggiunta
     """
     df = df.copy()
-    n_participants = len(df)
-
-    # 1. Fondo totale
-    entry_fee = config.get('entry_fee', 5.0)
-    total_fund = n_participants * entry_fee
-
-    # 2. Costo buste
-    pack_cost = config.get('pack_cost', 6.0)
-    n_packs = math.floor(n_participants / 3)
-    packs_cost = n_packs * pack_cost
-
-    # 3. Rimanente da distribuire
-    remaining = total_fund - packs_cost
-
-    # Prendo solo la top (min 8 o tutti se meno)
-    top_size = min(8, n_participants)
-    df_top = df.head(top_size).copy()
-
-    # Conta per categoria nella top
-    n_x0 = len(df_top[df_top['Category'] == 'X-0'])
-    n_x1 = len(df_top[df_top['Category'] == 'X-1'])
-    n_others = len(df_top[df_top['Category'] == 'OTHER'])
-
-    # 4. Distribuzione agli "Altri"
-    others_total = n_others * 2.0
-    remaining_for_top = remaining - others_total
-
-    # 5. Calcolo X-0 e X-1
-    x0_ratio = config.get('x0_ratio', 1.90)
-    x1_ratio = config.get('x1_ratio', 1.00)
-    rounding = config.get('rounding', 0.50)
-
-    if n_x0 > 0 or n_x1 > 0:
-        divisor = n_x0 * x0_ratio + n_x1 * x1_ratio
-        base_amount = remaining_for_top / divisor if divisor > 0 else 0
-
-        x0_amount_raw = base_amount * x0_ratio
-        x1_amount_raw = base_amount * x1_ratio
+    amounts, info = voucher_amounts(df['Category'], np.zeros(len(df), dtype=np.int8), config)
+    df['Voucher_Amount'] = amounts
+    # info al dataframe per reference
+    df.attrs['voucher_info'] = info_row(info)
+    return df
 
-        # Arrotondamento
-        x0_amount = round(x0_amount_raw / rounding) * rounding
-        x1_amount = round(x1_amount_raw / rounding) * rounding
-    else:
-        x0_amount = 0
-        x1_amount = 0
 
-    # 6. Assegno i buoni
-    df['Voucher_Amount'] = 0.0
+def score_tournament(df: pd.DataFrame, n_rounds: int, config: Dict) -> pd.DataFrame:
+    """
+    Punti, record, categorie e buoni in un passaggio (scoring.score_results,
+    lo stesso del TDF): le colonne di calculate_tournament_points,
+    identify_record_categories e calculate_vouchers, più 'Match_W'.
 
-    for idx, row in df_top.iterrows():
-        if row['Category'] == 'X-0':
-            df.loc[idx, 'Voucher_Amount'] = x0_amount
-        elif row['Category'] == 'X-1':
-            df.loc[idx, 'Voucher_Amount'] = x1_amount
-        else:
-            df.loc[idx, 'Voucher_Amount'] = 2.0
-
-    # Calcolo leftover
-    total_distributed = df['Voucher_Amount'].sum()
-    leftover = remaining - total_distributed
-
-    # Aggiungo info al dataframe per reference
-    df.attrs['voucher_info'] = {
-        'total_fund': total_fund,
-        'packs_cost': packs_cost,
-        'remaining': remaining,
-        'total_distributed': total_distributed,
-        'leftover': leftover,
-        'n_x0': n_x0,
-        'n_x1': n_x1,
-        'n_others': n_others
-    }
+    Args:
+        df: DataFrame dal CSV, in ordine di classifica
+        n_rounds: Numero di round del torneo
+        config: Dict con entry_fee, pack_cost, x0_ratio, x1_ratio, rounding
 
+    Returns:
+        DataFrame arricchito; attrs['voucher_info'] come calculate_vouchers
+    """
+    scored = score_results(pd.DataFrame({'rank': df['Ranking'].to_numpy(),
+                                         'win_points': df['Win Points'].to_numpy()}),
+                           n_rounds=n_rounds, config=config)
+    df = df.copy()
+    df['Points_Victory'] = scored['pv'].to_numpy()
+    df['Points_Ranking'] = scored['pr'].to_numpy()
+    df['Points_Total'] = scored['pt'].to_numpy()
+    df['Match_W'] = scored['match_w'].to_numpy()
+    df['Losses'] = scored['match_l'].to_numpy()
+    df['Record'] = scored['record'].to_numpy()
+    df['Category'] = scored['category'].to_numpy()
+    df['Voucher_Amount'] = scored['voucher'].to_numpy()
+    df.attrs['voucher_info'] = scored.attrs['voucher_info']
     return df
 
 
@@ -336,9 +289,7 @@ def connect_to_sheet():
     Returns:
         Oggetto Spreadsheet di gspread
     """
-    creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SHEET_ID)
+    sheet = open_spreadsheet(SHEET_ID, CREDENTIALS_FILE, scopes=SCOPES)
     return sheet
 
 
@@ -399,19 +350,22 @@ def get_season_config(sheet, season_id: str) -> Dict:
                 'pack_cost': to_float(row['Pack_Cost']),
                 'x0_ratio': to_float(row['X0_Ratio']),
                 'x1_ratio': to_float(row['X1_Ratio']),
-                'rounding': to_float(row['Rounding'])
+                'rounding': to_float(row['Rounding']),
+                'drop_rule': drop_rule(row)
             }
 
     raise ValueError(f"Stagione {season_id} non trovata nel foglio Config!")
 
 
-def update_seasonal_standings(sheet, season_id: str, df: pd.DataFrame, tournament_date: str, config: Dict):
+def update_seasonal_standings(sheet, season_id: str, df: pd.DataFrame, tournament_date: str, config: Dict,
+                              result_rows: List = None):
     """
     Aggiorna la classifica stagionale con i nuovi risultati.
 
-    Applica lo scarto dinamico:
-    - Se stagione < 8 tornei: conta tutto
-    - Se stagione >= 8 tornei: conta (totale - 2) migliori
+    Usa il motore incrementale condiviso (standings.py): applica solo le
+    righe del torneo e scrive solo le righe di classifica cambiate.
+    Lo scarto dipende dalla regola della stagione in Config
+    (default: da 8 tornei in su si scartano le peggiori 2 giornate).
 
     Args:
         sheet: Oggetto Spreadsheet
@@ -419,156 +373,19 @@ def update_seasonal_standings(sheet, season_id: str, df: pd.DataFrame, tournamen
         df: DataFrame con risultati torneo
         tournament_date: Data torneo
         config: Config stagione
+        result_rows: Righe Results del torneo (layout foglio)
     """
-    ws_standings = sheet.worksheet("Seasonal_Standings_PROV")
-    ws_results = sheet.worksheet("Results")
-    ws_tournaments = sheet.worksheet("Tournaments")
-
-    # Conta quanti tornei ci sono in questa stagione
-    all_tournaments = ws_tournaments.get_all_values()
-    season_tournaments = [row for row in all_tournaments[3:] if row and row[1] == season_id]
-    total_tournaments = len(season_tournaments)
-
-    print(f"      Tornei stagione: {total_tournaments}")
+    tournament_id = f"{season_id}_{tournament_date}"
+    summary = update_standings(sheet, season_id, tournament_id, result_rows or [],
+                               rule=config.get('drop_rule'))
 
-    # Calcola quanti tornei contare
-    if total_tournaments < 8:
-        max_to_count = total_tournaments
-        print(f"      Scarto: NESSUNO (stagione < 8 tornei)")
+    print(f"      Tornei stagione: {summary['n_tournaments']}")
+    if summary['max_counted'] >= summary['n_tournaments']:
+        print(f"      Scarto: NESSUNO")
     else:
-        max_to_count = total_tournaments - 2
-        print(f"      Scarto: Le peggiori 2 giornate (conta max {max_to_count})")
-
-    # Leggi tutti i risultati della stagione
-    all_results = ws_results.get_all_values()
-
-    # Raggruppa per giocatore
-    player_data = {}
-    for row in all_results[3:]:  # Skip header
-        if not row or len(row) < 9:
-            continue
-
-        result_tournament_id = row[1]
-        # Verifica che sia della stagione corretta
-        if not result_tournament_id.startswith(season_id):
-            continue
-
-        membership = row[2]
-        points = float(row[8]) if row[8] else 0
-        ranking = int(row[3]) if row[3] else 999
-
-        if membership not in player_data:
-            player_data[membership] = {
-                'tournaments': [],
-                'best_rank': 999
-            }
-
-        player_data[membership]['tournaments'].append({
-            'date': result_tournament_id.split('_')[1] if '_' in result_tournament_id else '',
-            'points': points,
-            'rank': ranking,
-            'win_points': float(row[4]) if len(row) > 4 and row[4] else 0
-        })
-        player_data[membership]['best_rank'] = min(player_data[membership]['best_rank'], ranking)
-
-    # Calcola classifica finale con scarto
-    final_standings = []
-
-    # Crea mapping membership -> nome dai Results
-    name_map = {}
-    for row in all_results[3:]:
-        if row and len(row) >= 10:
-            membership = row[2]
-            name = row[9] if len(row) > 9 and row[9] else membership
-            name_map[membership] = name
-
-    for membership, data in player_data.items():
-        tournaments_played = data['tournaments']
-        n_played = len(tournaments_played)
-
-        # Ordina per punti
-        sorted_tournaments = sorted(tournaments_played, key=lambda x: x['points'], reverse=True)
-
-        # Prendi i migliori
-        to_count = min(n_played, max_to_count)
-        best_tournaments = sorted_tournaments[:to_count]
-
-        total_points = sum(t['points'] for t in best_tournaments)
-        
-        # NUOVO: Tournament_Wins = quanti 1° posti
-        tournament_wins = sum(1 for t in tournaments_played if t['rank'] == 1)
-        
-        # NUOVO: Match_Wins = quante partite vinte (da tutti i tornei giocati)
-        match_wins = sum(int(t['win_points'] / 3) for t in tournaments_played)
-
-        # Conta top 8
-        top8_count = sum(1 for t in tournaments_played if t['rank'] <= 8)
-
-        # Nome dal mapping
-        player_name = name_map.get(membership, membership)
-
-        final_standings.append({
-            'membership': membership,
-            'name': player_name,
-            'total_points': total_points,
-            'tournaments_played': n_played,
-            'tournaments_counted': to_count,
-            'tournament_wins': tournament_wins,
-            'match_wins': match_wins,
-            'best_rank': data['best_rank'],
-            'top8_count': top8_count
-        })
-
-    # Ordina per punti
-    final_standings.sort(key=lambda x: x['total_points'], reverse=True)
-
-    # Pulisci il foglio Seasonal_Standings per questa stagione
-    existing_standings = ws_standings.get_all_values()
-    rows_to_delete = []
-    for i, row in enumerate(existing_standings[3:], start=4):
-        if row and row[0] == season_id:
-            rows_to_delete.append(i)
-
-    # Prepara tutte le righe da scrivere
-    rows_to_add = []
-    for i, player in enumerate(final_standings, 1):
-        standing_row = [
-            season_id,
-            player['membership'],
-            player['name'],
-            float(player['total_points']),
-            int(player['tournaments_played']),
-            int(player['tournaments_counted']),
-            int(player['tournament_wins']),
-            int(player['match_wins']),
-            int(player['best_rank']),
-            int(player['top8_count']),
-            i
-        ]
-        rows_to_add.append(standing_row)
-
-    # Trova dove iniziare a scrivere (dopo altre stagioni)
-    write_start_row = 4
-    for i, row in enumerate(existing_standings[3:], start=4):
-        if not row or not row[0]:
-            break
-        if row[0] != season_id:
-            write_start_row = i + 1
-    
-    # Se c'erano dati vecchi di questa stagione, scrivi da lì
-    if rows_to_delete:
-        write_start_row = min(rows_to_delete)
-    
-    # BATCH WRITE - scrivi da riga fissa
-    if rows_to_add:
-        end_row = write_start_row + len(rows_to_add) - 1
-        ws_standings.update(values=rows_to_add, range_name=f"A{write_start_row}:K{end_row}", value_input_option='RAW')
-        
-        # Pulisci righe vecchie sotto (se ce ne sono)
-        if rows_to_delete and max(rows_to_delete) > end_row:
-            ws_standings.batch_clear([f"A{end_row+1}:K{max(rows_to_delete)}"])
-
-    print(f"      ✅ Classifica aggiornata: {len(final_standings)} giocatori")
+        print(f"      Scarto: conta max {summary['max_counted']} giornate")
+    print(f"      ✅ Classifica aggiornata: {len(summary['rows'])} giocatori "
+          f"({summary['updated']} righe modificate, {summary['added']} nuove)")
 
 
 def create_backup(sheet, action: str, tournament_id: str, description: str, data: Dict):
@@ -592,86 +409,79 @@ def create_backup(sheet, action: str, tournament_id: str, description: str, data
     print(f"✅ Backup creato: {backup_id}")
 
 
-def check_duplicate_tournament(sheet, tournament_id: str) -> bool:
+def check_duplicate_tournament(sheet, tournament_id: str, overwrite: bool = None):
     """
     Controlla se un torneo è già stato importato.
     Se esiste, chiede all'utente se sovrascrivere.
 
-    Returns:
-        True = Procedi (nuovo o sovrascrivi)
-        False = Annulla import
-    """
-    ws_tournaments = sheet.worksheet("Tournaments")
-    existing = ws_tournaments.get_all_values()
+    Legge solo la colonna ID di Tournaments; le righe vecchie NON vengono
+    cancellate qui: l'import le sostituisce riga per riga (import_ledger).
 
-    # Cerca tournament_id esistente
-    existing_row = None
-    for i, row in enumerate(existing[3:], start=4):
-        if row and row[0] == tournament_id:
-            existing_row = i
-            break
+    Args:
+        overwrite: None = chiedi da console; True/False = decisione già presa
+            (import non interattivo, es. upload admin)
 
-    if not existing_row:
-        return True  # Nuovo torneo, procedi
+    Returns:
+        'new' = torneo nuovo, 'replace' = sovrascrivi, None = annulla import
+    """
+    if tournament_id not in tournament_ids(sheet):
+        return 'new'  # Nuovo torneo, procedi
 
     # Torneo già esistente!
+    entry = lookup(SHEET_ID, tournament_id) or {}
     print("\n" + "="*60)
     print("⚠️  ATTENZIONE! TORNEO GIÀ IMPORTATO!")
     print("="*60)
     print(f"\nTournament_ID: {tournament_id}")
-    print(f"Importato il: {existing[existing_row-1][6] if len(existing[existing_row-1]) > 6 else 'N/A'}")
-    print("\nCosa vuoi fare?")
-    print("  [S] Sovrascrivere (cancella vecchio + reimporta)")
-    print("  [A] Annullare import")
-
-    while True:
-        choice = input("\nScelta [S/A]: ").strip().upper()
-        if choice in ['S', 'A']:
-            break
-        print("❌ Scelta non valida! Digita S o A")
+    print(f"Importato il: {entry.get('imported_at', 'N/A')}"
+          + (f" da {entry['source']} (file diverso)" if entry.get('source') else ""))
+    if overwrite is None:
+        print("\nCosa vuoi fare?")
+        print("  [S] Sovrascrivere (sostituisce le righe del torneo)")
+        print("  [A] Annullare import")
+
+        while True:
+            choice = input("\nScelta [S/A]: ").strip().upper()
+            if choice in ['S', 'A']:
+                break
+            print("❌ Scelta non valida! Digita S o A")
+    else:
+        choice = 'S' if overwrite else 'A'
 
     if choice == 'A':
         print("\n❌ Import annullato dall'utente.")
-        return False
+        return None
 
-    # Sovrascrittura: cancella vecchi dati
-    print("\n🗑️  Cancellazione vecchi dati...")
+    print("\n♻️  Sovrascrittura: le righe del torneo verranno sostituite riga per riga\n")
+    return 'replace'
 
-    # Cancella da Tournaments (1 riga sola, OK così)
-    ws_tournaments.delete_rows(existing_row)
-    print("   ✅ Tournaments")
 
-    # Cancella da Results (batch clear)
-    ws_results = sheet.worksheet("Results")
-    results_data = ws_results.get_all_values()
-    rows_to_delete = []
-    for i, row in enumerate(results_data[3:], start=4):
-        if row and row[1] == tournament_id:
-            rows_to_delete.append(i)
-    if rows_to_delete:
-        first_row = min(rows_to_delete)
-        last_row = max(rows_to_delete)
-        ws_results.batch_clear([f"A{first_row}:J{last_row}"])
-    print(f"   ✅ Results ({len(rows_to_delete)} righe)")
-
-    # Cancella da Vouchers (batch clear)
-    ws_vouchers = sheet.worksheet("Vouchers")
-    vouchers_data = ws_vouchers.get_all_values()
-    rows_to_delete = []
-    for i, row in enumerate(vouchers_data[3:], start=4):
-        if row and row[1] == tournament_id:
-            rows_to_delete.append(i)
-    if rows_to_delete:
-        first_row = min(rows_to_delete)
-        last_row = max(rows_to_delete)
-        ws_vouchers.batch_clear([f"A{first_row}:L{last_row}"])
-    print(f"   ✅ Vouchers ({len(rows_to_delete)} righe)")
-
-    print("\n✅ Vecchi dati cancellati. Procedo con reimport...\n")
-    return True
-
-
-def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
+def tournament_ids(sheet) -> List[str]:
+    """Colonna ID di Tournaments (1 lettura di una sola colonna)."""
+    ws_tournaments = sheet.worksheet("Tournaments")
+    return [row[0] if row else '' for row in ws_tournaments.get(f"A{HEADER_ROWS + 1}:A")]
+
+
+def already_imported(csv_path: str, season_id: str) -> bool:
+    """
+    True se questo file è già stato importato identico (registro locale,
+    nessuna lettura dal foglio).
+    """
+    tournament_id = csv_tournament_id(csv_path, season_id)
+    return tournament_id is not None and unchanged(SHEET_ID, tournament_id, file_hash(csv_path))
+
+
+def csv_tournament_id(csv_path: str, season_id: str):
+    """Tournament_ID dal nome del CSV (None se la data non è riconoscibile)."""
+    csv_filename = csv_path.split('/')[-1].split('\\')[-1]
+    try:
+        return f"{season_id}_{parse_csv_date_universal(csv_filename, strict=True)}"
+    except ValueError:
+        return None
+
+
+def import_tournament_to_sheet(sheet, csv_path: str, season_id: str, overwrite: bool = None,
+                               test_mode: bool = False, force: bool = False):
     """
     Importa un torneo completo nel Google Sheet.
 
@@ -686,6 +496,11 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
         sheet: Oggetto Spreadsheet
         csv_path: Path al file CSV
         season_id: ID della stagione
+        overwrite: torneo già importato -> None chiedi, True sovrascrivi, False annulla
+        test_mode: dry-run su un workbook finto (fake_sheet.py): niente file
+            locali (aggregati stats, registro import), le scritture restano
+            nel workbook
+        force: ignora il registro import (reimporta anche un file identico)
     """
     print(f"\n🚀 IMPORT TORNEO: {csv_path}")
     print(f"📊 Stagione: {season_id}\n")
@@ -700,9 +515,20 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
 
     tournament_id = f"{season_id}_{tournament_date}"
 
-    # 0.1 CHECK DOPPIO IMPORT
-    if not check_duplicate_tournament(sheet, tournament_id):
+    # 0.1 FILE IDENTICO GIÀ IMPORTATO (registro locale, nessuna lettura;
+    # con sovrascrittura richiesta si ricontrolla che sia ancora nel foglio)
+    digest = file_hash(csv_path)
+    if not test_mode and not force and already_imported(csv_path, season_id):
+        if not overwrite or tournament_id in tournament_ids(sheet):
+            print(f"✅ {noop_message(SHEET_ID, tournament_id)}")
+            return None
+        print(f"⚠️  {tournament_id} nel registro import ma non più nel foglio: reimporto")
+
+    # 0.2 CHECK DOPPIO IMPORT
+    mode = check_duplicate_tournament(sheet, tournament_id, overwrite)
+    if mode is None:
         return None  # Utente ha annullato
+    replace = mode == 'replace'
 
     # 1. Leggi CSV
     print("📂 Lettura CSV...")
@@ -713,18 +539,7 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
     n_participants = len(df)
 
     # Calcola round da numero partecipanti (Swiss standard)
-    if n_participants <= 8:
-        n_rounds = 3
-    elif n_participants <= 16:
-        n_rounds = 4
-    elif n_participants <= 32:
-        n_rounds = 5
-    elif n_participants <= 64:
-        n_rounds = 6
-    elif n_participants <= 128:
-        n_rounds = 7
-    else:
-        n_rounds = 8
+    n_rounds = calculate_rounds_from_participants(n_participants)
 
     print(f"   👥 Partecipanti: {n_participants}")
     print(f"   📅 Data: {tournament_date}")
@@ -737,17 +552,9 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
     print(f"   💶 Entry fee: {config['entry_fee']}€")
     print(f"   📦 Pack cost: {config['pack_cost']}€")
 
-    # 3. Calcola punti
-    print(f"\n🧮 Calcolo punti...")
-    df = calculate_tournament_points(df)
-
-    # 4. Identifica categorie
-    print(f"🎯 Identificazione X-0/X-1...")
-    df = identify_record_categories(df, n_rounds)
-
-    # 5. Calcola buoni
-    print(f"💰 Calcolo buoni negozio...")
-    df = calculate_vouchers(df, config)
+    # 3-5. Punti, categorie X-0/X-1 e buoni (scoring.score_results, come il TDF)
+    print(f"\n🧮 Calcolo punti, X-0/X-1 e buoni negozio...")
+    df = score_tournament(df, n_rounds, config)
 
     voucher_info = df.attrs.get('voucher_info', {})
     print(f"   💵 Fondo totale: {voucher_info.get('total_fund', 0)}€")
@@ -781,13 +588,17 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
         datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         df.iloc[0]['User Name']
     ]
-    ws_tournaments.append_row(tournament_row)
+    plan = write_event_rows(ws_tournaments, tournament_id, 0, [tournament_row], 'H', replace)
+    if plan:
+        print(f"      {format_plan('Tournaments', plan)}")
 
     # 7.2 Scrivi nel foglio Results
     print(f"   📊 Foglio Results...")
     ws_results = sheet.worksheet("Results")
+    result_rows = []
     for idx, row in df.iterrows():
         membership = str(row['Membership Number']).zfill(10)
+        match_w = int(row['Match_W'])
         result_row = [
             f"{tournament_id}_{membership}",
             tournament_id,
@@ -798,13 +609,31 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
             float(row['Points_Victory']),
             float(row['Points_Ranking']),
             float(row['Points_Total']),
-            row['User Name']
+            row['User Name'],
+            match_w,                      # Match_W
+            0,                            # Match_T (One Piece: niente pareggi)
+            int(row['Losses']),           # Match_L
+            row.get('OOMW %', ''),        # OOMW_Percent
+            ''                            # H2H (non disponibile dal CSV)
         ]
-        ws_results.append_row(result_row)
+        result_rows.append(result_row)
+    plan = write_event_rows(ws_results, tournament_id, 1, result_rows, 'O', replace)
+    previous_results = None
+    if plan:
+        previous_results = plan['old_rows']   # tolte dai totali Players
+        print(f"      {format_plan('Results', plan)}")
+
+    # Aggregato stats del torneo: al prossimo refresh le pagine stats fondono solo questo
+    if not test_mode:
+        try:
+            store_event(result_rows)
+        except Exception as e:
+            print(f"   ⚠️  Aggregato stats non salvato: {e}")
 
     # 7.3 Scrivi nel foglio Vouchers
     print(f"   📊 Foglio Vouchers...")
     ws_vouchers = sheet.worksheet("Vouchers")
+    voucher_rows = []
     for idx, row in df.head(min(8, n_participants)).iterrows():
         membership = str(row['Membership Number']).zfill(10)
         voucher_row = [
@@ -820,108 +649,38 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
             'DRAFT',
             ''
         ]
-        ws_vouchers.append_row(voucher_row)
+        voucher_rows.append(voucher_row)
+    plan = write_event_rows(ws_vouchers, tournament_id, 1, voucher_rows, 'K', replace)
+    if plan:
+        print(f"      {format_plan('Vouchers', plan)}")
 
     # Aggiungi validazione menu a tendina Status (colonna J, dalla riga 4)
         pass  # Ignora se la libreria non è disponibile
 
-    # 7.4 Aggiorna/crea giocatori nel foglio Players
+    # 7.4 Aggiorna/crea giocatori nel foglio Players: solo i delta del torneo (players.py)
     print(f"   📊 Foglio Players...")
-    ws_players = sheet.worksheet("Players")
-    ws_results = sheet.worksheet("Results")
-    
-    existing_players = ws_players.get_all_values()
-    existing_dict = {row[0]: i for i, row in enumerate(existing_players[3:], start=4) if row}
-    
-    # Calcola statistiche lifetime da Results
-    all_results = ws_results.get_all_values()
-    lifetime_stats = {}
-    
-    for row in all_results[3:]:
-        if not row or len(row) < 10:
-            continue
-        membership = row[2]
-        ranking = int(row[3]) if row[3] else 999
-        win_points = float(row[4]) if row[4] else 0
-        points_total = float(row[8]) if row[8] else 0
-        
-        if membership not in lifetime_stats:
-            lifetime_stats[membership] = {
-                'total_tournaments': 0,
-                'tournament_wins': 0,
-                'match_wins': 0,
-                'total_points': 0
-            }
-        
-        lifetime_stats[membership]['total_tournaments'] += 1
-        if ranking == 1:
-            lifetime_stats[membership]['tournament_wins'] += 1
-        lifetime_stats[membership]['match_wins'] += int(win_points / 3)
-        lifetime_stats[membership]['total_points'] += points_total
-    
-    # Aggiorna o crea giocatori
-    players_to_update = []
-    players_to_add = []
-    
-    for idx, row in df.iterrows():
-        membership = str(row['Membership Number']).zfill(10)
-        display_name = row['User Name']
-        
-        stats = lifetime_stats.get(membership, {
-            'total_tournaments': 0,
-            'tournament_wins': 0,
-            'match_wins': 0,
-            'total_points': 0
-        })
-        
-        if membership in existing_dict:
-            # Aggiorna giocatore esistente
-            row_idx = existing_dict[membership]
-            players_to_update.append({
-                'range': f"D{row_idx}:H{row_idx}",
-                'values': [[
-                    tournament_date,
-                    stats['total_tournaments'],
-                    stats['tournament_wins'],
-                    stats['match_wins'],
-                    stats['total_points']
-                ]]
-            })
-        else:
-            # Nuovo giocatore
-            player_row = [
-                membership,
-                display_name,
-                tournament_date,
-                tournament_date,
-                stats['total_tournaments'],
-                stats['tournament_wins'],
-                stats['match_wins'],
-                stats['total_points']
-            ]
-            players_to_add.append(player_row)
-    
-    # BATCH WRITE - update esistenti (1 chiamata!)
-    if players_to_update:
-        ws_players.batch_update(players_to_update, value_input_option='RAW')
-    
-    # BATCH WRITE - nuovi giocatori (1 chiamata!)
-    if players_to_add:
-        ws_players.append_rows(players_to_add, value_input_option='RAW')
+    updated, added = upsert_players(sheet.worksheet("Players"), result_rows, tournament_date, previous_results)
+    print(f"      {updated} aggiornati, {added} nuovi")
 
     # 7.5 Aggiorna classifica stagionale
     print(f"   📊 Foglio Seasonal_Standings...")
-    update_seasonal_standings(sheet, season_id, df, tournament_date, config)
-
-    # 7.6 Aggiorna Total_Tournaments in Config
-    print(f"   📊 Aggiorna Config...")
-    ws_config = sheet.worksheet("Config")
-    config_data = ws_config.get_all_values()
-    for i, row in enumerate(config_data[4:], start=5):
-        if row and row[0] == season_id:
-            current_count = int(row[5]) if row[5] else 0
-            ws_config.update_cell(i, 6, current_count + 1)
-            break
+    update_seasonal_standings(sheet, season_id, df, tournament_date, config, result_rows)
+
+    # 7.6 Aggiorna Total_Tournaments in Config (un torneo sostituito non conta due volte)
+    if not replace:
+        print(f"   📊 Aggiorna Config...")
+        ws_config = sheet.worksheet("Config")
+        config_data = ws_config.get_all_values()
+        for i, row in enumerate(config_data[4:], start=5):
+            if row and row[0] == season_id:
+                current_count = int(row[5]) if row[5] else 0
+                ws_config.update_cell(i, 6, current_count + 1)
+                break
+
+    # 7.7 Registro import: lo stesso file reimportato diventa un no-op
+    if not test_mode:
+        record(SHEET_ID, tournament_id, digest, csv_filename,
+               rows={'Results': len(result_rows), 'Vouchers': len(voucher_rows)})
 
     print(f"\n✅ IMPORT COMPLETATO!")
     print(f"\n📊 RIASSUNTO:")
@@ -936,6 +695,57 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
     return df
 
 
+# ============================================
+# DRY-RUN
+# ============================================
+
+def run_test(csv_path: str, season_id: str, snapshot: str = None, diff_limit: int = None):
+    """
+    Import completo su un workbook finto (fake_sheet.py) e diff delle celle.
+
+    Args:
+        snapshot: snapshot JSON / cartella CSV del foglio; None = workbook
+            vuoto con la sola riga Config della stagione
+    """
+    from fake_sheet import blank_workbook, format_diff, load_workbook
+
+    sheet = load_workbook(snapshot) if snapshot else blank_workbook(season_id)
+    print(f"📂 Workbook: {sheet.title}")
+    df = import_tournament_to_sheet(sheet, csv_path, season_id, test_mode=True)
+    if df is None:
+        return None
+    print(f"\n🔍 DIFF (nessuna scrittura reale):")
+    print(format_diff(sheet.diff(), diff_limit))
+    print(f"\n📡 API calls simulate: {sheet.calls['read']} letture, {sheet.calls['write']} scritture")
+    return sheet
+
+
+def run_rebuild_players(test_mode: bool = False, snapshot: str = None, diff_limit: int = None):
+    """
+    Riallinea Players a tutto Results (players.rebuild_players).
+
+    Gli import aggiornano Players solo coi delta del torneo: questo comando
+    sistema una volta le righe rimaste sbagliate dai vecchi import.
+    In test mode lavora sullo snapshot (fake_sheet.py) e stampa il diff.
+    """
+    if test_mode:
+        from fake_sheet import format_diff, load_workbook
+
+        if not snapshot:
+            print("❌ --rebuild-players --test richiede --snapshot")
+            return
+        sheet = load_workbook(snapshot)
+    else:
+        print("🔗 Connessione a Google Sheets...")
+        sheet = connect_to_sheet()
+    print(f"📊 Ricostruzione foglio Players da Results ({sheet.title})...")
+    updated, added = rebuild_players(sheet)
+    print(f"   {updated} aggiornati, {added} nuovi")
+    if test_mode:
+        print(f"\n🔍 DIFF (nessuna scrittura reale):")
+        print(format_diff(sheet.diff(), diff_limit))
+
+
 # ============================================
 # MAIN
 # ============================================
@@ -943,14 +753,33 @@ def import_tournament_to_sheet(sheet, csv_path: str, season_id: str):
 def main():
     """Entry point dello script"""
     parser = argparse.ArgumentParser(description='Import tournament CSV to Pulci League')
-    parser.add_argument('--csv', required=True, help='Path to tournament CSV file')
-    parser.add_argument('--season', required=True, help='Season ID (e.g. OP12)')
+    parser.add_argument('--csv', help='Path to tournament CSV file')
+    parser.add_argument('--season', help='Season ID (e.g. OP12)')
     parser.add_argument('--test', action='store_true', help='Test mode (no write to sheet)')
+    parser.add_argument('--snapshot', help='Test mode: snapshot JSON o cartella CSV del foglio '
+                                           '(default: workbook vuoto)')
+    parser.add_argument('--diff-limit', type=int, default=None, help='Test mode: max celle nel diff')
+    parser.add_argument('--force', action='store_true', help='Reimporta anche se il file è identico al già importato')
+    parser.add_argument('--rebuild-players', action='store_true',
+                        help='Ricalcola il foglio Players da tutto Results (una tantum, senza --csv)')
 
     args = parser.parse_args()
 
+    if args.rebuild_players:
+        run_rebuild_players(args.test, args.snapshot, args.diff_limit)
+        return
+    if not args.csv or not args.season:
+        parser.error('--csv e --season sono obbligatori (tranne con --rebuild-players)')
+
     if args.test:
         print("🧪 TEST MODE - Nessuna scrittura su Google Sheets\n")
+        run_test(args.csv, args.season, args.snapshot, args.diff_limit)
+        return
+
+    # File identico già importato: nessuna connessione al foglio
+    if not args.force and already_imported(args.csv, args.season):
+        print(f"✅ {noop_message(SHEET_ID, csv_tournament_id(args.csv, args.season))}")
+        return
 
     # Connetti al foglio
     print("🔗 Connessione a Google Sheets...")
@@ -967,8 +796,9 @@ def main():
 
     # Import torneo
     try:
-        df_result = import_tournament_to_sheet(sheet, args.csv, args.season)
+        df_result = import_tournament_to_sheet(sheet, args.csv, args.season, force=args.force)
         print("\n🎉 TUTTO OK!")
+        print(f"\n📡 API calls:\n   {format_call_stats()}")
 
     except Exception as e:
         print(f"\n❌ ERRORE: {e}")
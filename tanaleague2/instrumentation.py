@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+instrumentation.py - Tempi per richiesta e metriche
+====================================================
+
+- timed("nome")      : context manager / decorator per misurare un blocco
+- Stopwatch          : misura a tappe dentro funzioni lunghe (lap("fase"))
+- init_app(app)      : header Server-Timing, istogrammi latenza per route,
+                       tempo di rendering Jinja, endpoint /metrics (Prometheus)
+
+Attivazione: METRICS_ENABLED = True in config.py oppure variabile
+d'ambiente TANALEAGUE_METRICS=1. Da disattivato ogni misura è un no-op.
+
+Diagnostica avvio worker (import per modulo + init cache):
+    python instrumentation.py --profile-startup
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from functools import wraps
+
+try:
+    from config import METRICS_ENABLED as _CFG_ENABLED
+except Exception:
+    _CFG_ENABLED = False
+
+ENABLED = bool(_CFG_ENABLED) or os.getenv("TANALEAGUE_METRICS", "") not in ("", "0")
+
+# bucket istogramma latenza (secondi)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# finestra mobile per route (ultime N richieste) per i quantili recenti
+RECENT_SAMPLES = 256
+QUANTILES = (0.5, 0.95, 0.99)
+
+_lock = threading.Lock()
+_local = threading.local()
+
+# route -> [conteggi per bucket..., +Inf], somma, numero
+_route_hist = {}
+# route -> ultime RECENT_SAMPLES latenze
+_route_recent = {}
+# nome blocco -> [numero chiamate, secondi totali]
+_span_totals = defaultdict(lambda: [0, 0.0])
+# nome -> valore (stato circuit breaker, ecc.)
+_gauges = {}
+_counters = defaultdict(float)
+
+
+# ============================================
+# MISURE
+# ============================================
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __call__(self, func):
+        return func
+
+
+_NOOP = _NoopTimer()
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_span(self.name, time.perf_counter() - self.start)
+        return False
+
+    def __call__(self, func):
+        name = self.name
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_span(name, time.perf_counter() - start)
+        return wrapper
+
+
+def timed(name):
+    """
+    Misura un blocco o una funzione.
+
+        with timed("sheets.fetch"):
+            ...
+
+        @timed("stats.build")
+        def build_stats(...): ...
+
+    Da disattivato ritorna un oggetto no-op condiviso (i decorator lasciano
+    la funzione originale, senza wrapper).
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Timer(name)
+
+
+class Stopwatch:
+    """
+    Tappe dentro una funzione lunga senza reindentarla:
+
+        sw = Stopwatch("stats")
+        ...blocco...
+        sw.lap("spotlights")
+    """
+    __slots__ = ("prefix", "last")
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.last = time.perf_counter() if ENABLED else 0.0
+
+    def lap(self, name):
+        if not ENABLED:
+            return
+        now = time.perf_counter()
+        record_span(f"{self.prefix}.{name}", now - self.last)
+        self.last = now
+
+
+def record_span(name, seconds):
+    """Registra un blocco misurato (totali globali + Server-Timing della richiesta)."""
+    if not ENABLED:
+        return
+    with _lock:
+        tot = _span_totals[name]
+        tot[0] += 1
+        tot[1] += seconds
+    spans = getattr(_local, "spans", None)
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+def set_gauge(name, value):
+    """Imposta una metrica istantanea (esportata anche da disattivato)."""
+    with _lock:
+        _gauges[name] = float(value)
+
+
+def inc_counter(name, amount=1):
+    """Incrementa un contatore (esportato anche da disattivato)."""
+    with _lock:
+        _counters[name] += amount
+
+
+def observe_request(route, seconds):
+    """Aggiunge una latenza all'istogramma della route."""
+    with _lock:
+        h = _route_hist.get(route)
+        if h is None:
+            h = _route_hist[route] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        for i, b in enumerate(BUCKETS):
+            if seconds <= b:
+                h[0][i] += 1
+                break
+        else:
+            h[0][-1] += 1
+        h[1] += seconds
+        h[2] += 1
+        recent = _route_recent.get(route)
+        if recent is None:
+            recent = _route_recent[route] = deque(maxlen=RECENT_SAMPLES)
+        recent.append(seconds)
+
+
+# ============================================
+# EXPORT
+# ============================================
+
+def _metric_name(name):
+    return "".join(ch if ch.isalnum() else "_" for ch in name).lower()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text():
+    """Tutte le metriche in formato testo Prometheus."""
+    lines = []
+    with _lock:
+        hist = {k: ([c for c in v[0]], v[1], v[2]) for k, v in _route_hist.items()}
+        recent = {k: sorted(v) for k, v in _route_recent.items()}
+        spans = {k: tuple(v) for k, v in _span_totals.items()}
+        gauges = dict(_gauges)
+        counters = dict(_counters)
+
+    lines.append("# HELP tanaleague_request_duration_seconds Latenza richieste HTTP per route")
+    lines.append("# TYPE tanaleague_request_duration_seconds histogram")
+    for route, (counts, total, n) in sorted(hist.items()):
+        cum = 0
+        for b, c in zip(BUCKETS, counts):
+            cum += c
+            lines.append(f'tanaleague_request_duration_seconds_bucket{{route="{_label(route)}",le="{b}"}} {cum}')
+        lines.append(f'tanaleague_request_duration_seconds_bucket{{route="{_label(route)}",le="+Inf"}} {n}')
+        lines.append(f'tanaleague_request_duration_seconds_sum{{route="{_label(route)}"}} {total:.6f}')
+        lines.append(f'tanaleague_request_duration_seconds_count{{route="{_label(route)}"}} {n}')
+
+    lines.append(f"# HELP tanaleague_request_recent_seconds Quantili latenza sulle ultime {RECENT_SAMPLES} richieste")
+    lines.append("# TYPE tanaleague_request_recent_seconds gauge")
+    for route, samples in sorted(recent.items()):
+        for q in QUANTILES:
+            value = samples[min(len(samples) - 1, int(q * len(samples)))]
+            lines.append(f'tanaleague_request_recent_seconds{{route="{_label(route)}",quantile="{q}"}} {value:.6f}')
+
+    lines.append("# HELP tanaleague_span_seconds_total Tempo totale per blocco misurato")
+    lines.append("# TYPE tanaleague_span_seconds_total counter")
+    for name, (n, total) in sorted(spans.items()):
+        lines.append(f'tanaleague_span_seconds_total{{span="{_label(name)}"}} {total:.6f}')
+    lines.append("# TYPE tanaleague_span_calls_total counter")
+    for name, (n, total) in sorted(spans.items()):
+        lines.append(f'tanaleague_span_calls_total{{span="{_label(name)}"}} {n}')
+
+    for name, value in sorted(counters.items()):
+        metric = f"tanaleague_{_metric_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value:g}")
+    for name, value in sorted(gauges.items()):
+        metric = f"tanaleague_{_metric_name(name)}"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _server_timing(spans, total):
+    parts = []
+    seen = defaultdict(int)
+    for name, seconds in spans:
+        key = _metric_name(name)
+        seen[key] += 1
+        if seen[key] > 1:
+            key = f"{key}_{seen[key]}"
+        parts.append(f'{key};dur={seconds * 1000:.1f}')
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ", ".join(parts)
+
+
+# ============================================
+# FLASK
+# ============================================
+
+def init_app(app):
+    """Aggancia misure e /metrics all'app Flask (no-op se disattivato)."""
+    from flask import Response, request, template_rendered, before_render_template
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(prometheus_text(), mimetype="text/plain; version=0.0.4")
+
+    if not ENABLED:
+        return app
+
+    @app.before_request
+    def _start_timing():
+        _local.spans = []
+        _local.start = time.perf_counter()
+
+    @app.after_request
+    def _finish_timing(response):
+        start = getattr(_local, "start", None)
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule is not None else "<404>"
+        observe_request(route, total)
+        response.headers["Server-Timing"] = _server_timing(_local.spans, total)
+        _local.spans = None
+        _local.start = None
+        return response
+
+    def _before_render(sender, template, context, **extra):
+        _local.render_start = time.perf_counter()
+
+    def _after_render(sender, template, context, **extra):
+        start = getattr(_local, "render_start", None)
+        if start is not None:
+            record_span(f"render.{template.name}", time.perf_counter() - start)
+            _local.render_start = None
+
+    before_render_template.connect(_before_render, app, weak=False)
+    template_rendered.connect(_after_render, app, weak=False)
+    return app
+
+
+# ============================================
+# PROFILO AVVIO (--profile-startup)
+# ============================================
+
+def _import_times(module):
+    """[(nome, self_us, cumulativo_us, profondità)] da python -X importtime."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=here)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cum_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # riga di intestazione
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), self_us, cum_us, depth))
+    return rows, proc.returncode, proc.stderr
+
+
+def profile_startup(module="app", top=12):
+    """Stampa il costo di avvio: import per modulo e init della cache."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    rows, code, err = _import_times(module)
+    if code != 0:
+        print(err.strip().splitlines()[-1] if err.strip() else f"import {module} fallito")
+        return 1
+
+    total = next((cum for name, _, cum, _ in rows if name == module), 0)
+    print(f"import {module}: {total / 1000:.1f} ms")
+
+    print("\nModuli del progetto (cumulativo):")
+    local = [r for r in rows if os.path.exists(os.path.join(here, r[0].split('.')[0] + ".py"))]
+    for name, self_us, cum_us, _ in sorted(local, key=lambda r: -r[2]):
+        print(f"  {name:<28} {cum_us / 1000:8.1f} ms  (proprio {self_us / 1000:.1f} ms)")
+
+    print(f"\nLibrerie più pesanti (primo livello, top {top}):")
+    libs = {}
+    for name, _, cum_us, _ in rows:
+        root = name.split('.')[0]
+        if os.path.exists(os.path.join(here, root + ".py")):
+            continue
+        libs[root] = max(libs.get(root, 0), cum_us)
+    for root, cum_us in sorted(libs.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {root:<28} {cum_us / 1000:8.1f} ms")
+
+    # init nel processo corrente: import + primo caricamento cache da file
+    sys.path.insert(0, here)
+    start = time.perf_counter()
+    __import__(module)
+    import_s = time.perf_counter() - start
+    print("\nInit:")
+    print(f"  import {module} (in processo)    {import_s * 1000:8.1f} ms")
+    try:
+        from cache import cache as sheet_cache
+        start = time.perf_counter()
+        sheet_cache.load_from_file()
+        print(f"  SheetCache.load_from_file      {(time.perf_counter() - start) * 1000:8.1f} ms")
+    except Exception as e:
+        print(f"  SheetCache.load_from_file      errore: {e}")
+    lazy = [m for m in ("gspread", "google.oauth2", "requests", "numpy", "pandas") if m in sys.modules]
+    print(f"  librerie pesanti già caricate: {', '.join(lazy) or 'nessuna'}")
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Diagnostica TanaLeague")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Tempo di import per modulo e init all'avvio del worker")
+    parser.add_argument("--module", default="app", help="Modulo da profilare (default: app)")
+    args = parser.parse_args()
+    if args.profile_startup:
+        sys.exit(profile_startup(args.module))
+    parser.print_help()
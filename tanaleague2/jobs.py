@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+jobs.py - Coda di job in-process per i rebuild di cache e stats
+================================================================
+
+I refresh (/api/refresh, /api/stats/refresh/<scope>, /api/stats/rebuild)
+facevano tutto il lavoro dentro la richiesta HTTP: rischio di timeout su
+PythonAnywhere e lavoro doppio con chiamate concorrenti. Qui:
+
+- un solo thread worker esegue i job in ordine (niente rebuild paralleli
+  sullo stesso foglio)
+- submit() ritorna subito il Job; un job identico (stesso tipo e chiave)
+  ancora in coda viene riusato invece di accodarne un altro
+- lo stato (in coda / in corso / finito / errore), l'avanzamento e i tempi
+  si leggono da /api/jobs/<id>
+
+La coda è per processo: con più worker web ognuno ha la sua.
+
+Le print del job (es. gli importer) finiscono in job.log con
+capture_output(job): solo quelle del thread worker, le altre restano su
+stdout.
+
+    job = jobs.submit("stats", "OP12", rebuild_scope, "OP12")
+    jobs.get(job.id).to_dict()
+"""
+
+import itertools
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from instrumentation import inc_counter, record_span, set_gauge
+
+MAX_FINISHED = 200   # job conclusi tenuti in memoria per /api/jobs/<id>
+MAX_LOG_LINES = 2000
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+
+class Job:
+    """Un'unità di lavoro in coda: func(job, *args) può aggiornare job.progress."""
+
+    def __init__(self, job_id, kind, key, func, args):
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.func = func
+        self.args = args
+        self.status = QUEUED
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.coalesced = 0      # richieste identiche assorbite da questo job
+        self.log = []           # righe stampate durante il job (capture_output)
+        self._partial = ''
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def set_progress(self, done, total, detail=None):
+        self.progress = {'done': done, 'total': total, 'detail': detail}
+
+    def write(self, text):
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        self.log.extend(lines)
+        if len(self.log) > MAX_LOG_LINES:
+            del self.log[:len(self.log) - MAX_LOG_LINES]
+        return len(text)
+
+    def flush(self):
+        if self._partial:
+            self.log.append(self._partial)
+            self._partial = ''
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'key': self.key,
+            'status': self.status,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'coalesced': self.coalesced,
+            'log_lines': len(self.log),
+            'wait_s': round((self.started or now) - self.created, 3),
+            'run_s': round((self.finished or now) - self.started, 3) if self.started else None,
+        }
+
+
+class JobQueue:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()   # id -> Job (in coda, in corso, conclusi recenti)
+        self._pending = {}           # (kind, key) -> Job in coda
+        self._ids = itertools.count(1)
+        self._worker = None
+
+    def submit(self, kind, key, func, *args):
+        """Accoda func(job, *args); se un job (kind, key) è ancora in coda ritorna quello."""
+        with self._lock:
+            job = self._pending.get((kind, key))
+            if job is not None:
+                job.coalesced += 1
+                inc_counter("jobs_coalesced")
+                return job
+            job = Job(f"{int(time.time())}-{next(self._ids)}", kind, key, func, args)
+            self._jobs[job.id] = job
+            self._pending[(kind, key)] = job
+            self._ensure_worker()
+        self._queue.put(job)
+        set_gauge("jobs_queued", self._queue.qsize())
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="job-worker", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                # da qui in poi una richiesta identica accoda un job nuovo (dati più recenti)
+                self._pending.pop((job.kind, job.key), None)
+                job.status = RUNNING
+                job.started = time.time()
+            set_gauge("jobs_queued", self._queue.qsize())
+            try:
+                job.result = job.func(job, *job.args)
+                job.status = DONE
+            except Exception as e:
+                job.error = str(e)
+                job.status = ERROR
+                inc_counter("jobs_failed")
+            job.finished = time.time()
+            record_span(f"job.{job.kind}", job.finished - job.started)
+            self._trim()
+            self._queue.task_done()
+
+    def _trim(self):
+        with self._lock:
+            finished = [jid for jid, j in self._jobs.items() if j.status in (DONE, ERROR)]
+            for jid in finished[:max(0, len(finished) - MAX_FINISHED)]:
+                del self._jobs[jid]
+
+
+class _ThreadOutput:
+    """sys.stdout che manda le scritture dei thread registrati al loro job."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.targets = {}   # ident thread -> Job
+
+    def write(self, text):
+        target = self.targets.get(threading.get_ident())
+        return (target or self.fallback).write(text)
+
+    def flush(self):
+        target = self.targets.get(threading.get_ident())
+        (target or self.fallback).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+
+_output_lock = threading.Lock()
+
+
+@contextmanager
+def capture_output(job):
+    """Le print del thread corrente vanno in job.log finché il blocco è attivo."""
+    with _output_lock:
+        if not isinstance(sys.stdout, _ThreadOutput):
+            sys.stdout = _ThreadOutput(sys.stdout)
+        out = sys.stdout
+    out.targets[threading.get_ident()] = job
+    try:
+        yield job
+    finally:
+        out.targets.pop(threading.get_ident(), None)
+        job.flush()
+
+
+jobs = JobQueue()
@@ -4,21 +4,32 @@ parse_pokemon_tdf.py - Pokemon Tournament Import from TDF
 """
 
 import xml.etree.ElementTree as ET
-import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
 import sys
 import argparse
-
-# CONFIG
-SHEET_ID = "19ZF35DTmgZG8v1GfzKE5JmMUTXLo300vuw_AdrgQPFE"  # MODIFICA!
-CREDENTIALS_FILE = "/home/latanadellepulci/tanaleague2/service_account_credentials.json"  # Path PythonAnywhere
+import numpy as np
+import pandas as pd
+from aggregates import store_event
+from import_ledger import file_hash, format_plan, noop_message, record, unchanged, write_event_rows
+from players import upsert_players
+from scoring import score_results
+from sheets_client import format_call_stats, open_spreadsheet
+from standings import update_standings
+from tiebreakers import tiebreakers_by_player
+
+# CONFIG (da config.py come la webapp; i valori qui solo senza config.py)
+try:
+    import config as _config
+except Exception:
+    _config = None
+
+SHEET_ID = getattr(_config, "SHEET_ID", "19ZF35DTmgZG8v1GfzKE5JmMUTXLo300vuw_AdrgQPFE")  # MODIFICA!
+CREDENTIALS_FILE = getattr(_config, "CREDENTIALS_FILE",
+                           "/home/latanadellepulci/tanaleague2/service_account_credentials.json")  # Path PythonAnywhere
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 
 def connect_sheet():
-    creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
-    client = gspread.authorize(creds)
-    return client.open_by_key(SHEET_ID)
+    return open_spreadsheet(SHEET_ID, CREDENTIALS_FILE, scopes=SCOPES)
 
 def parse_tdf(filepath, season_id):
     tree = ET.parse(filepath)
@@ -56,7 +67,11 @@ def parse_tdf(filepath, season_id):
         standings[userid] = place
 
     # Calculate records from matches
-    records = {uid: {'w': 0, 'l': 0, 't': 0, 'opponents': []} for uid in players.keys()}
+    # I match vengono convertiti in array indicizzati per giocatore: record
+    # e tiebreaker si calcolano poi in blocco (vedi tiebreakers.py).
+    uids = list(players.keys())
+    index = {uid: i for i, uid in enumerate(uids)}
+    p1_list, p2_list, outcome_list = [], [], []
     matches_data = []
 
     for round_elem in root.findall('.//rounds/round'):
@@ -77,23 +92,15 @@ def parse_tdf(filepath, season_id):
             p1 = p1_elem.get('userid')
             p2 = p2_elem.get('userid')
 
-            # Track opponents
-            records[p1]['opponents'].append(p2)
-            records[p2]['opponents'].append(p1)
+            p1_list.append(index[p1])
+            p2_list.append(index[p2])
+            outcome_list.append(int(outcome) if outcome and outcome.isdigit() else 0)
 
             # outcome: 1=p1 win, 2=p2 win, 3=tie
             if outcome == '1':
-                records[p1]['w'] += 1
-                records[p2]['l'] += 1
                 winner, loser = p1, p2
             elif outcome == '2':
-                records[p2]['w'] += 1
-                records[p1]['l'] += 1
                 winner, loser = p2, p1
-            elif outcome == '3':
-                records[p1]['t'] += 1
-                records[p2]['t'] += 1
-                winner, loser = None, None
             else:
                 winner, loser = None, None
 
@@ -102,45 +109,45 @@ def parse_tdf(filepath, season_id):
                 match_id = f"{tid}_R{round_num}_{winner}_{loser}"
                 matches_data.append([match_id, tid, round_num, winner, loser, timestamp])
 
-    # Calculate OMW%
-    omw_pct = {}
-    for uid in players.keys():
-        opps = records[uid]['opponents']
-        if not opps:
-            omw_pct[uid] = 0.0
-            continue
-        opp_wins = sum(records[opp]['w'] for opp in opps)
-        opp_total = sum(records[opp]['w'] + records[opp]['l'] + records[opp]['t'] for opp in opps)
-        omw_pct[uid] = (opp_wins / opp_total * 100) if opp_total > 0 else 0.0
-
-    # Calculate points (Pokemon system: W=3, T=1, L=0)
-    results_data = []
-    for uid in players.keys():
-        if uid not in standings:
-            continue
+    p1_idx = np.array(p1_list, dtype=np.intp)
+    p2_idx = np.array(p2_list, dtype=np.intp)
+    outcomes = np.array(outcome_list, dtype=np.int8)
 
-        rank = standings[uid]
-        w, l, t = records[uid]['w'], records[uid]['l'], records[uid]['t']
-        win_points = w * 3 + t * 1
+    # W/L/T, OMW%, OOMW% (minimo 25%) e H2H per tutti i giocatori
+    records = tiebreakers_by_player(uids, p1_idx, p2_idx, outcomes)
 
-        # Points formula
-        n_participants = len(standings)
-        points_victory = win_points / 3
-        points_ranking = n_participants - (rank - 1)
-        points_total = points_victory + points_ranking
+    # Calculate points (Pokemon system: W=3, T=1, L=0), in blocco con scoring.py
+    ranked = [uid for uid in players.keys() if uid in standings]
+    n_rounds = len(root.findall('.//rounds/round'))
+    t = np.array([records[uid]['t'] for uid in ranked], dtype=np.int64)
+    scored = score_results(pd.DataFrame({
+        'rank': [standings[uid] for uid in ranked],
+        'win_points': np.array([records[uid]['w'] for uid in ranked], dtype=np.int64) * 3 + t,
+        'match_t': t,
+        'match_l': [records[uid]['l'] for uid in ranked],
+    }), n_rounds=n_rounds, n_participants=len(standings))
 
+    results_data = []
+    for i, uid in enumerate(ranked):
         result_id = f"{tid}_{uid.zfill(10)}"
+        row = scored.iloc[i]
         results_data.append([
             result_id,
             tid,
             uid.zfill(10),
-            rank,
-            win_points,
-            round(omw_pct[uid], 2),
-            round(points_victory, 2),
-            round(points_ranking, 2),
-            round(points_total, 2),
-            players[uid]
+            standings[uid],
+            int(row['win_points']),
+            records[uid]['omw_aggregate'],   # OMW% storico, come CSV e tornei già importati
+            round(float(row['pv']), 2),
+            round(float(row['pr']), 2),
+            round(float(row['pt']), 2),
+            players[uid],
+            int(row['match_w']),
+            int(row['match_t']),
+            int(row['match_l']),
+            records[uid]['oomw'],
+            records[uid]['h2h'],
+            records[uid]['omw']              # OMW_Official% (minimo 25%)
         ])
 
     # Sort by rank
@@ -151,7 +158,7 @@ def parse_tdf(filepath, season_id):
         season_id,
         date_str,
         len(standings),
-        len(root.findall('.//rounds/round')),
+        n_rounds,
         f"{tournament_name}_{tournament_id}.tdf",
         datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         results_data[0][9] if results_data else ''
@@ -161,89 +168,117 @@ def parse_tdf(filepath, season_id):
         'tournament': tournament_data,
         'results': results_data,
         'matches': matches_data,
-        'players': players
+        'players': players,
+        'hash': file_hash(filepath)
     }
 
-def import_to_sheet(data, test_mode=False):
-    sheet = connect_sheet()
+def import_to_sheet(data, test_mode=False, overwrite=None, force=False, sheet=None):
+    """
+    Scrive il torneo nel foglio.
+
+    overwrite: torneo già importato -> None chiedi da console, True
+    sovrascrivi (righe sostituite una per una), False annulla (import non
+    interattivo, es. upload admin).
+    force: ignora il registro import (reimporta anche un file identico).
+    sheet: spreadsheet già aperto (default: connect_sheet()).
+    Ritorna True se l'import è stato eseguito.
+    """
+    tid = data['tournament'][0]
+    # stesso file già importato: deciso dal registro locale, senza connettersi
+    # (con sovrascrittura richiesta si ricontrolla che sia ancora nel foglio)
+    known = not test_mode and not force and unchanged(SHEET_ID, tid, data.get('hash'))
+    if known and not overwrite:
+        print(f"✅ {noop_message(SHEET_ID, tid)}")
+        return False
+
+    sheet = sheet or connect_sheet()
 
     # Check duplicates
     ws_tournaments = sheet.worksheet("Tournaments")
-    existing = ws_tournaments.col_values(1)[3:]
-    tid = data['tournament'][0]
-
-    if tid in existing:
+    tournaments_rows = ws_tournaments.get_all_values()
+    existing = [row[0] for row in tournaments_rows[3:] if row]
+    replace = tid in existing
+    if known:
+        if replace:
+            print(f"✅ {noop_message(SHEET_ID, tid)}")
+            return False
+        print(f"⚠️  {tid} nel registro import ma non più nel foglio: reimporto")
+
+    if replace:
         print(f"⚠️  Torneo {tid} già importato!")
         if test_mode:
             print("(Test mode - non sovrascrivo)")
-            return
-        resp = input("Sovrascrivere? (y/n): ")
-        if resp.lower() != 'y':
+            return False
+        if overwrite is None:
+            resp = input("Sovrascrivere? (y/n): ")
+            overwrite = resp.lower() == 'y'
+        if not overwrite:
             print("Import annullato.")
-            return
+            return False
 
     print("📊 Importazione Pokemon TDF...")
     if test_mode:
         print("⚠️  TEST MODE - Nessuna scrittura effettiva\n")
 
-    # 1. Tournaments
+    # 1. Tournaments (re-import: righe del torneo sostituite al loro posto)
     if not test_mode:
-        ws_tournaments.append_row(data['tournament'])
+        plan = write_event_rows(ws_tournaments, tid, 0, [data['tournament']], 'H', replace)
+        if plan:
+            print(f"   {format_plan('Tournaments', plan)}")
     print(f"✅ Tournament: {tid}")
 
     # 2. Results (batch)
+    previous_results = None
     if not test_mode:
         ws_results = sheet.worksheet("Results")
+        plan = write_event_rows(ws_results, tid, 1, data['results'], 'P', replace)
+        if plan:
+            previous_results = plan['old_rows']
+            print(f"   {format_plan('Results', plan)}")
         if data['results']:
-            ws_results.append_rows(data['results'])
+            # Aggregato stats del torneo (fuso nelle pagine stats al prossimo refresh)
+            try:
+                store_event(data['results'])
+            except Exception as e:
+                print(f"⚠️  Aggregato stats non salvato: {e}")
     print(f"✅ Results: {len(data['results'])} giocatori")
 
     # 3. Matches (batch)
     if not test_mode:
         ws_matches = sheet.worksheet("Pokemon_Matches")
-        if data['matches']:
-            ws_matches.append_rows(data['matches'])
+        plan = write_event_rows(ws_matches, tid, 1, data['matches'], 'F', replace)
+        if plan:
+            print(f"   {format_plan('Pokemon_Matches', plan)}")
     print(f"✅ Matches: {len(data['matches'])} match")
 
-    # 4. Update Players
-    if not test_mode:
-        ws_players = sheet.worksheet("Players")
-        existing_players = ws_players.col_values(1)[3:]
-        new_players = []
-
-        for uid, name in data['players'].items():
-            uid_padded = uid.zfill(10)
-            if uid_padded not in existing_players:
-                new_players.append([
-                    uid_padded,
-                    name,
-                    data['tournament'][2],  # first_seen
-                    data['tournament'][2],  # last_seen
-                    1,  # tournaments
-                    0,  # wins
-                    0,  # match_wins
-                    0   # total_points
-                ])
-
-        if new_players:
-            ws_players.append_rows(new_players)
-        print(f"✅ Players: {len(new_players)} nuovi")
-    else:
-        # Test mode - simulate
-        new_count = sum(1 for uid in data['players'].keys() if uid.zfill(10) not in [])
-        print(f"✅ Players: {len(data['players'])} totali")
+    # 4. Players: upsert con statistiche lifetime (1 lettura + 1-2 scritture, players.py)
+    updated, added = upsert_players(sheet.worksheet("Players"), data['results'], data['tournament'][2],
+                                    previous_results, write=not test_mode)
+    print(f"✅ Players: {updated} aggiornati, {added} nuovi")
+
+    # 5. Classifica stagionale (incrementale, solo righe cambiate)
+    season_id = data['tournament'][1]
+    summary = update_standings(sheet, season_id, tid, data['results'],
+                               tournaments_rows=tournaments_rows, write=not test_mode)
+    print(f"✅ Seasonal_Standings: {summary['updated']} aggiornati, {summary['added']} nuovi "
+          f"(tornei {summary['n_tournaments']}, contano max {summary['max_counted']})")
 
     if test_mode:
         print("\n⚠️  TEST COMPLETATO - Nessun dato scritto")
     else:
+        # registro import: lo stesso file reimportato diventa un no-op
+        record(SHEET_ID, tid, data.get('hash'), data['tournament'][5],
+               rows={'Results': len(data['results']), 'Pokemon_Matches': len(data['matches'])})
         print("\n🎉 IMPORT COMPLETATO!")
-    print(f"API calls: {0 if test_mode else 4}")
+    print(f"API calls: {format_call_stats()}")
+    return True
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Import Pokemon tournament from TDF file')
     parser.add_argument('--tdf', required=True, help='Path to .tdf file')
     parser.add_argument('--season', required=True, help='Season ID (es: PKM-FS25)')
     parser.add_argument('--test', action='store_true', help='Test mode (no write)')
+    parser.add_argument('--force', action='store_true', help='Reimporta anche se il file è identico al già importato')
 
     args = parser.parse_args()
 
@@ -251,4 +286,4 @@ if __name__ == "__main__":
     print(f"📅 Season: {args.season}\n")
 
     data = parse_tdf(args.tdf, args.season)
-    import_to_sheet(data, test_mode=args.test)
+    import_to_sheet(data, test_mode=args.test, force=args.force)
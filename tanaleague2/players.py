@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+players.py - Statistiche lifetime del foglio Players, incrementali
+===================================================================
+
+Motore condiviso dagli import (CSV One Piece e TDF Pokemon): invece di
+rileggere tutto Results e ricalcolare i totali di ogni giocatore, si
+sommano ai valori già nel foglio i soli delta del torneo importato.
+
+- torneo nuovo: +1 torneo, +1 vittoria al primo, + match vinti, + punti
+- re-import: prima si tolgono le righe Results sostituite (plan['old_rows']
+  di write_event_rows), poi si aggiungono quelle nuove
+- 1 lettura di Players, 1 batch_update + eventuale append
+
+First_Seen / Last_Seen si possono solo allargare: un giocatore tolto da un
+re-import conserva le date (i totali invece tornano esatti).
+
+Le righe Results in ingresso hanno il layout del foglio (schema.LAYOUTS) e
+sono lette con schema.decoder("Results"). Le righe scritte prima di Match_W
+(colonna K vuota) contano int(Win_Points / 3) match vinti, come in
+standings._result_fields.
+
+rebuild_players ricalcola invece tutto da Results: serve una volta per
+riallineare righe Players rimaste sbagliate (es. dal vecchio import TDF),
+poi i delta le tengono allineate.
+
+Layout righe Players (A..H, dalla riga 4):
+Membership | Nome | First_Seen | Last_Seen | Tornei | Vittorie torneo |
+Match vinti | Punti totali
+"""
+
+from schema import HEADER_ROWS, decode_rows, decoder, to_float as _num, to_int
+
+_decode_result = decoder("Results")
+
+
+def _new_delta():
+    return {'name': '', 'tournaments': 0, 'wins': 0, 'match_wins': 0, 'points': 0}
+
+
+def _add(d, row, sign):
+    """Somma (sign=1) o toglie (sign=-1) il contributo di una riga Results decodificata."""
+    match_wins = row['match_w'] if row['match_w'] is not None else int(row['win_points'] / 3)
+    d['name'] = row['name'] or d['name']
+    d['tournaments'] += sign
+    d['wins'] += sign if row['rank'] == 1 else 0
+    d['match_wins'] += sign * match_wins
+    d['points'] = round(d['points'] + sign * row['pt'], 2)
+
+
+def player_deltas(results, previous_rows=None):
+    """
+    Incrementi lifetime per giocatore dalle righe Results di un torneo.
+
+    Args:
+        results: righe Results del torneo importato
+        previous_rows: righe Results dello stesso torneo già nel foglio
+            (re-import): il loro contributo viene tolto
+
+    Returns:
+        {membership: {'name', 'tournaments', 'wins', 'match_wins', 'points'}}
+    """
+    deltas = {}
+    for sign, rows in ((-1, previous_rows or []), (1, results)):
+        for row in rows:
+            r = _decode_result(row)
+            _add(deltas.setdefault(r['membership'], _new_delta()), r, sign)
+    return deltas
+
+
+def plan_players_upsert(existing_rows, results, date_str, previous_rows=None):
+    """
+    Calcola l'upsert del foglio Players: somma i delta del torneo ai valori
+    esistenti e prepara i giocatori nuovi.
+
+    Args:
+        existing_rows: ws.get_all_values() del foglio Players (header inclusi)
+        results: righe Results del torneo importato
+        date_str: data del torneo (YYYY-MM-DD), per First_Seen / Last_Seen
+        previous_rows: righe Results del torneo sostituito (re-import)
+
+    Returns:
+        (updates, new_rows): updates per ws.batch_update, righe per append_rows
+    """
+    # indice membership -> riga foglio, costruito una volta sola
+    index = {row[0]: i for i, row in enumerate(existing_rows[HEADER_ROWS:], start=HEADER_ROWS + 1)
+             if row and row[0]}
+
+    updates = []
+    new_rows = []
+    for membership, d in player_deltas(results, previous_rows).items():
+        if membership in index:
+            row_idx = index[membership]
+            row = existing_rows[row_idx - 1] + [''] * 8
+            first_seen = min(filter(None, [row[2], date_str]))
+            last_seen = max(filter(None, [row[3], date_str]))
+            updates.append({
+                'range': f"C{row_idx}:H{row_idx}",
+                'values': [[
+                    first_seen,
+                    last_seen,
+                    to_int(row[4]) + d['tournaments'],
+                    to_int(row[5]) + d['wins'],
+                    to_int(row[6]) + d['match_wins'],
+                    round(_num(row[7]) + d['points'], 2)
+                ]]
+            })
+        elif d['tournaments'] > 0:
+            new_rows.append([
+                membership,
+                d['name'],
+                date_str,  # first_seen
+                date_str,  # last_seen
+                d['tournaments'],
+                d['wins'],
+                d['match_wins'],
+                d['points']
+            ])
+    return updates, new_rows
+
+
+def upsert_players(ws, results, date_str, previous_rows=None, write=True):
+    """
+    Aggiorna il foglio Players con un torneo (1 lettura + 1-2 scritture).
+
+    Returns:
+        (aggiornati, nuovi)
+    """
+    updates, new_rows = plan_players_upsert(ws.get_all_values(), results, date_str, previous_rows)
+    if write:
+        if updates:
+            ws.batch_update(updates, value_input_option='RAW')
+        if new_rows:
+            ws.append_rows(new_rows, value_input_option='RAW')
+    return len(updates), len(new_rows)
+
+
+# ============================================
+# RICOSTRUZIONE COMPLETA
+# ============================================
+
+def plan_players_rebuild(existing_rows, results_grid):
+    """
+    Totali lifetime ricalcolati da tutto Results, confrontati col foglio Players.
+
+    Args:
+        existing_rows: ws.get_all_values() del foglio Players (header inclusi)
+        results_grid: ws.get_all_values() del foglio Results (header inclusi)
+
+    Returns:
+        (updates, new_rows): solo le righe Players che cambiano, più i
+        giocatori presenti in Results ma non in Players. Chi non ha più
+        righe Results resta in Players con i totali a zero.
+    """
+    totals = {}
+    seen = {}
+    for r in decode_rows("Results", results_grid, decode=decoder("Results")):
+        _add(totals.setdefault(r['membership'], _new_delta()), r, 1)
+        if r['date'] is not None:
+            day = r['date'].strftime('%Y-%m-%d')
+            first, last = seen.get(r['membership'], (day, day))
+            seen[r['membership']] = (min(first, day), max(last, day))
+
+    updates = []
+    listed = set()
+    for row_idx, row in enumerate(existing_rows[HEADER_ROWS:], start=HEADER_ROWS + 1):
+        if not row or not row[0]:
+            continue
+        row = list(row) + [''] * 8
+        listed.add(row[0])
+        d = totals.get(row[0], _new_delta())
+        first_seen, last_seen = seen.get(row[0], (row[2], row[3]))
+        values = [first_seen, last_seen, d['tournaments'], d['wins'], d['match_wins'], d['points']]
+        current = [row[2], row[3], to_int(row[4]), to_int(row[5]), to_int(row[6]), round(_num(row[7]), 2)]
+        if values != current:
+            updates.append({'range': f"C{row_idx}:H{row_idx}", 'values': [values]})
+
+    new_rows = [[membership, d['name'], *seen.get(membership, ('', '')),
+                 d['tournaments'], d['wins'], d['match_wins'], d['points']]
+                for membership, d in totals.items() if membership not in listed]
+    return updates, new_rows
+
+
+def rebuild_players(sheet, write=True):
+    """
+    Riallinea il foglio Players a tutto Results (2 letture + 1-2 scritture).
+
+    Returns:
+        (aggiornati, nuovi)
+    """
+    ws_players = sheet.worksheet("Players")
+    results_grid = sheet.worksheet("Results").get_all_values()
+    updates, new_rows = plan_players_rebuild(ws_players.get_all_values(), results_grid)
+    if write:
+        if updates:
+            ws_players.batch_update(updates, value_input_option='RAW')
+        if new_rows:
+            ws_players.append_rows(new_rows, value_input_option='RAW')
+    return len(updates), len(new_rows)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+records.py - Record compatti per Results e classifiche
+=======================================================
+
+Con tutto lo storico in memoria in ogni worker, un dict per riga costa
+parecchio (tabella hash + chiavi per riga) e nome/membership/tid sono
+ripetuti migliaia di volte. Qui:
+
+- classi con __slots__ (niente __dict__ per istanza)
+- stringhe ripetute internate (sys.intern): una sola copia per processo
+- accesso sia ad attributo (r.name, come nei template Jinja) sia a
+  mapping (r["name"], r.get("name"), dict(r)) per il codice esistente
+
+Benchmark memoria per riga, dict contro record:
+    python records.py --bench 20000
+"""
+
+import sys
+from datetime import datetime
+
+
+class Record:
+    """Base con accesso tipo dict sopra gli __slots__ della sottoclasse."""
+    __slots__ = ()
+    _fields = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return [getattr(self, f) for f in self._fields]
+
+    def items(self):
+        return [(f, getattr(self, f)) for f in self._fields]
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in self._fields}
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self._fields == other._fields and self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        inner = ", ".join(f"{f}={getattr(self, f)!r}" for f in self._fields)
+        return f"{type(self).__name__}({inner})"
+
+    @classmethod
+    def from_values(cls, columns, row):
+        """Record da una riga di tabella con intestazione (ordine colonne libero)."""
+        if tuple(columns) == cls._fields:
+            return cls(*row)
+        known = dict(zip(columns, row))
+        return cls(**{f: known.get(f) for f in cls._fields})
+
+
+def make_record(name, fields, intern_fields=()):
+    """
+    Crea una classe Record con __slots__ e un __init__ generato (come
+    namedtuple): niente setattr in ciclo, stringhe internate dove indicato.
+    """
+    fields = tuple(fields)
+    args = ", ".join(fields)
+    body = "\n".join(
+        f"    self.{f} = _intern({f}) if {f}.__class__ is str else {f}" if f in intern_fields
+        else f"    self.{f} = {f}"
+        for f in fields
+    )
+    env = {'_intern': sys.intern}
+    exec(f"def __init__(self, {args}):\n{body}\n", env)
+    return type(name, (Record,), {'__slots__': fields, '_fields': fields,
+                                  '__init__': env['__init__'], '__module__': __name__})
+
+
+STANDING_FIELDS = ('position', 'membership', 'name', 'points', 'tournaments_played',
+                   'tournaments_counted', 'total_wins', 'match_wins', 'best_rank', 'top8_count')
+
+RESULT_FIELDS = ('tid', 'season_id', 'membership', 'name', 'rank', 'win_points', 'omw', 'oomw',
+                 'h2h', 'pv', 'pr', 'pt', 'date')
+
+ResultRecord = make_record('ResultRecord', RESULT_FIELDS,
+                           intern_fields=('tid', 'season_id', 'membership', 'name'))
+
+StandingRecord = make_record('StandingRecord', STANDING_FIELDS,
+                             intern_fields=('membership', 'name'))
+
+
+# ============================================
+# BENCHMARK (--bench)
+# ============================================
+
+def _bench_rows(n):
+    """Righe Results sintetiche: 40 giocatori su n/30 tornei, stringhe nuove per riga
+    (come arrivano da JSON / API)."""
+    for i in range(n):
+        t, p = divmod(i, 30)
+        tid = "".join(f"OP12_2025-{1 + t % 12:02d}-{1 + t % 28:02d}")
+        yield (tid, tid.split('_')[0], str(p % 40).zfill(10), f"Giocatore {p % 40}", p + 1,
+               float(3 * (p % 4)), 55.5, None, 0, 3.0, 4.0, 7.0, datetime(2025, 1, 1))
+
+
+def bench(n=20000):
+    """Stampa i byte per riga (tracemalloc) con dict e con ResultRecord."""
+    import tracemalloc
+
+    out = {}
+    for label, build in (("dict", lambda r: dict(zip(RESULT_FIELDS, r))),
+                         ("ResultRecord", lambda r: ResultRecord(*r))):
+        tracemalloc.start()
+        built = [build(r) for r in _bench_rows(n)]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        out[label] = size / n
+        del built
+    for label, per_row in out.items():
+        print(f"{label:<14} {per_row:8.1f} byte/riga")
+    print(f"risparmio      {100 * (1 - out['ResultRecord'] / out['dict']):7.1f} %")
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record compatti TanaLeague")
+    parser.add_argument("--bench", type=int, nargs='?', const=20000, metavar="N",
+                        help="Confronta la memoria per riga dict vs record (default 20000 righe)")
+    args = parser.parse_args()
+    if args.bench:
+        bench(args.bench)
+    else:
+        parser.print_help()
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+schema.py - Layout dei fogli e decoder tipizzati
+=================================================
+
+Un solo posto che descrive le colonne di ogni worksheet e il loro tipo.
+Per ogni layout il decoder riga viene generato UNA volta (come fa
+collections.namedtuple) e trasforma la griglia di get_all_values() in
+record tipizzati in un solo passaggio:
+
+    from schema import decode_rows
+    results = decode_rows("Results", ws.get_all_values())
+    results[0]['rank'], results[0]['date']
+
+Tipi:
+    str         testo così com'è
+    int/float   numeri con virgola italiana, '%' finale, celle vuote -> default
+    membership  Membership a 10 cifre (zfill)
+    date        data; il formato si riconosce sul primo valore della colonna
+                e si riusa (si riprova il riconoscimento solo se cambia)
+    tid_date    data dal suffisso del Tournament_ID (OP12_2025-06-12)
+    tid_season  stagione dal prefisso del Tournament_ID (OP12)
+
+Più colonne possono leggere la stessa cella (tid, date e season_id
+leggono tutte la colonna B di Results).
+"""
+
+from datetime import datetime
+
+HEADER_ROWS = 3
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y%m%d', '%d/%m/%Y', '%d%m%Y', '%Y.%m.%d', '%Y/%m/%d')
+
+
+# ============================================
+# CONVERTITORI
+# ============================================
+
+def to_int(value, default=0):
+    """Intero da cella: '3', '3.0', '3,0', '' -> default."""
+    if value == '' or value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return int(float(str(value).strip().rstrip('%').replace(',', '.')))
+    except (TypeError, ValueError):
+        return default
+
+
+def to_float(value, default=0.0):
+    """Float da cella: '0,625', '62.5%', '' -> default."""
+    if value == '' or value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(str(value).strip().rstrip('%').replace(',', '.'))
+    except (TypeError, ValueError):
+        return default
+
+
+def to_membership(value, default=''):
+    value = str(value).strip()
+    return value.zfill(10) if value else default
+
+
+class DateParser:
+    """
+    Parser date per una colonna: il formato trovato sul primo valore viene
+    riusato per gli altri; i valori già visti (es. stesso torneo su 30 righe)
+    non vengono riletti.
+    """
+
+    def __init__(self, formats=DATE_FORMATS, source=None):
+        self.formats = formats
+        self.fmt = None
+        self.source = source   # None = valore intero, 'tid' = suffisso Tournament_ID
+        self._memo = {}
+
+    def __call__(self, value, default=None):
+        if not value:
+            return default
+        try:
+            return self._memo[value]
+        except KeyError:
+            pass
+        text = value.split('_', 1)[1] if self.source == 'tid' and '_' in value else value
+        parsed = default
+        if self.source != 'tid' or '_' in value:
+            parsed = self._parse(text.strip(), default)
+        self._memo[value] = parsed
+        return parsed
+
+    def _parse(self, text, default):
+        if self.fmt is not None:
+            try:
+                return datetime.strptime(text, self.fmt)
+            except ValueError:
+                pass
+        for fmt in self.formats:
+            try:
+                parsed = datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+            self.fmt = fmt
+            return parsed
+        return default
+
+
+def tid_season(value, default=''):
+    value = str(value)
+    return value.split('_', 1)[0] if value else default
+
+
+def _str(value, default=''):
+    return value if value != '' else default
+
+
+# ============================================
+# LAYOUT
+# ============================================
+
+class Column:
+    __slots__ = ('name', 'index', 'type', 'default')
+
+    def __init__(self, name, index, type='str', default=''):
+        self.name = name
+        self.index = index
+        self.type = type
+        self.default = default
+
+
+def _cols(*spec):
+    return tuple(Column(*s) for s in spec)
+
+
+LAYOUTS = {
+    # Result_ID | Tournament_ID | Membership | Ranking | Win_Points | OMW% |
+    # Points_Victory | Points_Ranking | Points_Total | Display_Name |
+    # Match_W | Match_T | Match_L | OOMW% | H2H | OMW_Official%
+    # (OMW% = formula aggregata storica; OMW_Official% = regola Pokemon col minimo 25%, solo TDF)
+    'Results': _cols(
+        ('result_id', 0),
+        ('tid', 1),
+        ('season_id', 1, 'tid_season'),
+        ('date', 1, 'tid_date', None),
+        ('membership', 2, 'membership'),
+        ('rank', 3, 'int', 999),
+        ('win_points', 4, 'float', 0.0),
+        ('omw', 5, 'float', 0.0),
+        ('pv', 6, 'float', 0.0),
+        ('pr', 7, 'float', 0.0),
+        ('pt', 8, 'float', 0.0),
+        ('name', 9),
+        ('match_w', 10, 'int', None),
+        ('match_t', 11, 'int', None),
+        ('match_l', 12, 'int', None),
+        ('oomw', 13, 'float', None),
+        ('h2h', 14, 'int', 0),
+        ('omw_official', 15, 'float', None),
+    ),
+    # Tournament_ID | Season_ID | Date | Participants | Rounds | Source | Imported_At | Winner
+    'Tournaments': _cols(
+        ('id', 0),
+        ('season_id', 1),
+        ('date', 2),
+        ('participants', 3, 'int', 0),
+        ('rounds', 4, 'int', 0),
+        ('source', 5),
+        ('imported_at', 6),
+        ('winner', 7),
+    ),
+    # Season_ID | Membership | Nome | Punti | Giocati | Contati | Vittorie torneo |
+    # Match vinti | Miglior rank | Top8 | Posizione
+    'Seasonal_Standings': _cols(
+        ('season_id', 0),
+        ('membership', 1),
+        ('name', 2),
+        ('points', 3, 'float', 0.0),
+        ('tournaments_played', 4, 'int', 0),
+        ('tournaments_counted', 5, 'int', 0),
+        ('total_wins', 6, 'int', 0),
+        ('match_wins', 7, 'int', 0),
+        ('best_rank', 8, 'int', 999),
+        ('top8_count', 9, 'int', 0),
+        ('position', 10, 'int', None),
+    ),
+    # Membership | Name | First_Seen | Last_Seen | Tournaments | Tournament_Wins |
+    # Match_Wins | Total_Points
+    'Players': _cols(
+        ('membership', 0),
+        ('name', 1),
+        ('first_seen', 2),
+        ('last_seen', 3),
+        ('tournaments', 4, 'int', 0),
+        ('wins', 5, 'int', 0),
+        ('match_wins', 6, 'int', 0),
+        ('points', 7, 'float', 0.0),
+    ),
+}
+# PROV e FINAL hanno lo stesso layout
+LAYOUTS['Seasonal_Standings_PROV'] = LAYOUTS['Seasonal_Standings']
+LAYOUTS['Seasonal_Standings_FINAL'] = LAYOUTS['Seasonal_Standings']
+
+# righe da scartare: la cella di questa colonna deve essere valorizzata
+REQUIRED = {
+    'Results': 1,                   # Tournament_ID
+    'Tournaments': 0,
+    'Seasonal_Standings': 0,
+    'Seasonal_Standings_PROV': 0,
+    'Seasonal_Standings_FINAL': 0,
+    'Players': 0,
+}
+
+
+# ============================================
+# DECODER GENERATI
+# ============================================
+
+_SIMPLE = {'str': _str, 'int': to_int, 'float': to_float,
+           'membership': to_membership, 'tid_season': tid_season}
+
+
+def _converter(column):
+    if column.type == 'date':
+        return DateParser()
+    if column.type == 'tid_date':
+        return DateParser(source='tid')
+    return _SIMPLE[column.type]
+
+
+def compile_decoder(columns):
+    """
+    Genera una funzione riga -> dict per il layout. Le date hanno un
+    DateParser nuovo per ogni decoder (formato riconosciuto per colonna).
+    """
+    env = {}
+    items = []
+    for i, col in enumerate(columns):
+        env[f'c{i}'] = _converter(col)
+        env[f'd{i}'] = col.default
+        items.append(f"{col.name!r}: c{i}(row[{col.index}], d{i}) if n > {col.index} else d{i}")
+    src = "def decode(row):\n    n = len(row)\n    return {" + ", ".join(items) + "}\n"
+    exec(src, env)
+    return env['decode']
+
+
+def decoder(layout):
+    """Decoder nuovo (con il suo stato date) per un layout di LAYOUTS."""
+    return compile_decoder(LAYOUTS[layout])
+
+
+def decode_rows(layout, grid, header_rows=HEADER_ROWS, decode=None):
+    """
+    Griglia get_all_values() -> lista di record tipizzati.
+
+    Args:
+        layout: nome in LAYOUTS (es. "Results")
+        grid: righe del foglio, intestazioni comprese
+        header_rows: righe da saltare (0 se la griglia è già senza intestazioni)
+        decode: decoder già compilato da riusare (default: uno nuovo)
+    """
+    decode = decode or decoder(layout)
+    index = REQUIRED[layout]
+    return [decode(row) for row in grid[header_rows:] if len(row) > index and row[index] != '']
+
+
+def decode_columns(layout, grid, header_rows=HEADER_ROWS):
+    """Come decode_rows ma per colonne: {nome: [valori...]}."""
+    records = decode_rows(layout, grid, header_rows)
+    return {col.name: [r[col.name] for r in records] for col in LAYOUTS[layout]}
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+scoring.py - Punti, record, categorie e buoni di un torneo (vettoriale)
+=======================================================================
+
+Un solo posto per le regole di punteggio: import_tournament.py (CSV One
+Piece) e parse_pokemon_tdf.py (TDF Pokemon) passano entrambi da
+score_results(), come i backfill:
+
+- round Swiss dal numero di partecipanti
+- Punti Vittoria = Win Points / 3, Punti Ranking = N - (Ranking - 1)
+- record W-L e categoria X-0 / X-1 / OTHER
+- buoni negozio della top 8 (fondo - buste, 2€ agli OTHER, il resto a
+  X-0 / X-1 in rapporto x0_ratio : x1_ratio, arrotondato a `rounding`)
+
+Tutto lavora su colonne intere (numpy / pandas), senza loop per giocatore.
+score_results() accetta un frame normalizzato:
+
+    rank, win_points            obbligatorie
+    match_t                     pareggi (default 0)
+    match_l                     sconfitte note (TDF); altrimenti n_rounds - vittorie
+    tid                         più tornei nello stesso frame (backfill): N,
+                                top 8 e buoni si calcolano per torneo
+
+    scored = score_results(frame, n_rounds=5, config=season_config)
+    scored[['pv', 'pr', 'pt', 'record', 'category', 'voucher']]
+
+Verifica contro il calcolo originale (loop per giocatore) su tornei casuali:
+    python scoring.py --verify
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+# round Swiss: fino a 8 giocatori 3 round, fino a 16 4, ... oltre 128 8
+ROUND_LIMITS = np.array([8, 16, 32, 64, 128])
+MIN_ROUNDS = 3
+
+TOP_SIZE = 8          # giocatori premiati con buono
+OTHERS_VOUCHER = 2.0  # buono fisso per gli OTHER in top 8
+
+VOUCHER_DEFAULTS = {'entry_fee': 5.0, 'pack_cost': 6.0, 'x0_ratio': 1.90, 'x1_ratio': 1.00, 'rounding': 0.50}
+
+
+# ============================================
+# REGOLE (colonne)
+# ============================================
+
+def rounds_for(n_participants):
+    """Round Swiss per numero di partecipanti (scalare o array)."""
+    rounds = MIN_ROUNDS + np.searchsorted(ROUND_LIMITS, n_participants, side='left')
+    return int(rounds) if np.ndim(rounds) == 0 else rounds
+
+
+def tournament_points(rank, win_points, n_participants=None):
+    """
+    Punti vittoria, ranking e totali.
+
+    Args:
+        n_participants: N del torneo (scalare o array per riga); default len(rank)
+
+    Returns:
+        (pv, pr, pt) array float
+    """
+    rank = np.asarray(rank, dtype=float)
+    win_points = np.asarray(win_points, dtype=float)
+    n = len(rank) if n_participants is None else np.asarray(n_participants, dtype=float)
+    pv = win_points / 3
+    pr = n - (rank - 1)
+    return pv, pr, pv + pr
+
+
+def match_records(win_points, n_rounds, ties=0, losses=None):
+    """
+    Vittorie, sconfitte, stringa record ("4-1") e categoria X-0 / X-1 / OTHER.
+
+    Senza `losses` (CSV Bandai, niente match) le sconfitte sono
+    n_rounds - Win Points / 3, come nel foglio storico.
+    """
+    win_points = np.asarray(win_points, dtype=float)
+    ties = np.asarray(ties, dtype=float)
+    wins = (win_points - ties) / 3
+    if losses is None:
+        losses = np.asarray(n_rounds, dtype=float) - wins
+    else:
+        losses = np.asarray(losses, dtype=float)
+    category = np.select([losses == 0, losses == 1], ['X-0', 'X-1'], 'OTHER')
+    record = (pd.Series(np.trunc(wins).astype(np.int64)).astype(str) + '-'
+              + pd.Series(np.trunc(losses).astype(np.int64)).astype(str)).to_numpy()
+    return wins, losses, record, category
+
+
+def voucher_amounts(category, event, config):
+    """
+    Buoni negozio per riga (0 fuori dalla top 8 del proprio torneo).
+
+    Args:
+        category: array categorie, righe di ogni torneo in ordine di classifica
+        event: array chiave torneo per riga (tutti uguali = un torneo)
+        config: entry_fee, pack_cost, x0_ratio, x1_ratio, rounding
+
+    Returns:
+        (amounts, info) - info: DataFrame per torneo (fondo, buste, distribuito, ...)
+    """
+    cfg = {**VOUCHER_DEFAULTS, **{k: v for k, v in (config or {}).items() if k in VOUCHER_DEFAULTS}}
+    category = pd.Series(np.asarray(category), dtype=object)
+    groups = pd.Series(np.asarray(event)).reset_index(drop=True)
+    by_event = category.groupby(groups, sort=False)
+
+    n = by_event.transform('size').to_numpy(dtype=float)
+    top = by_event.cumcount().to_numpy() < TOP_SIZE
+    is_x0 = (category == 'X-0').to_numpy()
+    is_x1 = (category == 'X-1').to_numpy()
+    is_other = ~(is_x0 | is_x1)
+
+    def per_event(mask):
+        return pd.Series(mask & top).groupby(groups, sort=False).transform('sum').to_numpy(dtype=float)
+
+    n_x0, n_x1, n_others = per_event(is_x0), per_event(is_x1), per_event(is_other)
+
+    total_fund = n * cfg['entry_fee']
+    packs_cost = np.floor(n / 3) * cfg['pack_cost']
+    remaining = total_fund - packs_cost
+    remaining_for_top = remaining - n_others * OTHERS_VOUCHER
+
+    divisor = n_x0 * cfg['x0_ratio'] + n_x1 * cfg['x1_ratio']
+    base = np.divide(remaining_for_top, divisor, out=np.zeros_like(divisor), where=divisor > 0)
+    rounding = cfg['rounding']
+    x0_amount = np.round(base * cfg['x0_ratio'] / rounding) * rounding
+    x1_amount = np.round(base * cfg['x1_ratio'] / rounding) * rounding
+
+    amounts = np.where(top, np.select([is_x0, is_x1], [x0_amount, x1_amount], OTHERS_VOUCHER), 0.0)
+
+    first = ~groups.duplicated().to_numpy()
+    info = pd.DataFrame({
+        'total_fund': total_fund[first],
+        'packs_cost': packs_cost[first],
+        'remaining': remaining[first],
+        'total_distributed': pd.Series(amounts).groupby(groups, sort=False).sum().to_numpy(),
+        'n_x0': n_x0[first].astype(int),
+        'n_x1': n_x1[first].astype(int),
+        'n_others': n_others[first].astype(int),
+    }, index=groups[first].to_numpy())
+    info['leftover'] = info['remaining'] - info['total_distributed']
+    return amounts, info
+
+
+def info_row(info, i=0):
+    """Riga i del DataFrame info di voucher_amounts come dict di scalari Python."""
+    return {col: info[col].iloc[i].item() for col in info.columns}
+
+
+# ============================================
+# FRAME COMPLETO
+# ============================================
+
+def score_results(frame, n_rounds=None, config=None, n_participants=None):
+    """
+    Punti, record, categorie (e buoni se c'è `config`) per tutte le righe.
+
+    Args:
+        frame: colonne rank, win_points [, match_t, match_l, tid], righe di
+            ogni torneo in ordine di classifica
+        n_rounds: round del torneo (scalare o colonna); default da N partecipanti
+        config: config stagione per i buoni (None = niente buoni)
+        n_participants: N del torneo se diverso dalle righe del frame
+            (TDF: giocatori in classifica); default righe per torneo
+
+    Returns:
+        copia del frame con pv, pr, pt, match_w, match_t, match_l, record,
+        category [, voucher]; attrs['voucher_info'] = dict (un torneo) o
+        DataFrame per tid
+    """
+    out = frame.reset_index(drop=True)
+    event = out['tid'].to_numpy() if 'tid' in out else np.zeros(len(out), dtype=np.int8)
+    n = out.groupby(event, sort=False)['rank'].transform('size').to_numpy()
+    if n_participants is not None:
+        n = np.broadcast_to(np.asarray(n_participants), len(out))
+    if n_rounds is None:
+        n_rounds = rounds_for(n)
+
+    ties = out['match_t'].to_numpy(dtype=float) if 'match_t' in out else 0
+    losses = out['match_l'].to_numpy(dtype=float) if 'match_l' in out else None
+    pv, pr, pt = tournament_points(out['rank'], out['win_points'], n)
+    wins, losses, record, category = match_records(out['win_points'], n_rounds, ties, losses)
+
+    out = out.assign(pv=pv, pr=pr, pt=pt, match_w=np.trunc(wins).astype(np.int64),
+                     match_t=np.broadcast_to(ties, len(out)).astype(np.int64),
+                     match_l=losses, record=record, category=category)
+    if config is not None:
+        amounts, info = voucher_amounts(category, event, config)
+        out['voucher'] = amounts
+        out.attrs['voucher_info'] = info if 'tid' in frame else info_row(info)
+    return out
+
+
+# ============================================
+# VERIFICA (--verify)
+# ============================================
+
+def _vouchers_loop(categories, config):
+    """Calcolo buoni originale (loop sulla top 8), usato da --verify."""
+    n_participants = len(categories)
+    total_fund = n_participants * config.get('entry_fee', 5.0)
+    packs_cost = math.floor(n_participants / 3) * config.get('pack_cost', 6.0)
+    remaining = total_fund - packs_cost
+    top = categories[:min(8, n_participants)]
+    n_x0, n_x1 = top.count('X-0'), top.count('X-1')
+    n_others = len(top) - n_x0 - n_x1
+    remaining_for_top = remaining - n_others * 2.0
+    x0_ratio, x1_ratio = config.get('x0_ratio', 1.90), config.get('x1_ratio', 1.00)
+    rounding = config.get('rounding', 0.50)
+    if n_x0 > 0 or n_x1 > 0:
+        divisor = n_x0 * x0_ratio + n_x1 * x1_ratio
+        base_amount = remaining_for_top / divisor if divisor > 0 else 0
+        x0_amount = round(base_amount * x0_ratio / rounding) * rounding
+        x1_amount = round(base_amount * x1_ratio / rounding) * rounding
+    else:
+        x0_amount = x1_amount = 0
+    amounts = [0.0] * n_participants
+    for i, cat in enumerate(top):
+        amounts[i] = x0_amount if cat == 'X-0' else (x1_amount if cat == 'X-1' else 2.0)
+    return amounts
+
+
+def _score_loop(ranks, win_points, n_rounds, config):
+    """Calcolo originale per giocatore (punti, record, categoria, buono)."""
+    n = len(ranks)
+    rows = []
+    for rank, wp in zip(ranks, win_points):
+        losses = n_rounds - wp / 3
+        rows.append({
+            'pv': wp / 3,
+            'pr': n - (rank - 1),
+            'pt': wp / 3 + n - (rank - 1),
+            'record': f"{int(wp / 3)}-{int(losses)}",
+            'category': 'X-0' if losses == 0 else ('X-1' if losses == 1 else 'OTHER'),
+        })
+    for row, amount in zip(rows, _vouchers_loop([r['category'] for r in rows], config)):
+        row['voucher'] = amount
+    return rows
+
+
+def _rounds_chain(n):
+    if n <= 8:
+        return 3
+    elif n <= 16:
+        return 4
+    elif n <= 32:
+        return 5
+    elif n <= 64:
+        return 6
+    elif n <= 128:
+        return 7
+    return 8
+
+
+def _random_event(rng, tid):
+    n = int(rng.integers(1, 140))
+    rounds = _rounds_chain(n)
+    wins = np.sort(rng.integers(0, rounds + 1, size=n))[::-1]
+    return pd.DataFrame({'tid': tid, 'rank': np.arange(1, n + 1), 'win_points': wins * 3})
+
+
+def verify(n_events=300, seed=0):
+    """Confronta score_results con il calcolo originale su tornei casuali."""
+    rng = np.random.default_rng(seed)
+    config = {'entry_fee': 5.0, 'pack_cost': 6.0, 'x0_ratio': 1.9, 'x1_ratio': 1.0, 'rounding': 0.5}
+    events = [_random_event(rng, f"T{i}") for i in range(n_events)]
+
+    mismatches = []
+    for ev in events:
+        n = len(ev)
+        if rounds_for(n) != _rounds_chain(n):
+            mismatches.append((ev['tid'][0], 'rounds', rounds_for(n), _rounds_chain(n)))
+        scored = score_results(ev.drop(columns='tid'), config=config)
+        expected = _score_loop(ev['rank'].tolist(), ev['win_points'].tolist(), rounds_for(n), config)
+        for i, exp in enumerate(expected):
+            for key, value in exp.items():
+                got = scored[key].iloc[i]
+                if (got != value) if isinstance(value, str) else not math.isclose(got, value, abs_tol=1e-9):
+                    mismatches.append((ev['tid'][0], f"{key}[{i}]", got, value))
+
+    # backfill: tutti i tornei in un frame devono dare gli stessi valori
+    batch = score_results(pd.concat(events, ignore_index=True), config=config)
+    single = pd.concat([score_results(ev.drop(columns='tid'), config=config) for ev in events],
+                       ignore_index=True)
+    for key in ('pv', 'pr', 'pt', 'record', 'category', 'voucher'):
+        if not (batch[key].to_numpy() == single[key].to_numpy()).all():
+            mismatches.append(('batch', key, None, None))
+
+    for m in mismatches[:20]:
+        print(f"❌ {m[0]} {m[1]}: vettoriale={m[2]} / loop={m[3]}")
+    print(f"{'✅' if not mismatches else '❌'} Verifica: {n_events} tornei, "
+          f"{sum(len(e) for e in events)} giocatori, {len(mismatches)} differenze")
+    return not mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Scoring tornei TanaLeague")
+    parser.add_argument("--verify", action="store_true", help="Confronta col calcolo originale su tornei casuali")
+    parser.add_argument("--events", type=int, default=300, help="Tornei casuali per --verify")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(0 if verify(args.events, args.seed) else 1)
+    parser.print_help()
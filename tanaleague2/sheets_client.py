@@ -0,0 +1,537 @@
+# -*- coding: utf-8 -*-
+"""
+sheets_client.py - Client Google Sheets condiviso (quota + retry)
+==================================================================
+
+Tutti i moduli (cache, stats_builder, import_tournament, parse_pokemon_tdf)
+aprono il foglio da qui. Ogni chiamata HTTP di gspread passa da
+QuotaClient.request, che:
+
+- conta letture/scritture nell'ultimo minuto e, se la quota è piena,
+  ASPETTA invece di fallire (quota Google: 60 letture + 60 scritture/min)
+- ritenta 429 / 5xx / errori di rete con backoff esponenziale + jitter
+  (rispettando Retry-After se presente)
+- tiene il conto delle chiamate per modulo chiamante (call_stats)
+- circuit breaker: dopo N errori di rete/5xx di fila le chiamate falliscono
+  SUBITO (CircuitOpenError) per un periodo crescente; poi una sola chiamata
+  di prova (half-open) decide se riaprire il traffico. Stato su /metrics.
+- richieste web (fail_fast / fail_fast_wsgi): nessun retry, timeout breve,
+  nessuna attesa quota. La pagina serve subito la cache stale invece di
+  aspettare Google; retry e backoff lunghi restano a import e job, che
+  girano in altri thread/processi.
+
+Il client è condiviso a livello di processo (pool): credenziali lette una
+volta, sessione HTTP riusata (keep-alive), token rinnovato qualche minuto
+prima della scadenza, handle Spreadsheet/Worksheet in memoria così
+sheet.worksheet(nome) non rilegge i metadati a ogni chiamata.
+
+gspread / google-auth / requests vengono importati solo alla prima
+apertura del foglio: il worker web parte senza pagarne il costo.
+
+Limiti configurabili in config.py: SHEETS_READS_PER_MINUTE,
+SHEETS_WRITES_PER_MINUTE, SHEETS_MAX_RETRIES, SHEETS_TIMEOUT,
+SHEETS_BREAKER_FAILURES, SHEETS_BREAKER_COOLDOWN, SHEETS_BREAKER_MAX_COOLDOWN,
+SHEETS_WEB_TIMEOUT, SHEETS_WEB_MAX_WAIT.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import partial
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+
+from instrumentation import inc_counter, set_gauge
+
+try:
+    import config as _config
+except Exception:
+    _config = None
+
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive'
+]
+
+READS_PER_MINUTE = getattr(_config, "SHEETS_READS_PER_MINUTE", 60)
+WRITES_PER_MINUTE = getattr(_config, "SHEETS_WRITES_PER_MINUTE", 60)
+MAX_RETRIES = getattr(_config, "SHEETS_MAX_RETRIES", 6)
+TIMEOUT = getattr(_config, "SHEETS_TIMEOUT", 20)   # secondi (o tupla connect, read)
+WEB_TIMEOUT = getattr(_config, "SHEETS_WEB_TIMEOUT", 5)     # richieste web (fail-fast)
+WEB_MAX_WAIT = getattr(_config, "SHEETS_WEB_MAX_WAIT", 0)   # secondi di attesa quota concessi al web
+
+BREAKER_FAILURES = getattr(_config, "SHEETS_BREAKER_FAILURES", 5)
+BREAKER_COOLDOWN = getattr(_config, "SHEETS_BREAKER_COOLDOWN", 30)          # secondi
+BREAKER_MAX_COOLDOWN = getattr(_config, "SHEETS_BREAKER_MAX_COOLDOWN", 600)  # secondi
+
+BACKOFF_BASE = 1.0      # secondi
+BACKOFF_MAX = 64.0      # secondi
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# rinnovo token in anticipo (i token service account durano 1h)
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+# connessioni HTTP tenute aperte verso googleapis (thread Flask + import)
+HTTP_POOL_SIZE = 8
+
+# moduli "interni": il chiamante è il primo frame fuori da questi
+_INTERNAL_PREFIXES = ("gspread", "google", "requests", "urllib3", "sheets_client")
+
+
+# ============================================
+# POLICY PER THREAD (web fail-fast)
+# ============================================
+
+_policy = threading.local()
+
+
+@contextmanager
+def fail_fast(timeout=WEB_TIMEOUT, max_wait=WEB_MAX_WAIT):
+    """
+    Chiamate del thread corrente senza retry, con timeout breve e al più
+    max_wait secondi di attesa quota (richieste web).
+    """
+    previous = getattr(_policy, 'fast', None)
+    _policy.fast = (timeout, max_wait)
+    try:
+        yield
+    finally:
+        _policy.fast = previous
+
+
+def fail_fast_wsgi(wsgi_app):
+    """Middleware WSGI: ogni richiesta web gira in fail_fast()."""
+    def app(environ, start_response):
+        with fail_fast():
+            return wsgi_app(environ, start_response)
+    return app
+
+
+def _fast():
+    """(timeout, max_wait) se il thread è in fail_fast, altrimenti None."""
+    return getattr(_policy, 'fast', None)
+
+
+# ============================================
+# QUOTA
+# ============================================
+
+class QuotaBusyError(Exception):
+    """Quota piena e il chiamante (fail-fast) non può aspettare."""
+
+
+class QuotaScheduler:
+    """
+    Finestra mobile di 60s per tipo di chiamata ('read' / 'write').
+    acquire() blocca finché c'è posto e ritorna i secondi di attesa; con
+    max_wait solleva QuotaBusyError invece di aspettare oltre.
+    """
+
+    def __init__(self, limits, window=60.0):
+        self.limits = dict(limits)
+        self.window = window
+        self._calls = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def acquire(self, kind, max_wait=None):
+        limit = self.limits.get(kind)
+        if not limit:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                calls = self._calls[kind]
+                while calls and now - calls[0] >= self.window:
+                    calls.popleft()
+                if len(calls) < limit:
+                    calls.append(now)
+                    return waited
+                delay = self.window - (now - calls[0]) + 0.05
+            if max_wait is not None and waited + delay > max_wait:
+                raise QuotaBusyError(f"Quota Google Sheets piena ({kind}), libera tra {delay:.0f}s")
+            time.sleep(delay)
+            waited += delay
+
+    def usage(self):
+        """Chiamate nell'ultima finestra per tipo."""
+        with self._lock:
+            now = time.monotonic()
+            return {k: sum(1 for t in v if now - t < self.window) for k, v in self._calls.items()}
+
+
+scheduler = QuotaScheduler({'read': READS_PER_MINUTE, 'write': WRITES_PER_MINUTE})
+
+
+# ============================================
+# CIRCUIT BREAKER
+# ============================================
+
+class CircuitOpenError(Exception):
+    """Google Sheets considerato irraggiungibile: chiamata non eseguita."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open dopo `failures` errori di fila (rete, timeout, 5xx);
+    open -> half_open dopo `cooldown` secondi: passa UNA chiamata di prova;
+    half_open -> closed se la prova riesce, altrimenti open con cooldown
+    raddoppiato (fino a max_cooldown).
+    """
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2   # valori del gauge sheets_circuit_state
+
+    def __init__(self, failures, cooldown, max_cooldown):
+        self.threshold = failures
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state):
+        self.state = state
+        set_gauge("sheets_circuit_state", state)
+
+    def _open(self):
+        self.open_until = time.monotonic() + self.cooldown
+        self._set_state(self.OPEN)
+        inc_counter("sheets_circuit_open")
+
+    def available(self):
+        """False se una chiamata adesso fallirebbe subito (senza cambiare stato)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            return time.monotonic() >= self.open_until
+
+    def before_call(self):
+        """Solleva CircuitOpenError se il circuito è aperto."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if now >= self.open_until:
+                # questa chiamata è la prova; le altre aspettano il suo esito
+                # (o la fine del cooldown, se la prova si perde per strada)
+                self.open_until = now + self.cooldown
+                self._set_state(self.HALF_OPEN)
+                return
+            retry_in = max(0.0, self.open_until - now)
+        raise CircuitOpenError(f"Google Sheets non raggiungibile, nuovo tentativo tra {retry_in:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self.cooldown = self.base_cooldown
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self._open()
+            elif self.state == self.CLOSED and self.failures >= self.threshold:
+                self._open()
+
+
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN, BREAKER_MAX_COOLDOWN)
+
+
+def sheets_available():
+    """True se il circuit breaker lascia passare le chiamate."""
+    return breaker.available()
+
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: {'read': 0, 'write': 0, 'drive': 0, 'retries': 0, 'errors': 0, 'waited': 0.0})
+
+
+def _classify(method, endpoint):
+    """'read', 'write' o 'drive' (API Drive: quota separata)."""
+    if "googleapis.com/drive/" in endpoint:
+        return 'drive'
+    if method.lower() == 'get':
+        return 'read'
+    return 'write'
+
+
+def _caller_name():
+    """Modulo che ha originato la chiamata (es. 'cache', 'import_tournament')."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(_INTERNAL_PREFIXES):
+            if module == '__main__':
+                # script lanciato da console: uso il nome del file
+                path = frame.f_globals.get('__file__') or module
+                module = os.path.splitext(os.path.basename(path))[0]
+            return module
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _backoff(attempt, response=None):
+    retry_after = None
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            retry_after = None
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    delay = random.uniform(delay / 2, delay)  # jitter
+    return max(delay, retry_after or 0.0)
+
+
+def _account(caller, field, amount=1):
+    with _stats_lock:
+        _stats[caller][field] += amount
+    inc_counter(f"sheets_{field}", amount)
+
+
+# ============================================
+# CLASSI GSPREAD (import ritardato)
+# ============================================
+
+_classes = None
+
+
+def _gspread_classes():
+    """(QuotaClient, PooledSpreadsheet), definite al primo uso."""
+    global _classes
+    if _classes is None:
+        _classes = _define_classes()
+    return _classes
+
+
+def _define_classes():
+    import gspread
+    import requests
+    from google.auth.exceptions import TransportError
+    from google.auth.transport.requests import Request
+    from gspread.exceptions import APIError, WorksheetNotFound
+    from requests.adapters import HTTPAdapter
+
+    class QuotaClient(gspread.Client):
+        """gspread.Client con quota, retry e conteggio chiamate."""
+
+        def __init__(self, auth, session=None):
+            super().__init__(auth, session)
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE)
+            self.session.mount("https://", adapter)
+            self.set_timeout(TIMEOUT)
+            self._token_lock = threading.Lock()
+
+        # gspread passa self.timeout a ogni chiamata: nei thread fail-fast
+        # vale il timeout breve, senza toccare quello degli altri thread
+        @property
+        def timeout(self):
+            fast = _fast()
+            return fast[0] if fast else self._timeout
+
+        @timeout.setter
+        def timeout(self, value):
+            self._timeout = value
+
+        def _ensure_token(self):
+            """Rinnova il token se manca o scade entro TOKEN_REFRESH_MARGIN."""
+            expiry = getattr(self.auth, 'expiry', None)
+            now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth usa UTC naive
+            if self.auth.token and expiry is not None and expiry - now > TOKEN_REFRESH_MARGIN:
+                return
+            with self._token_lock:
+                expiry = getattr(self.auth, 'expiry', None)
+                if self.auth.token and expiry is not None and expiry - now > TOKEN_REFRESH_MARGIN:
+                    return
+                self.auth.refresh(partial(Request(self.session), timeout=self.timeout))
+                inc_counter("sheets_token_refresh")
+
+        def request(self, method, endpoint, *args, **kwargs):
+            kind = _classify(method, endpoint)
+            caller = _caller_name()
+            fast = _fast()
+            max_retries = 0 if fast else MAX_RETRIES
+            attempt = 0
+            while True:
+                breaker.before_call()
+                try:
+                    waited = scheduler.acquire(kind, fast[1] if fast else None)
+                except QuotaBusyError:
+                    inc_counter("sheets_fail_fast")
+                    raise
+                if waited:
+                    _account(caller, 'waited', waited)
+                try:
+                    self._ensure_token()
+                    response = super().request(method, endpoint, *args, **kwargs)
+                    _account(caller, kind)
+                    breaker.record_success()
+                    return response
+                except APIError as e:
+                    _account(caller, kind)
+                    status = getattr(e.response, 'status_code', None)
+                    if status is not None and status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()  # il servizio risponde (anche 4xx/429)
+                    if status not in RETRY_STATUS or attempt >= max_retries:
+                        _account(caller, 'errors')
+                        raise
+                    delay = _backoff(attempt, e.response)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        TransportError):
+                    breaker.record_failure()
+                    if attempt >= max_retries:
+                        _account(caller, 'errors')
+                        raise
+                    delay = _backoff(attempt)
+                _account(caller, 'retries')
+                attempt += 1
+                time.sleep(delay)
+
+
+    class PooledSpreadsheet(gspread.Spreadsheet):
+        """
+        Spreadsheet che tiene in memoria gli handle Worksheet per titolo.
+
+        Il primo sheet.worksheet("Results") legge i metadati, i successivi no.
+        La cache si svuota se un titolo non viene trovato (foglio rinominato o
+        ricreato) e quando si aggiungono/cancellano fogli da qui.
+        """
+
+        def __init__(self, client, properties):
+            self._worksheets = {}
+            self._ws_lock = threading.Lock()
+            super().__init__(client, properties)
+
+        def worksheet(self, title):
+            ws = self._worksheets.get(title)
+            if ws is not None:
+                return ws
+            try:
+                ws = super().worksheet(title)
+            except WorksheetNotFound:
+                self.invalidate()
+                raise
+            with self._ws_lock:
+                self._worksheets[title] = ws
+            return ws
+
+        def invalidate(self):
+            """Dimentica gli handle Worksheet (rilettura metadati al prossimo uso)."""
+            with self._ws_lock:
+                self._worksheets.clear()
+
+        def add_worksheet(self, *args, **kwargs):
+            self.invalidate()
+            return super().add_worksheet(*args, **kwargs)
+
+        def duplicate_sheet(self, *args, **kwargs):
+            self.invalidate()
+            return super().duplicate_sheet(*args, **kwargs)
+
+        def del_worksheet(self, worksheet):
+            self.invalidate()
+            return super().del_worksheet(worksheet)
+
+        def del_worksheet_by_id(self, worksheet_id):
+            self.invalidate()
+            return super().del_worksheet_by_id(worksheet_id)
+
+    return QuotaClient, PooledSpreadsheet
+
+
+# ============================================
+# POOL DI PROCESSO
+# ============================================
+
+_pool_lock = threading.Lock()
+_clients = {}        # (credentials_file, scopes) -> QuotaClient
+_spreadsheets = {}   # (credentials_file, scopes, sheet_id) -> PooledSpreadsheet
+
+
+def get_client(credentials_file, scopes=SCOPES):
+    """Client autorizzato condiviso (credenziali lette una volta per processo)."""
+    key = (credentials_file, tuple(scopes))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _pool_lock:
+        client = _clients.get(key)
+        if client is None:
+            from google.oauth2.service_account import Credentials
+            quota_client, _ = _gspread_classes()
+            creds = Credentials.from_service_account_file(credentials_file, scopes=scopes)
+            client = _clients[key] = quota_client(auth=creds)
+    return client
+
+
+def open_spreadsheet(sheet_id, credentials_file, scopes=SCOPES):
+    """
+    Apre il foglio con un client che rispetta quota e ritenta gli errori.
+
+    Lo Spreadsheet è condiviso: chiamate successive con gli stessi argomenti
+    non rileggono credenziali né metadati.
+    """
+    key = (credentials_file, tuple(scopes), sheet_id)
+    spreadsheet = _spreadsheets.get(key)
+    if spreadsheet is not None:
+        return spreadsheet
+    from gspread.exceptions import APIError, SpreadsheetNotFound
+
+    client = get_client(credentials_file, scopes)
+    _, pooled_spreadsheet = _gspread_classes()
+    try:
+        spreadsheet = pooled_spreadsheet(client, {"id": sheet_id})
+    except APIError as e:
+        if getattr(e.response, 'status_code', None) == HTTPStatus.NOT_FOUND:
+            raise SpreadsheetNotFound(e.response) from e
+        raise
+    with _pool_lock:
+        spreadsheet = _spreadsheets.setdefault(key, spreadsheet)
+    return spreadsheet
+
+
+def reset_pool():
+    """Chiude le sessioni e svuota il pool (nuove credenziali, test)."""
+    with _pool_lock:
+        for client in _clients.values():
+            client.session.close()
+        _clients.clear()
+        _spreadsheets.clear()
+
+
+def modified_time(spreadsheet):
+    """
+    Ultima modifica del file (Drive modifiedTime, stringa RFC 3339).
+    Costa una chiamata Drive, fuori dalla quota Sheets.
+    """
+    return spreadsheet.client.get_file_drive_metadata(spreadsheet.id).get('modifiedTime')
+
+
+# ============================================
+# STATISTICHE
+# ============================================
+
+def call_stats():
+    """Chiamate per modulo chiamante: {caller: {'read','write','drive','retries','errors','waited'}}."""
+    with _stats_lock:
+        return {caller: dict(v) for caller, v in _stats.items()}
+
+
+def format_call_stats():
+    """Riepilogo leggibile per gli script da console."""
+    lines = []
+    for caller, s in sorted(call_stats().items()):
+        line = f"{caller}: {s['read']} letture, {s['write']} scritture"
+        if s['retries']:
+            line += f", {s['retries']} retry"
+        if s['waited']:
+            line += f", attesa quota {s['waited']:.1f}s"
+        lines.append(line)
+    return "\n".join(lines) or "nessuna chiamata"
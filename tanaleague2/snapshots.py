@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+snapshots.py - Lettura incrementale dei fogli append-only
+==========================================================
+
+Results e Tournaments durante la stagione crescono solo in fondo. Invece di
+get_all_values() a ogni refresh si tiene una copia locale (cartella
+snapshots/) con tutte le righe già lette e l'hash delle ultime TAIL_ROWS.
+
+Al refresh UNA chiamata batch_get legge:
+- le righe dalla coda in poi (A{n-TAIL_ROWS+1}:{col}), sovrapposte alle
+  ultime già note
+- la sola colonna A (ID): pochi byte, rivela righe cancellate o svuotate
+  anche lontano dalla coda (re-import di un torneo)
+
+Se la coda sovrapposta o gli ID non coincidono -> rilettura completa.
+Rilettura completa comunque ogni FULL_RELOAD_HOURS (modifiche a mano).
+Le righe riscritte al loro posto da un re-import non cambiano né la coda né
+gli ID: chi le scrive chiama invalidate() e la lettura dopo è completa.
+
+Con read_rows_diff() lo snapshot tiene anche l'hash delle righe di ogni
+gruppo (es. Tournament_ID) e ritorna cosa è cambiato rispetto alla lettura
+precedente: tornei aggiunti, modificati, rimossi. Serve a invalidare solo
+le stats delle stagioni toccate. read_rows_keyed() ritorna anche gli hash
+per gruppo: sono le chiavi con cui gli aggregati stats (aggregates.py)
+capiscono quali tornei rifondere senza decodificare le righe.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from instrumentation import inc_counter
+
+SNAPSHOT_DIR = Path(__file__).resolve().parent / "snapshots"  # creata alla prima scrittura
+TAIL_ROWS = 5
+FULL_RELOAD_HOURS = 24
+HEADER_ROWS = 3
+
+_lock = threading.Lock()
+
+
+def _col_width(last_col):
+    """'O' -> 15"""
+    width = 0
+    for ch in last_col.upper():
+        width = width * 26 + (ord(ch) - ord('A') + 1)
+    return width
+
+
+def _normalize(rows, width):
+    """Righe a larghezza fissa (le API tagliano le celle vuote in fondo)."""
+    return [(list(r) + [''] * width)[:width] for r in rows]
+
+
+def _tail_hash(rows):
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _tail_start(n_rows, header_rows):
+    """Prima riga (1-based) da rileggere: le ultime TAIL_ROWS già note."""
+    return max(header_rows + 1, n_rows - TAIL_ROWS + 1)
+
+
+def _ids(values):
+    """Colonna ID senza le celle vuote finali."""
+    values = list(values)
+    while values and values[-1] == '':
+        values.pop()
+    return values
+
+
+def _path(sheet_id, title):
+    safe = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in f"{sheet_id}_{title}")
+    return SNAPSHOT_DIR / f"{safe}.json"
+
+
+def _load(path):
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def _save(path, snap):
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    # tmp univoco: web, job e import (processi diversi) salvano lo stesso snapshot
+    fd, tmp = tempfile.mkstemp(dir=SNAPSHOT_DIR, prefix=f".{path.stem}_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(snap, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def invalidate(sheet_id, title):
+    """
+    Forza la rilettura completa del foglio alla prossima lettura (righe
+    riscritte in mezzo). Gli hash per gruppo restano: il diff dopo la
+    rilettura dice quali tornei sono cambiati.
+    """
+    path = _path(sheet_id, title)
+    with _lock:
+        snap = _load(path)
+        if snap and snap.get('full_at'):
+            snap['full_at'] = 0
+            _save(path, snap)
+
+
+def _group_hashes(rows, key_col, keys=None):
+    """{chiave: hash delle righe con quella chiave} (solo `keys` se indicato)."""
+    groups = {}
+    for r in rows:
+        key = r[key_col]
+        if key and (keys is None or key in keys):
+            groups.setdefault(key, []).append(r)
+    return {key: _tail_hash(g) for key, g in groups.items()}
+
+
+def _diff(old, new):
+    """Confronto tra due mappe {chiave: hash}."""
+    return {
+        'added': sorted(k for k in new if k not in old),
+        'changed': sorted(k for k in new if k in old and new[k] != old[k]),
+        'removed': sorted(k for k in old if k not in new),
+    }
+
+
+def _delta(ws, snap, last_col, width, header_rows):
+    """Righe aggiornate leggendo solo la coda, None se serve rilettura completa."""
+    known = snap['rows']
+    start = _tail_start(len(known), header_rows)
+    tail, ids = ws.batch_get([f"A{start}:{last_col}", f"A{header_rows + 1}:A"])
+    tail = _normalize(tail, width)
+
+    overlap = max(0, len(known) - start + 1)
+    if len(tail) < overlap or _tail_hash(tail[:overlap]) != snap['tail_hash']:
+        return None  # coda modificata o righe cancellate
+
+    rows = known[:start - 1] + tail
+    if _ids(r[0] if r else '' for r in ids) != _ids(r[0] for r in rows[header_rows:]):
+        return None  # righe svuotate/cancellate più in alto
+    return rows
+
+
+def read_rows(sheet, title, last_col, header_rows=HEADER_ROWS):
+    """
+    Tutte le righe di un foglio append-only (come get_all_values, con
+    larghezza fissa A..last_col), leggendo dal foglio solo le righe nuove.
+
+    Args:
+        sheet: Spreadsheet gspread
+        title: nome del foglio (es. "Results")
+        last_col: ultima colonna usata (es. "O")
+        header_rows: righe di intestazione (mai rilette in delta)
+    """
+    return _read(sheet, title, last_col, header_rows, None)[0]
+
+
+def read_rows_diff(sheet, title, last_col, key_col, header_rows=HEADER_ROWS):
+    """
+    Come read_rows, più il confronto con la lettura precedente per gruppi
+    di righe con la stessa chiave.
+
+    Args:
+        key_col: indice (0-based) della colonna chiave (es. 1 = Tournament_ID in Results)
+
+    Returns:
+        (rows, diff): diff = {'added': [...], 'changed': [...], 'removed': [...]},
+        None alla prima lettura (nessun termine di confronto)
+    """
+    return _read(sheet, title, last_col, header_rows, key_col)[:2]
+
+
+def read_rows_keyed(sheet, title, last_col, key_col, header_rows=HEADER_ROWS):
+    """
+    Come read_rows_diff, più l'hash delle righe di ogni gruppo.
+
+    Returns:
+        (rows, groups, diff): groups = {chiave: hash delle sue righe}, in
+        ordine di prima comparsa; cambia solo se cambiano le righe del gruppo
+    """
+    rows, diff, groups = _read(sheet, title, last_col, header_rows, key_col)
+    return rows, groups, diff
+
+
+def _read(sheet, title, last_col, header_rows, key_col):
+    ws = sheet.worksheet(title)
+    width = _col_width(last_col)
+    path = _path(sheet.id, title)
+
+    with _lock:
+        snap = _load(path)
+        rows = None
+        full_at = snap.get('full_at', 0) if snap else 0
+        if snap and snap.get('width') == width and time.time() - full_at < FULL_RELOAD_HOURS * 3600:
+            rows = _delta(ws, snap, last_col, width, header_rows)
+        delta = rows is not None
+        if rows is None:
+            rows = _normalize(ws.get(f"A1:{last_col}"), width)
+            full_at = time.time()
+            inc_counter("snapshot_full_reload")
+        else:
+            inc_counter("snapshot_delta")
+
+        data = rows[header_rows:]
+        groups = diff = None
+        if key_col is not None:
+            old = snap.get('groups') if snap and snap.get('key_col') == key_col else None
+            if delta and old is not None:
+                # in delta cambiano solo i gruppi presenti nelle righe rilette
+                known = len(snap['rows'])
+                touched = {r[key_col] for r in rows[_tail_start(known, header_rows) - 1:]}
+                groups = dict(old)
+                groups.update(_group_hashes(data, key_col, touched))
+            else:
+                groups = _group_hashes(data, key_col)
+            if old is not None:
+                diff = _diff(old, groups)
+
+        start = _tail_start(len(rows), header_rows)
+        new_snap = {
+            'title': title,
+            'width': width,
+            'full_at': full_at,
+            'rows': rows,
+            'tail_hash': _tail_hash(rows[start - 1:]),
+        }
+        if groups is not None:
+            new_snap['key_col'] = key_col
+            new_snap['groups'] = groups
+        _save(path, new_snap)
+    return rows, diff, groups
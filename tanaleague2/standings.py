@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+standings.py - Classifica stagionale incrementale
+==================================================
+
+Motore condiviso dagli import (CSV One Piece e TDF Pokemon) per aggiornare
+Seasonal_Standings_PROV applicando SOLO le righe del nuovo torneo.
+
+- Regola scarto per stagione (foglio Config, colonne opzionali):
+    Drop_Threshold  -> da quanti tornei in su si scarta (default 8)
+    Drop_Count      -> quante giornate peggiori scartare (default 2)
+- Finché la stagione resta sotto soglia, i totali esistenti in classifica
+  bastano: niente lettura di Results.
+- Con lo scarto attivo servono i punti di ogni torneo: si legge Results
+  una volta sola.
+- Si scrivono solo le righe cambiate (1 batch_update + eventuale append).
+
+Layout righe classifica (A..K, dalla riga 4):
+Season_ID | Membership | Nome | Punti | Giocati | Contati | Vittorie torneo |
+Match vinti | Miglior rank | Top8 | Posizione
+"""
+
+from schema import HEADER_ROWS, decoder, to_float as _num, to_int, to_membership
+
+DEFAULT_DROP_THRESHOLD = 8
+DEFAULT_DROP_COUNT = 2
+
+_decode_result = decoder("Results")
+_decode_standing = decoder("Seasonal_Standings")
+
+
+# ============================================
+# REGOLA SCARTO
+# ============================================
+
+def drop_rule(config_row):
+    """
+    Regola di scarto da una riga Config (dict header -> valore).
+
+    Returns:
+        (threshold, count)
+    """
+    threshold = int(_num(config_row.get('Drop_Threshold'), DEFAULT_DROP_THRESHOLD) or DEFAULT_DROP_THRESHOLD)
+    count = int(_num(config_row.get('Drop_Count'), DEFAULT_DROP_COUNT))
+    return threshold, count
+
+
+def read_drop_rule(sheet, season_id):
+    """Legge la regola di scarto della stagione dal foglio Config."""
+    all_values = sheet.worksheet("Config").get_all_values()
+    headers = [h.strip() for h in all_values[3]] if len(all_values) > 3 else []
+    for row in all_values[4:]:
+        if row and row[0] == season_id:
+            return drop_rule(dict(zip(headers, row)))
+    return DEFAULT_DROP_THRESHOLD, DEFAULT_DROP_COUNT
+
+
+def max_counted(n_tournaments, rule):
+    """Quanti tornei contano per giocatore con n_tournaments in stagione."""
+    threshold, count = rule
+    if n_tournaments < threshold:
+        return n_tournaments
+    return max(0, n_tournaments - count)
+
+
+# ============================================
+# STATO PER GIOCATORE
+# ============================================
+
+def _new_player(name):
+    return {
+        'name': name,
+        'points': [],       # punti per torneo (None = solo totale noto)
+        'total': 0.0,       # somma di tutti i punti
+        'played': 0,
+        'wins': 0,
+        'match_wins': 0,
+        'best_rank': 999,
+        'top8': 0,
+    }
+
+
+def _add_result(p, points, rank, match_wins):
+    if p['points'] is not None:
+        p['points'].append(points)
+    p['total'] += points
+    p['played'] += 1
+    p['wins'] += 1 if rank == 1 else 0
+    p['match_wins'] += match_wins
+    p['best_rank'] = min(p['best_rank'], rank)
+    p['top8'] += 1 if rank <= 8 else 0
+
+
+def _result_fields(row):
+    """(membership, nome, punti, rank, match vinti) da una riga Results."""
+    r = _decode_result(row)
+    membership = r['membership']
+    match_wins = r['match_w'] if r['match_w'] is not None else int(r['win_points'] / 3)
+    return membership, r['name'] or membership, r['pt'], r['rank'], match_wins
+
+
+def state_from_results(results_rows, season_id, exclude_tid=None):
+    """Stato completo (punti per torneo) dalle righe Results della stagione."""
+    state = {}
+    for row in results_rows:
+        if not row or len(row) < 10 or not row[1]:
+            continue
+        tid = row[1]
+        if tid.split('_')[0] != season_id or tid == exclude_tid:
+            continue
+        membership, name, points, rank, match_wins = _result_fields(row)
+        p = state.setdefault(membership, _new_player(name))
+        p['name'] = name
+        _add_result(p, points, rank, match_wins)
+    return state
+
+
+def state_from_standings(standings_rows, season_id):
+    """
+    Stato "solo totali" dalle righe già in classifica. Valido solo se nessuna
+    giornata era scartata (stagione sotto soglia).
+    """
+    state = {}
+    for row in standings_rows:
+        if not row or row[0] != season_id:
+            continue
+        rec = _decode_standing(row)
+        p = _new_player(rec['name'])
+        p['points'] = None
+        p['total'] = rec['points']
+        p['played'] = rec['tournaments_played']
+        p['wins'] = rec['total_wins']
+        p['match_wins'] = rec['match_wins']
+        p['best_rank'] = rec['best_rank'] or 999
+        p['top8'] = rec['top8_count']
+        state[to_membership(rec['membership'])] = p
+    return state
+
+
+def apply_event(state, event_rows):
+    """Applica allo stato le righe Results del nuovo torneo."""
+    for row in event_rows:
+        membership, name, points, rank, match_wins = _result_fields(row)
+        p = state.setdefault(membership, _new_player(name))
+        p['name'] = name
+        _add_result(p, points, rank, match_wins)
+    return state
+
+
+def compute_rows(state, season_id, n_tournaments, rule):
+    """Righe classifica (A..K) ordinate, con posizione."""
+    limit = max_counted(n_tournaments, rule)
+    out = []
+    for membership, p in state.items():
+        to_count = min(p['played'], limit)
+        if p['points'] is None:
+            total = p['total']
+        else:
+            total = sum(sorted(p['points'], reverse=True)[:to_count])
+        out.append([
+            season_id,
+            membership,
+            p['name'],
+            round(float(total), 2),
+            int(p['played']),
+            int(to_count),
+            int(p['wins']),
+            int(p['match_wins']),
+            int(p['best_rank']),
+            int(p['top8']),
+        ])
+    # solo punti, come la classifica storica; sort stabile: a parità resta
+    # l'ordine di state (posizione precedente, poi ordine di comparsa)
+    out.sort(key=lambda r: -r[3])
+    for i, row in enumerate(out, 1):
+        row.append(i)
+    return out
+
+
+# ============================================
+# DIFF + SCRITTURA
+# ============================================
+
+def _same_cell(old, new):
+    if isinstance(new, (int, float)):
+        return old != '' and abs(_num(old, float('nan')) - new) < 1e-6
+    return str(old) == str(new)
+
+
+def _typed(row):
+    """Riga classifica letta dal foglio -> valori tipizzati (per riscriverla RAW)."""
+    row = (list(row) + [''] * 11)[:11]
+    return row[:3] + [_num(row[3])] + [to_int(v) for v in row[4:]]
+
+
+def diff_rows(existing_rows, season_id, new_rows):
+    """
+    Confronta la classifica attuale del foglio con quella nuova.
+
+    Il blocco della stagione viene riscritto contiguo, in ordine di
+    posizione, dalla sua prima riga (come la classifica storica): le righe
+    di altre stagioni che lo seguono scorrono sotto, le righe avanzate in
+    fondo si svuotano. Si scrivono solo le righe cambiate.
+
+    Returns:
+        (updates, appends, clears): updates per batch_update, righe da
+        appendere oltre la fine dei dati, range da svuotare (coda).
+    """
+    data = existing_rows[HEADER_ROWS:]
+    last = len(data)
+    while last and not any(data[last - 1]):
+        last -= 1
+    data = data[:last]
+    mine = [i for i, row in enumerate(data) if row and row[0] == season_id]
+    start = mine[0] if mine else last
+    target = [list(r) for r in new_rows]
+    target += [_typed(row) for row in data[start:] if not (row and row[0] == season_id)]
+
+    updates, appends, changed = [], [], []
+    for i, row in enumerate(target, start=start):
+        if i >= last:
+            appends.append(row)
+        elif not all(_same_cell(old, new) for old, new in zip((list(data[i]) + [''] * 11)[:11], row)):
+            changed.append((i, row))
+    # righe cambiate consecutive -> un solo range
+    for i, row in changed:
+        row_idx = HEADER_ROWS + 1 + i
+        if updates and updates[-1]['end'] == row_idx - 1:
+            updates[-1]['end'] = row_idx
+            updates[-1]['values'].append(row)
+        else:
+            updates.append({'end': row_idx, 'start': row_idx, 'values': [row]})
+    updates = [{'range': f"A{u['start']}:K{u['end']}", 'values': u['values']} for u in updates]
+
+    end = start + len(target)
+    clears = [f"A{HEADER_ROWS + 1 + end}:K{HEADER_ROWS + last}"] if end < last else []
+    return updates, appends, clears
+
+
+def plan_update(existing_standings, season_id, event_tid, event_rows, season_events, rule,
+                load_results):
+    """
+    Calcola le scritture per aggiornare la classifica con un nuovo torneo.
+
+    Args:
+        existing_standings: get_all_values() di Seasonal_Standings_PROV
+        season_id: stagione
+        event_tid: Tournament_ID del nuovo torneo
+        event_rows: righe Results del nuovo torneo (layout foglio)
+        season_events: {tid: partecipanti} dei tornei della stagione
+        rule: (threshold, count) regola scarto
+        load_results: callable senza argomenti -> righe Results (usato solo
+            quando serve lo storico completo)
+
+    Returns:
+        (new_rows, updates, appends, clears, used_results)
+    """
+    prior = {tid: n for tid, n in season_events.items() if tid != event_tid}
+    n_after = len(prior) + 1
+
+    state = None
+    used_results = False
+    if max_counted(n_after, rule) == n_after:
+        # nessuno scarto: bastano i totali, se la classifica è coerente
+        state = state_from_standings(existing_standings[HEADER_ROWS:], season_id)
+        entries = sum(p['played'] for p in state.values())
+        if entries != sum(prior.values()):
+            state = None
+    if state is None:
+        state = state_from_results(load_results()[HEADER_ROWS:], season_id, exclude_tid=event_tid)
+        used_results = True
+
+    apply_event(state, event_rows)
+    new_rows = compute_rows(state, season_id, n_after, rule)
+    updates, appends, clears = diff_rows(existing_standings, season_id, new_rows)
+    return new_rows, updates, appends, clears, used_results
+
+
+def update_standings(sheet, season_id, event_tid, event_rows, tournaments_rows=None, rule=None,
+                     write=True):
+    """
+    Aggiorna Seasonal_Standings_PROV con il torneo appena importato.
+
+    Args:
+        sheet: Spreadsheet gspread
+        season_id: stagione
+        event_tid: Tournament_ID del torneo importato
+        event_rows: righe Results del torneo
+        tournaments_rows: get_all_values() di Tournaments (se già letto)
+        rule: regola scarto (se None viene letta da Config)
+        write: False = calcola soltanto (test mode)
+
+    Returns:
+        Dict con righe nuove e conteggi delle scritture.
+    """
+    ws_standings = sheet.worksheet("Seasonal_Standings_PROV")
+    if tournaments_rows is None:
+        tournaments_rows = sheet.worksheet("Tournaments").get_all_values()
+    if rule is None:
+        rule = read_drop_rule(sheet, season_id)
+
+    season_events = {}
+    for row in tournaments_rows[HEADER_ROWS:]:
+        if row and len(row) > 3 and row[0] and row[1] == season_id:
+            season_events[row[0]] = int(_num(row[3]))
+    season_events[event_tid] = len(event_rows)
+
+    existing = ws_standings.get_all_values()
+    new_rows, updates, appends, clears, used_results = plan_update(
+        existing, season_id, event_tid, event_rows, season_events, rule,
+        load_results=lambda: sheet.worksheet("Results").get_all_values()
+    )
+
+    if write:
+        if updates:
+            ws_standings.batch_update(updates, value_input_option='RAW')
+        if appends:
+            ws_standings.append_rows(appends, value_input_option='RAW')
+        if clears:
+            ws_standings.batch_clear(clears)
+
+    return {
+        'rows': new_rows,
+        'n_tournaments': len(season_events),
+        'max_counted': max_counted(len(season_events), rule),
+        'updated': sum(len(u['values']) for u in updates),
+        'added': len(appends),
+        'cleared': len(clears),
+        'used_results': used_results,
+    }
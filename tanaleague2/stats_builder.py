@@ -1,43 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
-import gspread
-from google.oauth2.service_account import Credentials
-from collections import defaultdict, Counter
 from datetime import datetime, timedelta
 from typing import Dict, List, Any
 from config import SHEET_ID, CREDENTIALS_FILE
-
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets','https://www.googleapis.com/auth/drive']
-
-def _zfill(s, n=10): 
-    return str(s).zfill(n)
-
-def _to_float(x, default=0.0):
-    try:
-        s=str(x).strip()
-        if s.endswith('%'):
-            s=s[:-1]
-        return float(s.replace(',','.'))
-    except:
-        return default
-
-def _to_int(x, default=0):
-    try:
-        return int(float(str(x).replace(',','.').strip()))
-    except:
-        return default
-
-def _parse_date_from_tid(tid):
-    if not tid or '_' not in tid:
-        return None
-    part=tid.split('_',1)[1]
-    for fmt in ('%Y%m%d','%Y-%m-%d','%d%m%Y','%Y.%m.%d'):
-        try:
-            return datetime.strptime(part, fmt)
-        except:
-            pass
-    return None
+from aggregates import event_loader, event_parts, merge_events, parse_date, scope_aggregate
+from instrumentation import Stopwatch, timed
+from sheets_client import open_spreadsheet
+from schema import tid_season
+from snapshots import read_rows_keyed
+from stats_cache import invalidate_tids
 
 def _tcg_from_season_id(season_id):
     pref=''
@@ -48,91 +20,70 @@ def _tcg_from_season_id(season_id):
             break
     return pref.upper()
 
-def _stdev(vals):
-    n=len(vals)
-    if n<2:
-        return 0.0
-    m=sum(vals)/n
-    return (sum((v-m)**2 for v in vals)/n)**0.5
-
 def _connect_sheet():
-    creds=Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
-    client=gspread.authorize(creds)
-    return client.open_by_key(SHEET_ID)
+    return open_spreadsheet(SHEET_ID, CREDENTIALS_FILE)
 
 def _load_results(sheet):
-    ws=sheet.worksheet("Results")
-    rows=ws.get_all_values()[3:]
-    results=[]; max_field=defaultdict(int); by_date={}
-    for row in rows:
-        if not row or len(row)<10:
-            continue
-        tid=row[1]
-        if not tid:
-            continue
-        season_id = tid.split('_')[0] if '_' in tid else tid
-        membership=_zfill(row[2],10)
-        name=row[9] if len(row)>9 and row[9] else membership
-        rank=_to_int(row[3],999)
-        win_points=_to_float(row[4],0.0)
-        omw=_to_float(row[5],0.0)
-        pv=_to_float(row[6],0.0)
-        pr=_to_float(row[7],0.0)
-        pt=_to_float(row[8],0.0)
-        date=_parse_date_from_tid(tid)
-        field=int(max(0, pr+rank-1))
-        if field>max_field[tid]:
-            max_field[tid]=field
-        if tid not in by_date:
-            by_date[tid]=date
-        results.append({
-            "tid":tid,"season_id":season_id,"membership":membership,"name":name,
-            "rank":rank,"win_points":win_points,"omw":omw,"pv":pv,"pr":pr,"pt":pt,"date":date
-        })
-    events={tid:{"date":by_date.get(tid),"participants":p} for tid,p in max_field.items()}
-    return results, events
+    """
+    Griglia Results e chiavi dei tornei {tid: hash delle righe}, senza
+    decodificare nulla: le righe si decodificano solo per i tornei da fondere.
+    """
+    grid, keys, diff=read_rows_keyed(sheet, "Results", "O", key_col=1)  # solo righe nuove dal foglio
+    invalidate_tids(diff)  # stats in cache delle sole stagioni con tornei cambiati
+    return grid, keys
 
-def _scope_records(res, scope):
+def _in_scope(scope, season_id):
     if str(scope).startswith("ALL-"):
-        tcg=str(scope).split('-',1)[1].upper()
-        return [r for r in res if _tcg_from_season_id(r["season_id"])==tcg]
-    return [r for r in res if r["season_id"]==scope]
+        return _tcg_from_season_id(season_id)==str(scope).split('-',1)[1].upper()
+    return season_id==scope
+
+def _scope_records(res, scope):
+    return [r for r in res if _in_scope(scope, r["season_id"])]
+
+def _scope_keys(keys, scope):
+    return {tid: key for tid, key in keys.items() if _in_scope(scope, tid_season(tid))}
 
-def _events_in_scope(events, records):
-    tids={r["tid"] for r in records}
-    return {tid: events[tid] for tid in tids if tid in events}
+def _top_name(p, default):
+    """Nome più frequente del giocatore (a parità, il primo visto)."""
+    names=p["names"]
+    return max(names, key=names.get) if names else default
 
 def _compute_for_scope(scope, res, events):
-    recs=_scope_records(res, scope)
-    evs=_events_in_scope(events, recs)
+    """Payload di uno scope ricalcolato dalle righe (senza aggregati su disco)."""
+    parts=event_parts(_scope_records(res, scope), events)
+    return _payload(merge_events((recs, ev) for recs, ev, _ in parts.values()))
+
+def _payload(agg):
+    """Payload stats (spotlights, narrative, pulse, tales, hof) da un Aggregate."""
+    sw=Stopwatch("stats")
+    players=agg.players
+    evs=agg.events
 
     # spotlights (numeriche)
-    by_player=defaultdict(list)
-    for r in recs:
-        by_player[r["membership"]].append(r)
     participants=[e["participants"] for e in evs.values() if e["participants"]>0]
     q3=sorted(participants)[int(0.75*(len(participants)-1))] if participants else 0
     mvp=[]; sharp=[]; metro=[]; phoenix=[]; bigs=[]; clos=[]
-    events_per_player={m:len(v) for m,v in by_player.items() if v}
+    events_per_player={m:p["n"] for m,p in players.items() if p["n"]}
     avg_events=(sum(events_per_player.values())/len(events_per_player)) if events_per_player else 1.0
-    for m,evts in by_player.items():
+    for m,p in players.items():
         # name più frequente
-        names=[e["name"] for e in evts]
-        name = max(set(names), key=names.count) if names else m
-        pts=[e["pt"] for e in evts]; n=len(pts)
-        mean_pts=(sum(pts)/n) if n else 0.0; st=_stdev(pts)
+        name=_top_name(p, m)
+        n=p["n"]
+        mean_pts=(p["sum"]/n) if n else 0.0
+        # deviazione std da somma e somma dei quadrati
+        st=max(0.0, p["sumsq"]/n-mean_pts*mean_pts)**0.5 if n>=2 else 0.0
         mvp_score=mean_pts*((n/avg_events) if avg_events>0 else 1.0)
         mvp.append({"membership":m,"name":name,"score":round(mvp_score,2),"events":n})
         sharp.append({"membership":m,"name":name,"score":round(mean_pts,2),"events":n})
         metro.append({"membership":m,"name":name,"score":round(st,2),"events":n})
 
         # rising_star: miglioramento ranking stagionale (placeholder per ora)
-        # Calcolo trend punti come proxy
-        evts_sorted=sorted(evts, key=lambda e: (e["date"] or datetime.min, e["tid"]))
-        pts_sorted=[e["pt"] for e in evts_sorted]
-        if len(pts_sorted)>=3:
-            recent_avg=sum(pts_sorted[-2:])/2
-            older_avg=sum(pts_sorted[:-2])/len(pts_sorted[:-2])
+        # Calcolo trend punti come proxy: ultimi 2 dalla coda ordinata, precedenti per differenza
+        tail=p["tail"]
+        if n>=3:
+            last2=tail[-2][2]+tail[-1][2]
+            recent_avg=last2/2
+            older_avg=(p["sum"]-last2)/(n-2)
             rs_score=recent_avg-older_avg
         else:
             rs_score=0.0
@@ -140,14 +91,15 @@ def _compute_for_scope(scope, res, events):
 
         # big stage: media punti sugli eventi nel quartile superiore per partecipanti
         if q3>0:
-            big_evts=[e for e in evts if evs.get(e["tid"],{}).get("participants",0)>=q3]
-            bs=(sum(e["pt"] for e in big_evts)/len(big_evts)) if big_evts else 0.0
+            big=[v for size,v in p["by_size"].items() if size>=q3]
+            cnt=sum(c for _,c in big)
+            bs=(sum(s for s,_ in big)/cnt) if cnt else 0.0
         else:
             bs=0.0
         bigs.append({"membership":m,"name":name,"score":round(bs,2),"events":n})
 
         # closer: quota punti da Top 8
-        top8_pts=sum(e["pt"] for e in evts if e["rank"]<=8); tot=sum(pts)
+        top8_pts=p["top8_pt"]; tot=p["sum"]
         clos.append({"membership":m,"name":name,"score":round((top8_pts/tot) if tot>0 else 0.0,3),"events":n})
 
     def topn(lst, reverse=True, n=10, min_events=3):
@@ -157,7 +109,7 @@ def _compute_for_scope(scope, res, events):
     # Costante vs Imprevedibile (top1 di ciascuno)
     most_consistent = topn(metro, False, n=1, min_events=3)
     most_volatile = topn(metro, True, n=1, min_events=3)
-    
+
     spot = {
         "dominatore": topn(mvp, True, n=5),
         "cecchino": topn(sharp, True, n=5),
@@ -169,26 +121,19 @@ def _compute_for_scope(scope, res, events):
         "big_match_player": topn(bigs, True, n=5),
         "finalista": topn(clos, True, n=5),
     }
+    sw.lap("spotlights")
 
     # narrative
-    name_of = {}
-    first_date = {}
-    for r in recs:
-        m = r["membership"]
-        name_of[m] = r.get("name", m)
-        d = r.get("date")
-        if d and (m not in first_date or d < first_date[m]):
-            first_date[m] = d
-
-    evlist = sorted([(tid, e.get("date")) for tid, e in evs.items()], key=lambda x: (x[1] or datetime.min, x[0]))
-    last_tid = evlist[-1][0] if len(evlist) >= 1 else None
-    prev_tid = evlist[-2][0] if len(evlist) >= 2 else None
+    name_of = {m: p["name"] for m, p in players.items()}
+    first_date = {m: parse_date(p["first"]) for m, p in players.items() if p["first"]}
+
+    evlist = sorted([(tid, parse_date(e["date"])) for tid, e in evs.items()], key=lambda x: (x[1] or datetime.min, x[0]))
     last_date = evlist[-1][1] if len(evlist) >= 1 else None
 
     # Ironman
     ironman_m = None; ironman_n = 0
-    for m, evts in by_player.items():
-        n = len(evts)
+    for m, p in players.items():
+        n = p["n"]
         if n > ironman_n:
             ironman_n = n; ironman_m = m
     ironman = None
@@ -198,10 +143,10 @@ def _compute_for_scope(scope, res, events):
     # Rookie (<=3 eventi con migliore top8 rate)
     rookie = None
     cand = []
-    for m, evts in by_player.items():
-        n = len(evts)
+    for m, p in players.items():
+        n = p["n"]
         if n <= 3 and n > 0:
-            top8 = sum(1 for e in evts if (e.get("rank") or 999) <= 8)
+            top8 = p["top8"]
             rate = (top8 / n) if n else 0.0
             cand.append((rate, top8, n, m))
     if cand:
@@ -209,13 +154,10 @@ def _compute_for_scope(scope, res, events):
         rate, top8, n, m = cand[0]
         rookie = {"name": name_of.get(m, m), "top8": int(top8), "events": int(n), "rate_pct": round(rate*100,1)}
 
-    # Climber (evento vs precedente)
+    # Climber (evento vs precedente): ranking degli ultimi 2 eventi
     climber_ev = None
-    if last_tid and prev_tid:
-        rank_last = {}; rank_prev = {}
-        for r in recs:
-            if r.get("tid")==last_tid: rank_last[r["membership"]] = r.get("rank") or 999
-            if r.get("tid")==prev_tid: rank_prev[r["membership"]] = r.get("rank") or 999
+    if len(agg.recent) >= 2:
+        rank_prev = agg.recent[-2][2]; rank_last = agg.recent[-1][2]
         deltas = []
         for m in set(rank_last.keys()) & set(rank_prev.keys()):
             d = (rank_prev[m] - rank_last[m])
@@ -225,31 +167,20 @@ def _compute_for_scope(scope, res, events):
             d, m = deltas[0]
             climber_ev = {"name": name_of.get(m, m), "delta": int(d)}
 
-    # Climber (mese su mese)
+    # Climber (mese su mese): somme ranking per mese
     climber_mom = None
     if last_date:
-        cur_month = (last_date.year, last_date.month)
+        cur_month = f"{last_date.year:04d}-{last_date.month:02d}"
         py, pm = last_date.year, last_date.month - 1
         if pm == 0:
             py -= 1; pm = 12
-        prev_month = (py, pm)
-        by_mo = {}
-        for r in recs:
-            d = r.get("date")
-            if not d: 
-                continue
-            key = (d.year, d.month, r["membership"])
-            by_mo.setdefault(key, []).append(r.get("rank") or 999)
-        avg_rank = {}
-        for (y,m,mem), ranks in by_mo.items():
-            avg_rank[(y,m,mem)] = sum(ranks)/len(ranks)
+        prev_month = f"{py:04d}-{pm:02d}"
         deltas = []
-        mems = {mem for (y,m,mem) in avg_rank.keys() if (y,m) in [cur_month, prev_month]}
-        for mem in mems:
-            a = avg_rank.get((prev_month[0], prev_month[1], mem))
-            b = avg_rank.get((cur_month[0], cur_month[1], mem))
-            if a is not None and b is not None:
-                d = a - b
+        for mem, p in players.items():
+            a = p["months"].get(prev_month)
+            b = p["months"].get(cur_month)
+            if a and b:
+                d = a[0]/a[1] - b[0]/b[1]
                 deltas.append((d, mem))
         deltas.sort(reverse=True)
         if deltas and deltas[0][0] > 0:
@@ -385,23 +316,23 @@ def _compute_for_scope(scope, res, events):
     else:
         spot_narrative.append({"id":"attendance_pulse","icon":"📊","title":"Attendance Pulse","text":"N/A","proof":"","tag":"","tooltip":""})
 
+    sw.lap("narrative")
+
     # pulse KPI
     kpi={}
     kpi["events_total"]=len(evs)
-    kpi["unique_players"]=len({r["membership"] for r in recs})
-    kpi["entries_total"]=len(recs)
+    kpi["unique_players"]=len(players)
+    kpi["entries_total"]=agg.rows
     parts=[e["participants"] for e in evs.values() if e["participants"]>0]
     kpi["avg_participants"]=round(sum(parts)/len(parts),2) if parts else 0.0
-    top8=sum(1 for r in recs if r["rank"]<=8)
-    kpi["top8_rate"]=round((top8/len(recs))*100,2) if recs else 0.0
-    omws=[r["omw"] for r in recs if r["omw"] is not None]
-    kpi["avg_omw"]=round(sum(omws)/len(omws),2) if omws else 0.0
-    
-    # Compleanno Lega - uso evlist_simple prima di ridefinirlo
-    evlist_simple = sorted([(tid, e.get("date")) for tid, e in evs.items()], key=lambda x: (x[1] or datetime.min, x[0]))
-    if evlist_simple:
-        first_event_date = min((d for _,d in evlist_simple if d), default=None)
-        last_event_date = max((d for _,d in evlist_simple if d), default=None)
+    kpi["top8_rate"]=round((agg.top8/agg.rows)*100,2) if agg.rows else 0.0
+    kpi["avg_omw"]=round(agg.omw[0]/agg.omw[1],2) if agg.omw[1] else 0.0
+    kpi["avg_oomw"]=round(agg.oomw[0]/agg.oomw[1],2) if agg.oomw[1] else 0.0
+
+    # Compleanno Lega
+    if evlist:
+        first_event_date = min((d for _,d in evlist if d), default=None)
+        last_event_date = max((d for _,d in evlist if d), default=None)
         if first_event_date and last_event_date:
             giorni_attivi = (last_event_date - first_event_date).days
             kpi["compleanno_lega"] = {
@@ -413,7 +344,7 @@ def _compute_for_scope(scope, res, events):
             kpi["compleanno_lega"] = None
     else:
         kpi["compleanno_lega"] = None
-    
+
     # Record Presenze
     if parts:
         max_part = max(parts)
@@ -423,56 +354,28 @@ def _compute_for_scope(scope, res, events):
                 kpi["record_presenze"] = {
                     "count": max_part,
                     "tid": tid,
-                    "date": e.get("date").isoformat() if e.get("date") else ""
+                    "date": e.get("date") or ""
                 }
                 break
     else:
         kpi["record_presenze"] = None
 
-    by_tid_pts=defaultdict(list)
-    for r in recs:
-        by_tid_pts[r["tid"]].append(r["pt"])
-    evlist=[(tid, e["date"], e["participants"]) for tid,e in evs.items()]
-    evlist.sort(key=lambda x:(x[1] or datetime.min, x[0]))
     series_entries=[]; series_avg=[]
-    for tid,d,participants in evlist:
-        pts=by_tid_pts.get(tid,[])
-        avg=(sum(pts)/len(pts)) if pts else 0.0
-        series_entries.append({"tid":tid,"date": d.isoformat() if d else "","participants":participants})
+    for tid,d in evlist:
+        e=evs[tid]
+        avg=(e["sum"]/e["n"]) if e["n"] else 0.0
+        series_entries.append({"tid":tid,"date": d.isoformat() if d else "","participants":e["participants"]})
         series_avg.append({"tid":tid,"date": d.isoformat() if d else "","avg_points": round(avg,2)})
-    pulse={"kpi":kpi,"series":{"entries_per_event":series_entries,"avg_points_per_event":series_avg}}
+    sw.lap("pulse")
 
     # tales
-    by_event_players=defaultdict(list); by_event_podium=defaultdict(list); by_event_top8=defaultdict(list); name_of={}
-    def pairs(L):
-        out=[]; L=list(L)
-        for i in range(len(L)):
-            for j in range(i+1,len(L)):
-                a,b=L[i],L[j]
-                if a==b: continue
-                if a<b: out.append((a,b))
-                else: out.append((b,a))
-        return out
-    for r in recs:
-        by_event_players[r["tid"]].append(r["membership"])
-        if r["rank"]<=3: by_event_podium[r["tid"]].append(r["membership"])
-        if r["rank"]<=8: by_event_top8[r["tid"]].append(r["membership"])
-        name_of[r["membership"]]=r["name"]
-    co=Counter(); rp=Counter(); mix=defaultdict(set)
-    for tid, players in by_event_players.items():
-        for a,b in pairs(players): co[(a,b)]+=1
-    for tid, podium in by_event_podium.items():
-        for a,b in pairs(podium): rp[(a,b)]+=1
-    for tid, top8 in by_event_top8.items():
-        s=set(top8)
-        for p in s: mix[p].update(s-{p})
     def fmt(cnt, topn=10):
         out=[]
         for (a,b), c in cnt.most_common(topn):
             out.append({"a":{"membership":a,"name":name_of.get(a,a)},"b":{"membership":b,"name":name_of.get(b,b)},"count":int(c)})
         return out
-    companions=fmt(co,10); rivals=fmt(rp,10)
-    mixture=[{"membership":m,"name":name_of.get(m,m),"unique_opponents":len(s)} for m,s in mix.items()]
+    companions=fmt(agg.co,10); rivals=fmt(agg.rp,10)
+    mixture=[{"membership":m,"name":name_of.get(m,m),"unique_opponents":len(s)} for m,s in agg.mix.items()]
     mixture.sort(key=lambda x: x["unique_opponents"], reverse=True); mixture=mixture[:10]
     tales={
         "companions":companions,
@@ -482,77 +385,70 @@ def _compute_for_scope(scope, res, events):
         "torneo_competitivo": None,
         "ultimo_arrivato": None
     }
-    
+
     # Sfortuna Nera: 9° posto (fuori top8 per 1)
-    nono_posti = defaultdict(int)
-    for r in recs:
-        if r["rank"] == 9:
-            nono_posti[r["membership"]] += 1
+    nono_posti = {m: p["ninth"] for m, p in players.items() if p["ninth"]}
     if nono_posti:
         top_sfortuna = max(nono_posti.items(), key=lambda x: x[1])
         m, cnt = top_sfortuna
         tales["sfortuna_nera"] = {"membership": m, "name": name_of.get(m,m), "count": cnt}
-    
+
     # Torneo Competitivo: più giocatori con record positivo in top8
+    # (per evento: quanti in top8 hanno win_points >= media della top8)
     torneo_comp = None
     best_comp_score = 0
-    for tid, players in by_event_top8.items():
-        top8_recs = [r for r in recs if r["tid"]==tid and r["rank"]<=8]
-        # Conta quanti hanno win_points >= media
-        if top8_recs:
-            avg_wp = sum(r["win_points"] for r in top8_recs) / len(top8_recs)
-            positive = sum(1 for r in top8_recs if r["win_points"] >= avg_wp)
-            comp_score = positive * evs[tid].get("participants", 0)
+    for tid, e in evs.items():
+        positive = e["balanced"]
+        if positive is not None:
+            comp_score = positive * e.get("participants", 0)
             if comp_score > best_comp_score:
                 best_comp_score = comp_score
-                date_obj = evs[tid].get("date")
                 torneo_comp = {
                     "tid": tid,
-                    "date": date_obj.isoformat() if date_obj else None,
-                    "participants": evs[tid].get("participants", 0),
+                    "date": e.get("date"),
+                    "participants": e.get("participants", 0),
                     "balanced_top8": positive
                 }
     tales["torneo_competitivo"] = torneo_comp
-    
+
     # Ultimo Arrivato
     if first_date:
         ultimo_m = max(first_date.items(), key=lambda x: x[1])
         m, d = ultimo_m
         tales["ultimo_arrivato"] = {"membership": m, "name": name_of.get(m,m), "date": d.isoformat() if d else ""}
 
+    sw.lap("tales")
+
     # HOF
-    highest=None; biggest=None; most_bal=None; most_dom=None
-    for r in recs:
-        if (highest is None) or (r["pt"]>highest["pt"]):
-            highest={"membership":r["membership"],"name":r["name"],"pt":r["pt"],"tid":r["tid"]}
+    highest=dict(agg.highest) if agg.highest else None; biggest=None; most_bal=None; most_dom=None
     for tid,e in evs.items():
         if (biggest is None) or (e["participants"]>biggest["participants"]):
             biggest={"tid":tid,"participants":e["participants"]}
-    for tid,pts in by_tid_pts.items():
-        if len(pts)<8: continue
-        sdev=_stdev(pts)
+    for tid,e in evs.items():
+        if e["n"]<8: continue
+        sdev=e["stdev"]
         if (most_bal is None) or (sdev<most_bal["stdev"]):
-            most_bal={"tid":tid,"stdev":round(sdev,2),"participants":len(pts)}
-    for tid,pts in by_tid_pts.items():
-        if len(pts)<8: continue
-        s=sorted(pts, reverse=True); gap=s[0]-s[7]
+            most_bal={"tid":tid,"stdev":round(sdev,2),"participants":e["n"]}
+    for tid,e in evs.items():
+        if e["n"]<8: continue
+        gap=e["gap"]
         if (most_dom is None) or (gap>most_dom["gap"]):
-            most_dom={"tid":tid,"gap":round(gap,2),"participants":len(pts)}
+            most_dom={"tid":tid,"gap":round(gap,2),"participants":e["n"]}
     best_ph=None
-    by_pl=defaultdict(list)
-    for r in recs:
-        by_pl[r["membership"]].append(r)
-    for m,evts in by_pl.items():
-        evts_sorted=sorted(evts, key=lambda e: (e["date"] or datetime.min, e["tid"]))
-        pts_sorted=[e["pt"] for e in evts_sorted]
-        if len(pts_sorted)>=2:
-            last3=pts_sorted[-3:] if len(pts_sorted)>=3 else pts_sorted[-2:]
-            prev=pts_sorted[:-3] if len(pts_sorted)>=4 else pts_sorted[:-2]
-            prev_mean=(sum(prev)/len(prev)) if prev else 0.0
+    for m,p in players.items():
+        n=p["n"]; tail=p["tail"]
+        if n>=2:
+            # ultimi 3 (o 2) dalla coda ordinata; media dei precedenti per differenza
+            last3=[e[2] for e in (tail[-3:] if n>=3 else tail[-2:])]
+            if n>=4:
+                prev_mean=(p["sum"]-sum(last3))/(n-3)
+            elif n==3:
+                prev_mean=tail[0][2]
+            else:
+                prev_mean=0.0
             ph=sum(last3)/len(last3)-prev_mean
             if (best_ph is None) or (ph>best_ph["score"]):
-                name=max((e["name"] for e in evts), key=lambda n: sum(1 for e in evts if e["name"]==n), default=m)
-                best_ph={"membership":m,"name":name,"score":round(ph,2)}
+                best_ph={"membership":m,"name":_top_name(p, m),"score":round(ph,2)}
 
     hof={
         "highest_single_score":highest,
@@ -565,66 +461,47 @@ def _compute_for_scope(scope, res, events):
         "piu_vittorie": None,
         "piu_punti": None
     }
-    
+
     # Underdog Hero: vittorie da fondo classifica (rank iniziale alto, finisce 1°)
-    # Approssimazione: chi vince con seed basso = tanti partecipanti - ranking finale
-    underdog_wins = []
-    for r in recs:
-        if r["rank"] == 1:
-            participants = evs[r["tid"]].get("participants", 0)
-            # Seed basso = participants alto e ranking 1
-            if participants >= 10:  # Almeno 10 partecipanti
-                underdog_wins.append({
-                    "membership": r["membership"],
-                    "name": r["name"],
-                    "tid": r["tid"],
-                    "participants": participants
-                })
-    if underdog_wins:
-        # Conta quante volte ha vinto da underdog
-        underdog_count = Counter(w["membership"] for w in underdog_wins)
+    # Approssimazione: vittorie in tornei con almeno 10 partecipanti
+    underdog_count = {m: p["underdog"] for m, p in players.items() if p["underdog"]}
+    if underdog_count:
         top_underdog = max(underdog_count.items(), key=lambda x: x[1])
         m, cnt = top_underdog
         hof["underdog_hero"] = {"membership": m, "name": name_of.get(m, m), "wins": cnt}
-    
+
     # Scalata Epica: maggior salto posizioni in classifica stagionale
     # Serve standings, ma qui non abbiamo accesso. Usiamo proxy: delta rank tra primo e ultimo torneo
     scalata_candidates = []
-    for m, evts in by_pl.items():
-        if len(evts) >= 3:
-            evts_sorted = sorted(evts, key=lambda e: (e["date"] or datetime.min, e["tid"]))
-            first_rank = evts_sorted[0]["rank"]
-            last_rank = evts_sorted[-1]["rank"]
+    for m, p in players.items():
+        if p["n"] >= 3:
+            first_rank = p["head"][3]
+            last_rank = p["tail"][-1][3]
             delta = first_rank - last_rank
             if delta > 0:  # Miglioramento
                 scalata_candidates.append({
                     "membership": m,
                     "name": name_of.get(m, m),
                     "delta": delta,
-                    "events": len(evts)
+                    "events": p["n"]
                 })
     if scalata_candidates:
         scalata_candidates.sort(key=lambda x: x["delta"], reverse=True)
         hof["scalata_epica"] = scalata_candidates[0]
-    
+
     # Più Vittorie (rank=1)
-    vittorie_count = Counter()
-    for r in recs:
-        if r["rank"] == 1:
-            vittorie_count[r["membership"]] += 1
+    vittorie_count = {m: p["wins"] for m, p in players.items() if p["wins"]}
     if vittorie_count:
         top_vitt = max(vittorie_count.items(), key=lambda x: x[1])
         m, cnt = top_vitt
         hof["piu_vittorie"] = {"membership": m, "name": name_of.get(m, m), "wins": cnt}
-    
+
     # Più Punti Lifetime
-    punti_lifetime = defaultdict(float)
-    for r in recs:
-        punti_lifetime[r["membership"]] += r["pt"]
-    if punti_lifetime:
-        top_punti = max(punti_lifetime.items(), key=lambda x: x[1])
+    if players:
+        top_punti = max(((m, p["sum"]) for m, p in players.items()), key=lambda x: x[1])
         m, pts = top_punti
         hof["piu_punti"] = {"membership": m, "name": name_of.get(m, m), "points": round(pts, 2)}
+    sw.lap("hof")
 
     return {"spotlights":spot,"spot_narrative":spot_narrative,"pulse": {"kpi": kpi, "series": {"entries_per_event": series_entries, "avg_points_per_event": series_avg}}, "tales":tales,"hof":hof}
 
@@ -634,9 +511,15 @@ def build_stats(scopes):
     Compatibilità:
     - Se `scopes` è una stringa come 'OP12', viene trattata come lista con un solo elemento.
     - Ritorna sempre un dict {scope: payload}. (La tua app può "spianare" se vuole un payload piatto.)
+
+    Ogni scope è la fusione degli aggregati per torneo (aggregates.py):
+    dopo un nuovo torneo si fonde solo quello nell'aggregato salvato, e si
+    decodificano solo le sue righe.
     """
-    sheet=_connect_sheet()
-    res, events=_load_results(sheet)
+    with timed("stats.load"):
+        sheet=_connect_sheet()
+        grid, keys=_load_results(sheet)
+        load=event_loader(grid)
 
     if isinstance(scopes, (list, tuple, set)):
         targets = [str(s) for s in scopes]
@@ -645,5 +528,7 @@ def build_stats(scopes):
 
     out = {}
     for scope in targets:
-        out[scope] = _compute_for_scope(scope, res, events)
+        with timed("stats.aggregate"):
+            agg = scope_aggregate(scope, _scope_keys(keys, scope), load)
+        out[scope] = _payload(agg)
     return out
@@ -2,20 +2,77 @@
 """
 stats_cache.py
 A simple file-based cache for stats objects per scope.
+
+Only scopes from the season registry (registered_scopes: the seasons in the
+local standings cache, plus ALL-<TCG>) are read or written, so the number of
+files is bounded whoever the caller is. The directory is also bounded to
+MAX_FILES / MAX_BYTES with LRU eviction (a file's mtime is refreshed on every
+hit). Files are replaced atomically: readers never see a half-written JSON.
+
+Freshness is driven by the snapshot diffs: when tournaments are added,
+changed or removed only the affected scopes are dropped (invalidate_tids).
+MAX_AGE is just a safety net for edits the diffs cannot see.
 """
 
-import os, json, time
+import os, json, tempfile, time
 from pathlib import Path
 from typing import Callable, Dict, Any
 
-BASE_DIR = Path(__file__).resolve().parent / "stats_cache"
-BASE_DIR.mkdir(parents=True, exist_ok=True)
+from instrumentation import inc_counter, timed
+
+try:
+    import config as _config
+except Exception:
+    _config = None
+
+BASE_DIR = Path(__file__).resolve().parent / "stats_cache"  # creata alla prima scrittura
+MAX_FILES = getattr(_config, "STATS_CACHE_MAX_FILES", 64)
+MAX_BYTES = getattr(_config, "STATS_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+MAX_AGE = getattr(_config, "STATS_CACHE_MAX_AGE", 6 * 3600)
+
+def _scopes_of(sid: str) -> set:
+    """A season id and its ALL-<TCG> scope."""
+    scopes = {sid}
+    tcg = ''
+    for ch in sid:
+        if not ch.isalpha():
+            break
+        tcg += ch
+    if tcg:
+        scopes.add(f"ALL-{tcg}")
+    return scopes
+
+def known_scopes(seasons) -> set:
+    """Valid scopes: every season id in the registry plus ALL-<TCG>."""
+    scopes = set()
+    for s in seasons or []:
+        sid = str(s.get('id') or '').strip().upper()
+        if sid:
+            scopes |= _scopes_of(sid)
+    return scopes
+
+def registered_scopes() -> set:
+    """Scopes of the season registry in the local standings cache (no Sheets call)."""
+    from cache import cache
+    return known_scopes(cache.seasons())
+
+def affected_scopes(tids) -> set:
+    """Scopes whose stats depend on these tournament ids (OP12_2025-06-12 -> OP12, ALL-OP)."""
+    scopes = set()
+    for tid in tids or []:
+        sid = str(tid).split('_', 1)[0].strip().upper()
+        if sid:
+            scopes |= _scopes_of(sid)
+    return scopes
 
 def _path_for(scope: str) -> Path:
     safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in scope)
     return BASE_DIR / f"stats_{safe}.json"
 
+@timed("stats_cache.get")
 def get_cached(scope: str, max_age_seconds: int) -> Dict[str, Any] | None:
+    if scope not in registered_scopes():
+        return None
     p = _path_for(scope)
     if not p.exists():
         return None
@@ -23,19 +80,79 @@ def get_cached(scope: str, max_age_seconds: int) -> Dict[str, Any] | None:
         obj = json.loads(p.read_text(encoding="utf-8"))
         ts = obj.get("_cached_at", 0)
         if time.time() - ts <= max_age_seconds:
+            os.utime(p)  # LRU: last use
             return obj.get("data")
         return None
     except Exception:
         return None
 
+@timed("stats_cache.set")
 def set_cached(scope: str, data: Dict[str, Any]) -> None:
+    if scope not in registered_scopes():
+        raise ValueError(f"Unknown stats scope: {scope!r}")
     p = _path_for(scope)
+    BASE_DIR.mkdir(parents=True, exist_ok=True)
     payload = {"_cached_at": time.time(), "data": data}
-    p.write_text(json.dumps(payload, ensure_ascii=False, separators=(",",":")), encoding="utf-8")
+    # unique tmp + rename: concurrent rebuild workers and web threads
+    fd, tmp = tempfile.mkstemp(dir=BASE_DIR, prefix=f".{p.stem}_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",",":"))
+        os.replace(tmp, p)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    _evict(keep=p)
+
+def _evict(keep: Path) -> int:
+    """Drop least recently used files until under MAX_FILES and MAX_BYTES."""
+    entries = []
+    for f in BASE_DIR.glob("stats_*.json"):
+        try:
+            st = f.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, f))
+    entries.sort(key=lambda e: e[0])  # oldest first
+    total = sum(size for _, size, _ in entries)
+    count = len(entries)
+    removed = 0
+    for _, size, f in entries:
+        if count <= MAX_FILES and total <= MAX_BYTES:
+            break
+        if f == keep:
+            continue
+        try:
+            f.unlink()
+        except OSError:
+            continue
+        count -= 1
+        total -= size
+        removed += 1
+    if removed:
+        inc_counter("stats_cache_evicted", removed)
+    return removed
 
 def clear(scope: str) -> bool:
     p = _path_for(scope)
     if p.exists():
         p.unlink()
         return True
-    return False
\ No newline at end of file
+    return False
+
+def invalidate(scopes) -> list:
+    """Drop the cached payloads of these scopes; returns the ones removed."""
+    cleared = sorted(s for s in scopes if clear(s))
+    if cleared:
+        inc_counter("stats_cache_invalidated", len(cleared))
+    return cleared
+
+def invalidate_tids(diff) -> list:
+    """Invalidate the scopes touched by a snapshot diff (see snapshots.read_rows_diff)."""
+    if not diff:
+        return []
+    tids = diff['added'] + diff['changed'] + diff['removed']
+    return invalidate(affected_scopes(tids))
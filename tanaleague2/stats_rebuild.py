@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+stats_rebuild.py - Rebuild parallelo delle stats su più scope
+==============================================================
+
+Dopo un import le stats di ogni scope (stagione, ALL-<TCG>) venivano
+ricostruite una dopo l'altra nel thread della richiesta. Qui:
+
+- i Results vengono letti UNA volta nel processo principale; si decodificano
+  solo i tornei senza aggregato salvato per le righe attuali (aggregates.py)
+- quei record finiscono in un file a colonne (array tipizzati + tabelle
+  delle stringhe, righe raggruppate per torneo) che i worker aprono in mmap
+  in sola lettura: ogni worker decodifica solo gli intervalli dei tornei
+  del suo scope, niente pickle delle righe verso i processi
+- gli scope vengono distribuiti su un ProcessPoolExecutor; ogni payload
+  va in stats_cache appena pronto
+- il report riporta il tempo totale e quello di ogni scope
+
+Uso:
+    python stats_rebuild.py                  # tutti gli scope con dati
+    python stats_rebuild.py OP12 ALL-OP      # solo questi
+    python stats_rebuild.py --workers 1      # senza processi (es. PythonAnywhere)
+
+Oppure POST /api/stats/rebuild con scopes=OP12,ALL-OP (admin, job in background,
+vedi jobs.py); i worker chiesti sono limitati a STATS_REBUILD_MAX_WORKERS
+"""
+
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from aggregates import event_loader, events_of, scope_aggregate, stale_events
+from instrumentation import record_span
+from records import RESULT_FIELDS, ResultRecord
+
+try:
+    import config as _config
+except Exception:
+    _config = None
+
+WORKERS = getattr(_config, "STATS_REBUILD_WORKERS", None)   # None = un processo per CPU
+MAX_WORKERS = getattr(_config, "STATS_REBUILD_MAX_WORKERS", 4)   # tetto per /api/stats/rebuild
+
+# tipo di ogni colonna: s = stringa (codice in tabella), i = intero, d = float (NaN = None),
+# o = data (ordinale, 0 = None)
+COLUMN_TYPES = {
+    'tid': 's', 'season_id': 's', 'membership': 's', 'name': 's',
+    'rank': 'i', 'h2h': 'i', 'date': 'o',
+    'win_points': 'd', 'omw': 'd', 'oomw': 'd', 'pv': 'd', 'pr': 'd', 'pt': 'd',
+}
+
+
+# ============================================
+# BUFFER A COLONNE
+# ============================================
+
+def pack_results(results, path):
+    """
+    Scrive i record in un file a colonne:
+        [lunghezza header][header JSON][pad][colonna 1][colonna 2]...
+    L'header contiene numero righe, offset delle colonne, tabelle stringhe e
+    per ogni torneo l'intervallo [inizio, fine) delle sue righe: i record
+    vanno passati raggruppati per torneo.
+    """
+    n = len(results)
+    strings = {}
+    columns = []
+    for name in RESULT_FIELDS:
+        kind = COLUMN_TYPES[name]
+        values = [r[name] for r in results]
+        if kind == 's':
+            table = {}
+            data = array('i', (table.setdefault(v, len(table)) for v in values))
+            strings[name] = list(table)
+        elif kind == 'o':
+            data = array('i', (v.toordinal() if v else 0 for v in values))
+        elif kind == 'd':
+            data = array('d', (math.nan if v is None else v for v in values))
+        else:
+            data = array('q', values)
+        columns.append((name, data))
+
+    events = {}
+    for i, r in enumerate(results):
+        span = events.setdefault(r["tid"], [i, i])
+        if span[1] != i:
+            raise ValueError(f"Record di {r['tid']} non contigui")
+        span[1] = i + 1
+
+    header = {'rows': n, 'columns': [], 'strings': strings, 'events': events}
+    offset = 0
+    for name, data in columns:
+        header['columns'].append([name, data.typecode, offset])
+        offset += len(data) * data.itemsize
+        offset += -offset % 8
+    raw = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    base = 8 + len(raw)
+    base += -base % 8
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(raw)))
+        f.write(raw)
+        f.write(b'\0' * (base - 8 - len(raw)))
+        for name, data in columns:
+            f.write(data.tobytes())
+            f.write(b'\0' * (-f.tell() % 8))
+    return path
+
+
+class PackedResults:
+    """
+    File a colonne aperto in mmap (sola lettura). Le colonne restano
+    memoryview tipizzate sul file: records() e load() decodificano solo le
+    righe chieste, il resto del file non viene mai letto.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (size,) = struct.unpack_from('<Q', self._mm, 0)
+        header = json.loads(self._mm[8:8 + size].decode('utf-8'))
+        base = 8 + size
+        base += -base % 8
+        self.rows = header['rows']
+        self.events = header['events']
+        self._strings = header['strings']
+        self._view = memoryview(self._mm)
+        self._cols = []
+        for name, typecode, offset in header['columns']:
+            start = base + offset
+            itemsize = array(typecode).itemsize
+            self._cols.append((name, self._view[start:start + self.rows * itemsize].cast(typecode)))
+
+    def records(self, start=0, stop=None):
+        """ResultRecord delle righe [start, stop)."""
+        stop = self.rows if stop is None else stop
+        cols = []
+        for name, col in self._cols:
+            part = col[start:stop]   # vista sul mmap, nessuna copia
+            kind = COLUMN_TYPES[name]
+            if kind == 's':
+                table = self._strings[name]
+                cols.append([table[c] for c in part])
+            elif kind == 'o':
+                cols.append([datetime.fromordinal(c) if c else None for c in part])
+            elif kind == 'd':
+                cols.append([None if v != v else v for v in part])
+            else:
+                cols.append(part.tolist())
+            part.release()
+        return [ResultRecord(*row) for row in zip(*cols)]
+
+    def load(self, tids):
+        """load(tids) per scope_aggregate: solo le righe dei tornei chiesti."""
+        out = {}
+        for tid in tids:
+            if tid not in self.events:
+                raise KeyError(f"{tid} non presente nel file dei Results da decodificare")
+            records = self.records(*self.events[tid])
+            out[tid] = (records, events_of(records)[tid])
+        return out
+
+    def close(self):
+        for _, col in self._cols:
+            col.release()
+        self._view.release()
+        self._mm.close()
+
+
+def load_packed(path):
+    """Tutti i record dal file a colonne."""
+    packed = PackedResults(path)
+    try:
+        return packed.records()
+    finally:
+        packed.close()
+
+
+# ============================================
+# WORKER
+# ============================================
+
+_keys = None     # per processo worker: {tid: hash delle righe} (chiavi degli aggregati)
+_packed = None   # per processo worker: PackedResults aperto per tutta la vita del worker
+
+
+def _init_worker(path, keys):
+    global _keys, _packed
+    _keys = keys
+    _packed = PackedResults(path)
+
+
+def _build_scope(scope):
+    """Payload di uno scope nel worker: (scope, payload, secondi)."""
+    from stats_builder import _payload, _scope_keys
+
+    t0 = time.perf_counter()
+    payload = _payload(scope_aggregate(scope, _scope_keys(_keys, scope), _packed.load))
+    return scope, payload, time.perf_counter() - t0
+
+
+# ============================================
+# REBUILD
+# ============================================
+
+def all_scopes(tids):
+    """Scope con almeno un torneo nei Results (stagioni + ALL-<TCG>)."""
+    from stats_cache import affected_scopes
+    return affected_scopes(set(tids))
+
+
+def rebuild(scopes=None, workers=WORKERS, progress=None):
+    """
+    Ricostruisce le stats degli scope indicati (default: tutti) e le salva
+    in stats_cache man mano che sono pronte.
+
+    Args:
+        scopes: lista scope (es. ['OP12', 'ALL-OP']); None = tutti quelli con dati
+            (solo quelli del registro stagioni, gli altri finiscono in errors)
+        workers: processi; 1 = tutto nel processo corrente
+        progress: callback(fatti, totale, scope) a ogni scope completato
+
+    Returns:
+        {'total': s, 'load': s, 'workers': n, 'scopes': {scope: s}, 'errors': {scope: msg}}
+    """
+    global _keys, _packed
+    from stats_builder import _connect_sheet, _load_results
+    from stats_cache import registered_scopes, set_cached
+
+    t0 = time.perf_counter()
+    grid, keys = _load_results(_connect_sheet())
+    # nel file solo i tornei senza aggregato salvato per le righe attuali
+    stale = stale_events(keys)
+    loaded = event_loader(grid)(stale)
+    results = [r for tid in stale if tid in loaded for r in loaded[tid][0]]
+    # solo scope del registro stagioni (stats_cache rifiuta gli altri)
+    known = registered_scopes()
+    requested = set(scopes) if scopes else all_scopes(keys) & known
+    scopes = sorted(requested & known)
+    load_s = time.perf_counter() - t0
+
+    workers = max(1, min(len(scopes), workers or os.cpu_count() or 1))
+    report = {'total': 0.0, 'load': round(load_s, 3), 'workers': workers, 'scopes': {},
+              'errors': {scope: "scope non nel registro stagioni" for scope in sorted(requested - known)}}
+
+    def _done(scope, payload, seconds):
+        set_cached(scope, payload)
+        report['scopes'][scope] = round(seconds, 3)
+        record_span(f"stats.rebuild.{scope}", seconds)
+        if progress:
+            progress(len(report['scopes']), len(scopes), scope)
+
+    fd, path = tempfile.mkstemp(prefix="stats_results_", suffix=".col")
+    os.close(fd)
+    try:
+        pack_results(results, path)
+        if workers == 1:
+            _init_worker(path, keys)
+            for scope in scopes:
+                try:
+                    _done(*_build_scope(scope))
+                except Exception as e:
+                    report['errors'][scope] = str(e)
+        else:
+            # spawn: i worker non ereditano lock/thread del processo web
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                     initializer=_init_worker, initargs=(path, keys)) as pool:
+                futures = {pool.submit(_build_scope, scope): scope for scope in scopes}
+                for fut in as_completed(futures):
+                    try:
+                        _done(*fut.result())
+                    except Exception as e:
+                        report['errors'][futures[fut]] = str(e)
+    finally:
+        if _packed is not None:   # rebuild nel processo corrente: chiude il mmap
+            _packed.close()
+        _keys = _packed = None
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    report['total'] = round(time.perf_counter() - t0, 3)
+    record_span("stats.rebuild", report['total'])
+    return report
+
+
+def format_report(report):
+    lines = [f"Rebuild stats: {len(report['scopes'])} scope in {report['total']:.2f}s "
+             f"(lettura {report['load']:.2f}s, {report['workers']} worker)"]
+    for scope, seconds in sorted(report['scopes'].items(), key=lambda x: -x[1]):
+        lines.append(f"   {scope:<12} {seconds * 1000:8.1f} ms")
+    for scope, msg in report['errors'].items():
+        lines.append(f"   {scope:<12} ERRORE: {msg}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild parallelo delle stats TanaLeague")
+    parser.add_argument("scopes", nargs="*", help="Scope da ricostruire (default: tutti)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Processi worker (default: uno per CPU; 1 = senza processi)")
+    args = parser.parse_args()
+    print(format_report(rebuild([s.upper() for s in args.scopes] or None, args.workers)))
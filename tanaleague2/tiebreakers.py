@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+tiebreakers.py - Record e tiebreaker ufficiali calcolati dai match
+===================================================================
+
+Lavora su array indicizzati per giocatore (un indice per userid) e calcola
+in un solo passaggio, per tutti i giocatori:
+
+- W / L / T                       (bincount sui match)
+- OMW%  (media win% avversari)    (prodotto matrice avversari x win%)
+- OMW% aggregato (formula storica della colonna F di Results)
+- OOMW% (media OMW% avversari)    (prodotto matrice avversari x OMW%)
+- H2H   (scontri diretti netti contro chi ha gli stessi match points)
+
+Regola Pokemon: la win% di ogni giocatore conta almeno il 25%.
+I BYE non vanno passati: non contano come avversari.
+"""
+
+import numpy as np
+
+# Pokemon: la win% di ogni avversario conta almeno il 25%
+MIN_WIN_PCT = 0.25
+
+# outcome TDF: 1 = vince player1, 2 = vince player2, 3 = pareggio
+P1_WIN, P2_WIN, TIE = 1, 2, 3
+
+
+def compute_records(n, p1_idx, p2_idx, outcomes):
+    """
+    Calcola W/L/T per giocatore da array di match (esclusi BYE).
+
+    Ritorna tre array int di lunghezza n (indice giocatore).
+    """
+    p1_win = outcomes == P1_WIN
+    p2_win = outcomes == P2_WIN
+    tie = outcomes == TIE
+    wins = np.bincount(p1_idx[p1_win], minlength=n) + np.bincount(p2_idx[p2_win], minlength=n)
+    losses = np.bincount(p2_idx[p1_win], minlength=n) + np.bincount(p1_idx[p2_win], minlength=n)
+    ties = np.bincount(p1_idx[tie], minlength=n) + np.bincount(p2_idx[tie], minlength=n)
+    return wins, losses, ties
+
+
+def opponent_matrix(n, p1_idx, p2_idx):
+    """Matrice n x n: quante volte il giocatore i ha affrontato j."""
+    adjacency = np.zeros((n, n), dtype=np.float64)
+    np.add.at(adjacency, (p1_idx, p2_idx), 1)
+    np.add.at(adjacency, (p2_idx, p1_idx), 1)
+    return adjacency
+
+
+def result_matrix(n, p1_idx, p2_idx, outcomes):
+    """Matrice n x n: +1 per ogni vittoria di i su j, -1 per ogni sconfitta."""
+    res = np.zeros((n, n), dtype=np.float64)
+    p1_win = outcomes == P1_WIN
+    p2_win = outcomes == P2_WIN
+    np.add.at(res, (p1_idx[p1_win], p2_idx[p1_win]), 1)
+    np.add.at(res, (p2_idx[p1_win], p1_idx[p1_win]), -1)
+    np.add.at(res, (p2_idx[p2_win], p1_idx[p2_win]), 1)
+    np.add.at(res, (p1_idx[p2_win], p2_idx[p2_win]), -1)
+    return res
+
+
+def aggregate_omw(adjacency, wins, losses, ties):
+    """
+    OMW% "aggregato" (formula storica del foglio Results): vittorie totali
+    degli avversari diviso match totali degli avversari, senza minimo.
+    """
+    played = (wins + losses + ties).astype(np.float64)
+    opp_wins = adjacency @ wins
+    opp_total = adjacency @ played
+    out = np.zeros(len(wins), dtype=np.float64)
+    np.divide(opp_wins * 100, opp_total, out=out, where=opp_total > 0)
+    return out
+
+
+def compute_tiebreakers(n, p1_idx, p2_idx, outcomes, min_win_pct=MIN_WIN_PCT):
+    """
+    Calcola record e tiebreaker ufficiali per tutti i giocatori.
+
+    Args:
+        n: numero giocatori (indici 0..n-1)
+        p1_idx, p2_idx: array indice giocatore per ogni match (no BYE)
+        outcomes: array outcome TDF per ogni match
+        min_win_pct: minimo win% (0.25 = regola Pokemon)
+
+    Returns:
+        Dict di array lunghi n: 'w', 'l', 't', 'match_points',
+        'win_pct', 'omw', 'oomw', 'omw_aggregate' (percentuali 0-100) e 'h2h'.
+    """
+    p1_idx = np.asarray(p1_idx, dtype=np.intp)
+    p2_idx = np.asarray(p2_idx, dtype=np.intp)
+    outcomes = np.asarray(outcomes, dtype=np.int8)
+
+    wins, losses, ties = compute_records(n, p1_idx, p2_idx, outcomes)
+    adjacency = opponent_matrix(n, p1_idx, p2_idx)
+
+    played = (wins + losses + ties).astype(np.float64)
+    win_pct = np.full(n, min_win_pct, dtype=np.float64)
+    np.divide(wins, played, out=win_pct, where=played > 0)
+    win_pct = np.maximum(win_pct, min_win_pct)
+
+    n_opps = adjacency.sum(axis=1)
+    omw = np.zeros(n, dtype=np.float64)
+    np.divide(adjacency @ win_pct, n_opps, out=omw, where=n_opps > 0)
+    oomw = np.zeros(n, dtype=np.float64)
+    np.divide(adjacency @ omw, n_opps, out=oomw, where=n_opps > 0)
+
+    # H2H: saldo scontri diretti contro chi ha gli stessi match points
+    match_points = wins * 3 + ties
+    same_points = match_points[:, None] == match_points[None, :]
+    np.fill_diagonal(same_points, False)
+    h2h = (result_matrix(n, p1_idx, p2_idx, outcomes) * same_points).sum(axis=1)
+
+    return {
+        'w': wins, 'l': losses, 't': ties,
+        'match_points': match_points,
+        'win_pct': win_pct * 100,
+        'omw': omw * 100,
+        'oomw': oomw * 100,
+        'omw_aggregate': aggregate_omw(adjacency, wins, losses, ties),
+        'h2h': h2h.astype(np.int64),
+    }
+
+
+def tiebreakers_by_player(uids, p1_idx, p2_idx, outcomes, min_win_pct=MIN_WIN_PCT):
+    """
+    Come compute_tiebreakers, ma ritorna {uid: {...}} con valori Python
+    (OMW/OOMW arrotondati a 2 decimali), pronto per scrivere su Results:
+    'omw_aggregate' va in colonna F (come gli import storici e i CSV),
+    'omw' ufficiale nella colonna P.
+    """
+    tb = compute_tiebreakers(len(uids), p1_idx, p2_idx, outcomes, min_win_pct)
+    return {
+        uid: {
+            'w': int(tb['w'][i]),
+            'l': int(tb['l'][i]),
+            't': int(tb['t'][i]),
+            'omw': round(float(tb['omw'][i]), 2),
+            'oomw': round(float(tb['oomw'][i]), 2),
+            'omw_aggregate': round(float(tb['omw_aggregate'][i]), 2),
+            'h2h': int(tb['h2h'][i]),
+        }
+        for i, uid in enumerate(uids)
+    }
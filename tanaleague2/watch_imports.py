@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+watch_imports.py - Import automatico dei tornei da una cartella condivisa
+=========================================================================
+
+Lo staff del negozio salva nella cartella l'export CSV Bandai (One Piece) o
+il file .tdf di TOM (Pokémon) a fine evento; questo demone li importa senza
+lanciare gli script a mano.
+
+- la cartella è osservata con inotify (pacchetto opzionale inotify_simple),
+  altrimenti con un polling ogni WATCH_POLL_SECONDS
+- un file è pronto solo quando dimensione e mtime restano fermi per
+  WATCH_DEBOUNCE_SECONDS: le copie ancora in corso (share di rete, sync)
+  non vengono lette a metà
+- formato dall'estensione; stagione da un token del nome file che sia un id
+  stagione noto (OP12_2025_11_12.csv, 2025_06_12_OP11.csv), altrimenti da
+  WATCH_SEASONS per estensione; data con parse_csv_date_universal(strict)
+- i file pronti nello stesso giro diventano UN job: un solo writer (coda di
+  jobs.py) li importa in ordine di data, poi aggiorna una volta cache
+  classifica e stats degli scope toccati. Il sito legge gli stessi file di
+  cache (cache_data.json, stats_cache/) e li ricarica appena cambiano.
+- a import finito il file va in done/ (o failed/) con accanto il log; un
+  file identico a quello già importato per lo stesso torneo (registro
+  import_ledger.py) va subito in done/ senza accodare nulla
+- scrive sullo spreadsheet di config.py (SHEET_ID / CREDENTIALS_FILE) come
+  la webapp e l'upload admin: senza config.py il demone non parte
+
+Uso:
+    python watch_imports.py /percorso/cartella
+    python watch_imports.py --once                 # importa quello che c'è ed esce
+    python watch_imports.py --overwrite            # un torneo già importato viene sostituito
+"""
+
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+
+from admin_import import FORMATS, prepare_upload, refresh_caches, run_import
+from jobs import DONE, ERROR, JobQueue
+
+try:
+    import config as _config
+except Exception:
+    _config = None
+
+try:
+    from inotify_simple import INotify, flags as _flags
+except ImportError:  # opzionale: senza si usa il polling
+    INotify = None
+
+WATCH_DIR = getattr(_config, "WATCH_DIR", "tornei_da_importare")
+WATCH_SEASONS = getattr(_config, "WATCH_SEASONS", {})    # {'.csv': 'OP12', '.tdf': 'PKM-FS25'}
+DEBOUNCE = getattr(_config, "WATCH_DEBOUNCE_SECONDS", 5)
+POLL = getattr(_config, "WATCH_POLL_SECONDS", 10)
+
+DONE_DIR, FAILED_DIR = "done", "failed"
+IGNORED_SUFFIXES = ('.part', '.tmp', '.crdownload', '~')
+
+
+# ============================================
+# RICONOSCIMENTO FILE
+# ============================================
+
+def _known_seasons():
+    """Id stagione dall'ultima cache classifica su disco (nessuna lettura dal foglio)."""
+    from cache import cache
+    cache._ensure_loaded()
+    return {str(s.get('id') or '').upper() for s in (cache.cache_data or {}).get('seasons', [])}
+
+
+def detect_season(filename, known=None):
+    """
+    Stagione di un file: token del nome che è un id stagione noto, altrimenti
+    WATCH_SEASONS[estensione]. None se non riconoscibile.
+    """
+    known = _known_seasons() if known is None else known
+    stem, suffix = os.path.splitext(filename)
+    for token in re.split(r'[_\s.\[\]]+', stem.upper()):
+        if token in known:
+            return token
+    season = WATCH_SEASONS.get(suffix.lower())
+    return season.upper() if season else None
+
+
+def _candidate(path):
+    name = path.name
+    return (path.is_file() and not name.startswith('.')
+            and not name.endswith(IGNORED_SUFFIXES)
+            and path.suffix.lower() in FORMATS)
+
+
+def _sort_key(plan):
+    return (plan['summary']['date'] or '', plan['tid'])
+
+
+# ============================================
+# DEBOUNCE
+# ============================================
+
+class Debouncer:
+    """File della cartella fermi (stessa dimensione/mtime) da almeno `quiet` secondi."""
+
+    def __init__(self, quiet=DEBOUNCE):
+        self.quiet = quiet
+        self.seen = {}   # path -> ((size, mtime), istante dell'ultima modifica vista)
+
+    def scan(self, folder, now=None, exclude=()):
+        now = time.monotonic() if now is None else now
+        current = {}
+        for path in folder.iterdir():
+            if path in exclude or not _candidate(path):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue   # spostato/cancellato durante la scansione
+            sig = (st.st_size, st.st_mtime_ns)
+            old = self.seen.get(path)
+            current[path] = old if old and old[0] == sig else (sig, now)
+        self.seen = current
+        return sorted(p for p, (sig, since) in current.items() if now - since >= self.quiet)
+
+    def forget(self, paths):
+        for path in paths:
+            self.seen.pop(path, None)
+
+    @property
+    def pending(self):
+        return bool(self.seen)
+
+
+# ============================================
+# WRITER
+# ============================================
+
+def _archive(src, subdir, log_lines):
+    dest_dir = src.parent / subdir
+    dest_dir.mkdir(exist_ok=True)
+    dest = dest_dir / src.name
+    if dest.exists():
+        dest = dest_dir / f"{src.stem}_{time.strftime('%Y%m%d_%H%M%S')}{src.suffix}"
+    shutil.move(str(src), dest)
+    dest.with_name(dest.name + ".log").write_text("\n".join(log_lines) + "\n", encoding="utf-8")
+    return dest
+
+
+def _job_batch(job, items, overwrite):
+    """Importa i piani in ordine di data e aggiorna le cache una volta sola a fine giro."""
+    imported, failed = [], []
+    for i, (src, plan) in enumerate(items):
+        job.set_progress(i, len(items) + 1, plan['tid'])
+        start = len(job.log)
+        try:
+            run_import(job, plan, overwrite)
+        except Exception as e:
+            job.log.append(f"❌ {e}")
+            failed.append(plan['tid'])
+            _archive(src, FAILED_DIR, job.log[start:])
+        else:
+            imported.append(plan['tid'])
+            _archive(src, DONE_DIR, job.log[start:])
+    result = {'imported': imported, 'failed': failed, 'refresh': None}
+    if imported:
+        job.set_progress(len(items), len(items) + 1, "refresh")
+        result['refresh'] = refresh_caches(job)
+    job.set_progress(len(items) + 1, len(items) + 1, "done")
+    return result
+
+
+class ImportWatcher:
+    def __init__(self, folder, overwrite=False, queue=None):
+        self.folder = Path(folder)
+        self.overwrite = overwrite
+        self.queue = queue or JobQueue()
+        self.debouncer = Debouncer()
+        self.active = []       # job del writer non ancora conclusi
+        self.inflight = set()  # file accodati, ancora nella cartella finché il writer non li sposta
+
+    def _prepare(self, paths):
+        """Piani dei file pronti; quelli non importabili vanno subito in failed/."""
+        known = _known_seasons()
+        items = []
+        for src in paths:
+            try:
+                season = detect_season(src.name, known)
+                if season is None:
+                    raise ValueError(f"Stagione non riconosciuta da '{src.name}' "
+                                     f"(aggiungi l'id al nome o WATCH_SEASONS in config.py)")
+                plan = prepare_upload(src.name, src.read_bytes(), season, self.overwrite)
+            except Exception as e:
+                print(f"❌ {src.name}: {e}")
+                _archive(src, FAILED_DIR, [f"❌ {e}"])
+                continue
+            if plan['unchanged']:
+                print(f"✅ {src.name} → {plan['tid']}: identico al già importato, nulla da fare")
+                _archive(src, DONE_DIR, [f"✅ {plan['message']}"])
+                continue
+            print(f"📥 {src.name} → {plan['tid']} ({plan['summary']['participants']} giocatori)")
+            items.append((src, plan))
+        return sorted(items, key=lambda item: _sort_key(item[1]))
+
+    def tick(self):
+        """Un giro: scansione, accodamento dei file pronti, report dei job finiti."""
+        ready = self.debouncer.scan(self.folder, exclude=self.inflight)
+        if ready:
+            self.debouncer.forget(ready)
+            items = self._prepare(ready)
+            if items:
+                key = ",".join(plan['tid'] for _, plan in items)
+                self.inflight.update(src for src, _ in items)
+                self.active.append(self.queue.submit('watch-import', key, _job_batch,
+                                                     items, self.overwrite))
+        for job in [j for j in self.active if j.status in (DONE, ERROR)]:
+            self.active.remove(job)
+            self.inflight.difference_update(src for src, _ in job.args[0])
+            self._report(job)
+        return bool(ready)
+
+    def _report(self, job):
+        for line in job.log:
+            print(f"   {line}")
+        if job.status == ERROR:
+            print(f"❌ Job {job.id}: {job.error}")
+            return
+        r = job.result
+        print(f"✅ Importati: {', '.join(r['imported']) or '-'}"
+              + (f" | falliti: {', '.join(r['failed'])}" if r['failed'] else ""))
+        if r['refresh']:
+            print(f"   Cache aggiornate, stats ricostruite: {', '.join(r['refresh']['invalidated']) or '-'}")
+
+    @property
+    def busy(self):
+        return self.debouncer.pending or bool(self.active)
+
+    def run(self, once=False):
+        self.folder.mkdir(parents=True, exist_ok=True)
+        notify = None
+        if INotify is not None and not once:
+            notify = INotify()
+            notify.add_watch(str(self.folder), _flags.CLOSE_WRITE | _flags.MOVED_TO | _flags.CREATE
+                             | _flags.MODIFY)
+        print(f"👀 Cartella {self.folder} ({'inotify' if notify else f'polling {POLL}s'}, "
+              f"debounce {self.debouncer.quiet}s)")
+        try:
+            while True:
+                self.tick()
+                if once and not self.busy:
+                    return
+                # con file in debounce o job attivi si ricontrolla presto
+                wait = min(1.0, self.debouncer.quiet) if self.busy else POLL
+                if notify is not None:
+                    notify.read(timeout=int(wait * 1000))   # un evento sveglia subito
+                else:
+                    time.sleep(wait)
+        finally:
+            if notify is not None:
+                notify.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import automatico tornei da cartella (TanaLeague)")
+    parser.add_argument("folder", nargs="?", default=WATCH_DIR, help=f"Cartella osservata (default: {WATCH_DIR})")
+    parser.add_argument("--once", action="store_true", help="Importa i file presenti ed esce")
+    parser.add_argument("--overwrite", action="store_true", help="Sostituisce i tornei già importati")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE,
+                        help=f"Secondi senza modifiche prima di leggere un file (default: {DEBOUNCE})")
+    args = parser.parse_args()
+
+    if _config is None:
+        parser.error("config.py mancante: serve SHEET_ID / CREDENTIALS_FILE dello stesso foglio della webapp")
+
+    print(f"📄 Foglio {_config.SHEET_ID}")
+    watcher = ImportWatcher(args.folder, overwrite=args.overwrite)
+    watcher.debouncer.quiet = args.debounce
+    try:
+        watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        print("\n👋 Stop")
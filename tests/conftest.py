@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Test TanaLeague: i moduli in tanaleague2/ si importano tra loro per nome
+(from scoring import ...), come quando si lanciano gli script da lì.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / "tanaleague2"
+sys.path.insert(0, str(PACKAGE_DIR))
+
+SAMPLE_TDF = PACKAGE_DIR / "novembre_2025_11_12.tdf"
+SAMPLE_CSV = PACKAGE_DIR / "templates" / "OP11_2025_07_03.csv"
+
+
+@pytest.fixture
+def sample_tdf():
+    return str(SAMPLE_TDF)
+
+
+@pytest.fixture
+def sample_csv():
+    return str(SAMPLE_CSV)
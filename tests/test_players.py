@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""players.py: delta del foglio Players e ricostruzione completa da Results."""
+
+import import_tournament
+from fake_sheet import blank_workbook
+from players import plan_players_rebuild, plan_players_upsert, rebuild_players
+from schema import HEADER_ROWS
+
+HEADER = [['PLAYERS'], [], ['Membership', 'Name']]
+RESULTS_HEADER = [['RESULTS'], [], ['Result_ID', 'Tournament_ID']]
+TID = 'OP12_2025-07-03'
+
+
+def _legacy_row(membership, rank, win_points, points):
+    """Riga Results scritta prima di Match_W: colonne A..J soltanto."""
+    return [f"{TID}_{membership}", TID, membership, str(rank), str(win_points),
+            '0.5', '3', '2', str(points), f"P{membership}"]
+
+
+def _new_row(membership, rank, win_points, points, match_w):
+    return _legacy_row(membership, rank, win_points, points) + [match_w, 0, 4 - match_w]
+
+
+def test_reimport_of_legacy_rows_does_not_double_count_match_wins():
+    legacy = [_legacy_row('0000000001', 1, 12, 17), _legacy_row('0000000002', 2, 9, 13)]
+    players = HEADER + [['0000000001', 'P1', '2025-07-03', '2025-07-03', '1', '1', '4', '17'],
+                        ['0000000002', 'P2', '2025-07-03', '2025-07-03', '1', '0', '3', '13']]
+    new = [_new_row('0000000001', 1, 12, 17, 4), _new_row('0000000002', 2, 9, 13, 3)]
+
+    updates, new_rows = plan_players_upsert(players, new, '2025-07-03', previous_rows=legacy)
+
+    assert new_rows == []
+    assert [u['values'][0][2:] for u in updates] == [[1, 1, 4, 17.0], [1, 0, 3, 13.0]]
+
+
+def test_rebuild_fixes_wrong_rows_and_adds_missing_players():
+    results = RESULTS_HEADER + [_legacy_row('0000000001', 1, 12, 17),
+                                _new_row('0000000002', 2, 7, 11, 2)]
+    players = HEADER + [['0000000001', 'P1', '2025-07-03', '2025-07-03', '0', '0', '0', '0'],
+                        ['0000000009', 'Old', '2024-01-01', '2024-01-01', '2', '0', '5', '20']]
+
+    updates, new_rows = plan_players_rebuild(players, results)
+
+    assert updates == [
+        {'range': f"C{HEADER_ROWS + 1}:H{HEADER_ROWS + 1}", 'values': [['2025-07-03', '2025-07-03', 1, 1, 4, 17.0]]},
+        {'range': f"C{HEADER_ROWS + 2}:H{HEADER_ROWS + 2}", 'values': [['2024-01-01', '2024-01-01', 0, 0, 0, 0]]},
+    ]
+    assert new_rows == [['0000000002', 'P0000000002', '2025-07-03', '2025-07-03', 1, 0, 2, 11.0]]
+
+
+def test_rebuild_after_import_is_a_noop(sample_csv):
+    sheet = blank_workbook('OP11')
+    import_tournament.import_tournament_to_sheet(sheet, sample_csv, 'OP11', test_mode=True)
+
+    assert rebuild_players(sheet, write=False) == (0, 0)
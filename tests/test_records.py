@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Record compatti (records.py): stessi valori dei dict, meno memoria per riga."""
+
+import json
+
+import pytest
+from jinja2 import Template
+
+import parse_pokemon_tdf
+from aggregates import event_parts, events_of, merge_events, results_from_grid
+from records import RESULT_FIELDS, ResultRecord, StandingRecord, bench
+
+
+@pytest.fixture
+def sample_grid(sample_tdf):
+    """Griglia Results (3 righe di intestazione) con le righe del TDF di esempio."""
+    rows = parse_pokemon_tdf.parse_tdf(sample_tdf, 'PKM-FS25')['results']
+    return [['RESULTS'], [], ['Result_ID']] + [[str(v) for v in row] for row in rows]
+
+
+def test_mapping_and_attribute_access():
+    row = ('OP12_2025-01-02', 'OP12', '0000000001', 'Mario', 1, 9.0, 55.5, None, 0, 3.0, 8.0, 11.0, None)
+    rec = ResultRecord(*row)
+    as_dict = dict(zip(RESULT_FIELDS, row))
+
+    assert rec == as_dict
+    assert dict(rec) == as_dict and rec.to_dict() == as_dict
+    assert rec['name'] == rec.name == 'Mario'
+    assert rec.get('oomw', 'x') is None and rec.get('missing', 'x') == 'x'
+    assert 'tid' in rec and 'missing' not in rec
+    with pytest.raises(KeyError):
+        rec['missing']
+    with pytest.raises(AttributeError):
+        rec.extra = 1   # __slots__: niente attributi nuovi
+
+
+def test_repeated_strings_are_interned():
+    a = ResultRecord(*("OP12_2025-01-02 ".strip(), 'OP12', '0000000001', ''.join(['Ma', 'rio']),
+                       1, 0.0, 0.0, None, 0, 0.0, 0.0, 0.0, None))
+    b = ResultRecord(*("OP12_2025-01-09 ".strip(), 'OP12', '0000000001', ''.join(['Mar', 'io']),
+                       2, 0.0, 0.0, None, 0, 0.0, 0.0, 0.0, None))
+    assert a.name is b.name and a.membership is b.membership
+
+
+def test_standing_record_from_table_columns():
+    rec = StandingRecord.from_values(['membership', 'position', 'name'], ['0000000001', 1, 'Mario'])
+    assert rec.position == 1 and rec['membership'] == '0000000001' and rec.points is None
+
+
+def test_templates_read_records_like_dicts():
+    rec = ResultRecord('T', 'OP12', '0000000001', 'Mario', 1, 9.0, 55.5, None, 0, 3.0, 8.0, 11.0, None)
+    tpl = Template("{{ r.name }}|{{ r['rank'] }}|{{ r.get('omw') }}")
+    assert tpl.render(r=rec) == tpl.render(r=rec.to_dict()) == "Mario|1|55.5"
+
+
+def test_stats_aggregate_same_with_records_and_dicts(sample_grid):
+    records, events = results_from_grid(sample_grid)
+    dicts = [r.to_dict() for r in records]
+    assert records and all(isinstance(r, ResultRecord) for r in records)
+    assert events_of(dicts) == events
+
+    def merged(rows):
+        parts = event_parts(rows, events_of(rows))
+        agg = merge_events((recs, ev) for recs, ev, _ in parts.values())
+        return json.dumps(agg.to_json(), sort_keys=True, default=str)
+
+    assert merged(records) == merged(dicts)
+
+
+def test_bench_records_use_less_memory_per_row(capsys):
+    out = bench(3000)
+    assert out['ResultRecord'] < 0.6 * out['dict']
+    assert "byte/riga" in capsys.readouterr().out
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""scoring.py: il core vettoriale condiviso dagli import contro il calcolo originale."""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import import_tournament
+import scoring
+from scoring import VOUCHER_DEFAULTS, rounds_for, score_results
+
+
+def _assert_same(scored, expected):
+    for i, exp in enumerate(expected):
+        for key, value in exp.items():
+            got = scored[key].iloc[i]
+            if isinstance(value, str):
+                assert got == value, (i, key)
+            else:
+                assert math.isclose(got, value, abs_tol=1e-9), (i, key, got, value)
+
+
+def test_rounds_for_matches_if_chain():
+    n = np.arange(1, 300)
+    assert rounds_for(n).tolist() == [scoring._rounds_chain(int(x)) for x in n]
+    assert rounds_for(8) == 3 and rounds_for(9) == 4 and rounds_for(129) == 8
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_score_results_matches_loop_on_random_events(seed):
+    rng = np.random.default_rng(seed)
+    config = {'entry_fee': float(rng.choice([4.0, 5.0, 6.0])), 'pack_cost': 6.0,
+              'x0_ratio': float(rng.choice([1.5, 1.9, 2.0])), 'x1_ratio': 1.0, 'rounding': 0.5}
+    event = scoring._random_event(rng, 'T')
+    n = len(event)
+
+    scored = score_results(event.drop(columns='tid'), config=config)
+    expected = scoring._score_loop(event['rank'].tolist(), event['win_points'].tolist(), rounds_for(n), config)
+    _assert_same(scored, expected)
+    assert scored['match_w'].tolist() == (event['win_points'] // 3).tolist()
+
+
+def test_batch_frame_equals_one_call_per_tournament():
+    rng = np.random.default_rng(1)
+    events = [scoring._random_event(rng, f"T{i}") for i in range(40)]
+    batch = score_results(pd.concat(events, ignore_index=True), config=VOUCHER_DEFAULTS)
+    single = pd.concat([score_results(ev.drop(columns='tid'), config=VOUCHER_DEFAULTS) for ev in events],
+                       ignore_index=True)
+    for key in ('pv', 'pr', 'pt', 'match_w', 'match_l', 'record', 'category', 'voucher'):
+        assert batch[key].tolist() == single[key].tolist(), key
+    assert len(batch.attrs['voucher_info']) == len(events)
+
+
+def test_known_ties_and_losses_and_participants():
+    # TDF: pareggi e sconfitte dai match, N dalla classifica (qui 5, righe 3)
+    frame = pd.DataFrame({'rank': [1, 2, 3], 'win_points': [10, 7, 3],
+                          'match_t': [1, 1, 0], 'match_l': [0, 1, 3]})
+    scored = score_results(frame, n_rounds=4, n_participants=5)
+    assert scored['match_w'].tolist() == [3, 2, 1]
+    assert scored['record'].tolist() == ['3-0', '2-1', '1-3']
+    assert scored['category'].tolist() == ['X-0', 'X-1', 'OTHER']
+    assert scored['pr'].tolist() == [5, 4, 3]
+    assert np.allclose(scored['pv'], [10 / 3, 7 / 3, 1.0])
+
+
+def _read_csv(path):
+    df = pd.read_csv(path)
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def test_csv_import_scoring_matches_step_helpers_and_loop(sample_csv):
+    df = _read_csv(sample_csv)
+    n_rounds = import_tournament.calculate_rounds_from_participants(len(df))
+
+    scored = import_tournament.score_tournament(df, n_rounds, VOUCHER_DEFAULTS)
+    steps = import_tournament.calculate_vouchers(
+        import_tournament.identify_record_categories(
+            import_tournament.calculate_tournament_points(df), n_rounds),
+        VOUCHER_DEFAULTS)
+    for col in ('Points_Victory', 'Points_Ranking', 'Points_Total', 'Losses', 'Record', 'Category',
+                'Voucher_Amount'):
+        assert scored[col].tolist() == steps[col].tolist(), col
+    assert scored.attrs['voucher_info'] == steps.attrs['voucher_info']
+
+    expected = scoring._score_loop(df['Ranking'].tolist(), df['Win Points'].tolist(), n_rounds, VOUCHER_DEFAULTS)
+    for row, exp in zip(scored.to_dict('records'), expected):
+        assert row['Record'] == exp['record'] and row['Category'] == exp['category']
+        assert math.isclose(row['Points_Total'], exp['pt']) and math.isclose(row['Voucher_Amount'], exp['voucher'])
+
+
+def test_tdf_import_points_follow_shared_formula(sample_tdf):
+    import parse_pokemon_tdf
+
+    data = parse_pokemon_tdf.parse_tdf(sample_tdf, 'PKM-FS25')
+    n = data['tournament'][3]
+    for row in data['results']:
+        rank, win_points = row[3], row[4]
+        assert row[6] == round(win_points / 3, 2)
+        assert row[7] == n - (rank - 1)
+        assert row[8] == round(win_points / 3 + n - (rank - 1), 2)
+        assert win_points == row[10] * 3 + row[11]   # Match_W * 3 + Match_T
+
+
+def test_verify_passes(capsys):
+    assert scoring.verify(n_events=50, seed=3)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Record e tiebreaker vettoriali (tiebreakers.py) contro i loop per giocatore."""
+
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+import parse_pokemon_tdf
+from tiebreakers import MIN_WIN_PCT, P1_WIN, P2_WIN, TIE, compute_tiebreakers
+
+
+def _tiebreakers_loop(n, matches, min_win_pct=MIN_WIN_PCT):
+    """Regole Pokemon scritte per giocatore: win% col minimo, OMW, OOMW, H2H."""
+    w, l, t = [0] * n, [0] * n, [0] * n
+    opponents = [[] for _ in range(n)]
+    for p1, p2, outcome in matches:
+        opponents[p1].append(p2)
+        opponents[p2].append(p1)
+        if outcome == P1_WIN:
+            w[p1] += 1
+            l[p2] += 1
+        elif outcome == P2_WIN:
+            w[p2] += 1
+            l[p1] += 1
+        else:
+            t[p1] += 1
+            t[p2] += 1
+
+    def win_pct(i):
+        played = w[i] + l[i] + t[i]
+        return max(w[i] / played if played else min_win_pct, min_win_pct)
+
+    omw = [sum(win_pct(o) for o in opps) / len(opps) if opps else 0.0 for opps in opponents]
+    oomw = [sum(omw[o] for o in opps) / len(opps) if opps else 0.0 for opps in opponents]
+    points = [w[i] * 3 + t[i] for i in range(n)]
+    h2h = [0] * n
+    for p1, p2, outcome in matches:
+        if points[p1] != points[p2] or outcome == TIE:
+            continue
+        winner, loser = (p1, p2) if outcome == P1_WIN else (p2, p1)
+        h2h[winner] += 1
+        h2h[loser] -= 1
+    return {'w': w, 'l': l, 't': t, 'omw': [x * 100 for x in omw], 'oomw': [x * 100 for x in oomw],
+            'h2h': h2h}
+
+
+def _omw_pct_loop(root, players):
+    """Calcolo OMW% aggregato originale dell'importer TDF (loop per giocatore)."""
+    records = {uid: {'w': 0, 'l': 0, 't': 0, 'opponents': []} for uid in players.keys()}
+    for match in root.findall('.//rounds/round/matches/match'):
+        outcome = match.get('outcome')
+        if outcome == '5':
+            continue
+        p1_elem = match.find('player1')
+        p2_elem = match.find('player2')
+        if p1_elem is None or p2_elem is None:
+            continue
+        p1 = p1_elem.get('userid')
+        p2 = p2_elem.get('userid')
+        records[p1]['opponents'].append(p2)
+        records[p2]['opponents'].append(p1)
+        if outcome == '1':
+            records[p1]['w'] += 1
+            records[p2]['l'] += 1
+        elif outcome == '2':
+            records[p2]['w'] += 1
+            records[p1]['l'] += 1
+        elif outcome == '3':
+            records[p1]['t'] += 1
+            records[p2]['t'] += 1
+
+    omw_pct = {}
+    for uid in players.keys():
+        opps = records[uid]['opponents']
+        if not opps:
+            omw_pct[uid] = 0.0
+            continue
+        opp_wins = sum(records[opp]['w'] for opp in opps)
+        opp_total = sum(records[opp]['w'] + records[opp]['l'] + records[opp]['t'] for opp in opps)
+        omw_pct[uid] = (opp_wins / opp_total * 100) if opp_total > 0 else 0.0
+    return records, omw_pct
+
+
+def _random_matches(rng, n, n_rounds):
+    matches = []
+    for _ in range(n_rounds):
+        order = rng.permutation(n)
+        for a, b in zip(order[0::2], order[1::2]):
+            matches.append((int(a), int(b), int(rng.choice([P1_WIN, P2_WIN, TIE], p=[0.45, 0.45, 0.1]))))
+    return matches
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_tiebreakers_match_loop_on_random_events(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 60))
+    matches = _random_matches(rng, n, int(rng.integers(1, 7)))
+    p1, p2, outcomes = (np.array(col) for col in zip(*matches))
+
+    got = compute_tiebreakers(n, p1, p2, outcomes)
+    expected = _tiebreakers_loop(n, matches)
+
+    for key in ('w', 'l', 't', 'h2h'):
+        assert got[key].tolist() == expected[key], key
+    for key in ('omw', 'oomw'):
+        np.testing.assert_allclose(got[key], expected[key], atol=1e-9, err_msg=key)
+
+
+def test_win_pct_floor_applies_to_winless_opponents():
+    # 0 sconfitto due volte: la sua win% conta 25%, non 0
+    got = compute_tiebreakers(3, [1, 2], [0, 0], [P1_WIN, P1_WIN])
+    assert got['win_pct'].tolist() == [25.0, 100.0, 100.0]
+    assert got['omw'][1] == pytest.approx(25.0)
+
+
+def test_players_without_matches_have_zero_tiebreakers():
+    got = compute_tiebreakers(3, [0], [1], [TIE])
+    assert got['omw'][2] == 0.0 and got['oomw'][2] == 0.0 and got['h2h'][2] == 0
+
+
+def test_sample_tdf_results_match_original_loop(sample_tdf):
+    data = parse_pokemon_tdf.parse_tdf(sample_tdf, 'PKM-FS25')
+    root = ET.parse(sample_tdf).getroot()
+    records, omw_loop = _omw_pct_loop(root, data['players'])
+    uid_of = {uid.zfill(10): uid for uid in data['players']}
+
+    assert data['results']
+    for row in data['results']:
+        rec = records[uid_of[row[2]]]
+        assert row[4] == rec['w'] * 3 + rec['t']                 # Win_Points
+        assert row[5] == round(omw_loop[uid_of[row[2]]], 2)      # OMW% aggregato (colonna F)
+        assert row[10:13] == [rec['w'], rec['t'], rec['l']]      # Match_W / T / L
+
+
+def test_sample_tdf_official_tiebreakers_match_loop(sample_tdf):
+    data = parse_pokemon_tdf.parse_tdf(sample_tdf, 'PKM-FS25')
+    uids = list(data['players'])
+    index = {uid: i for i, uid in enumerate(uids)}
+    matches = []
+    for match in ET.parse(sample_tdf).getroot().findall('.//rounds/round/matches/match'):
+        p1, p2 = match.find('player1'), match.find('player2')
+        if match.get('outcome') in ('1', '2', '3') and p1 is not None and p2 is not None:
+            matches.append((index[p1.get('userid')], index[p2.get('userid')], int(match.get('outcome'))))
+    expected = _tiebreakers_loop(len(uids), matches)
+
+    for row in data['results']:
+        i = index[next(uid for uid in uids if uid.zfill(10) == row[2])]
+        assert row[13] == round(expected['oomw'][i], 2)   # OOMW%
+        assert row[14] == expected['h2h'][i]              # H2H
+        assert row[15] == round(expected['omw'][i], 2)    # OMW_Official%
+